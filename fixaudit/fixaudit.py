@@ -1,11 +1,18 @@
 #!/usr/bin/env python3
 
 import argparse
+import concurrent.futures
+import contextlib
+import io
+import json
 import os
 import sys
+import time
 sys.path.append("..")
 from fixorchestra.orchestration import *
 from fixrepository.repository import *
+from fixorchestra import snapshot
+from fixorchestra import profiling
 
 def compare_repository_with_orchestration(repository, orchestration):
 
@@ -93,8 +100,12 @@ def compare_repository_with_orchestration(repository, orchestration):
         for error in message_errors:
             print(error)
 
-    if len(field_errors) > 0 or len(message_errors) > 0:
-        sys.exit(-1)
+    return { 'groups' : group_errors, 'fields' : field_errors, 'messages' : message_errors }
+
+
+def comparison_failed(errors):
+    # Group discrepancies are reported but only field and message discrepancies fail.
+    return len(errors['fields']) > 0 or len(errors['messages']) > 0
 
 
 def validate_repository(repository):
@@ -115,6 +126,7 @@ def validate_repository(repository):
     else:
         for error in data_type_errors:
             print(error)
+    return { 'data_types' : data_type_errors }
 
 
 def visit_orchestration_references(orchestration, references, context, field_errors, group_errors, component_errors):
@@ -190,6 +202,156 @@ def validate_orchestration(orchestration):
         for error in component_errors:
             print(error)
 
+    return { 'data_types' : data_type_errors, 'fields' : field_errors, 'groups' : group_errors, 'components' : component_errors }
+
+
+#
+# A manifest is a JSON list of audits, each with an orchestration, a repository, or both
+# e.g. [ { "orchestration" : "FixRepository44.xml", "repository" : "FIX.4.4/Base" } ] with
+# relative paths resolved against the directory containing the manifest. The audits that
+# share a repository are run by the same worker so each repository is loaded and validated
+# once. Each worker also keeps the orchestrations it has loaded and every orchestration is
+# only validated by the first worker that runs it.
+#
+
+def read_manifest(filename):
+    with open(filename) as file:
+        entries = json.load(file)
+    directory = os.path.dirname(os.path.abspath(filename))
+    audits = []
+    for entry in entries:
+        orchestration = entry.get('orchestration')
+        repository = entry.get('repository')
+        if not orchestration and not repository:
+            raise Exception("manifest entry {} has neither an orchestration nor a repository".format(entry))
+        audits.append((
+            os.path.join(directory, orchestration) if orchestration else None,
+            os.path.join(directory, repository) if repository else None
+        ))
+    return audits
+
+
+def plan_batch(audits):
+    # Returns tasks of (repository, [(index, orchestration, validate_orchestration)]) with one
+    # task per repository and one per orchestration audited alone. index is the position of
+    # the audit in the manifest and an orchestration of None audits the repository alone.
+    tasks = []
+    by_repository = {}
+    validated = set()
+    for index, (orchestration, repository) in enumerate(audits):
+        if repository is None:
+            task = (None, [])
+            tasks.append(task)
+        else:
+            try:
+                task = by_repository[repository]
+            except KeyError:
+                task = (repository, [])
+                by_repository[repository] = task
+                tasks.append(task)
+        task[1].append((index, orchestration, orchestration is not None and orchestration not in validated))
+        validated.add(orchestration)
+    return tasks
+
+
+# The orchestrations loaded by this worker process, filename -> Orchestration. Worker
+# processes only live as long as the pool of one run_batch() and the process that runs
+# batches never adds to this, it passes run_batch_task() a cache of its own, so it is
+# always empty when a pool starts.
+worker_orchestrations = {}
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def load_worker_orchestration(filename, cache_directory, loaded):
+    # Returns (Orchestration, seconds) where seconds is None if it was already loaded.
+    try:
+        return loaded[filename], None
+    except KeyError:
+        orchestration, seconds = timed(Orchestration, filename, 'tree', cache_directory)
+        loaded[filename] = orchestration
+        return orchestration, seconds
+
+
+def run_batch_task(arguments, loaded = None):
+    # Run one task from plan_batch() and return its results for the summary. The checks
+    # print as they do for a single audit, that output is discarded. Validation errors are
+    # reported but as with a single audit only a comparison, or a failure to load, fails.
+    # loaded is the orchestration cache of this run_batch(), in a worker process it is the
+    # process's own.
+    (repository_filename, orchestrations), cache_directory = arguments
+    if loaded is None:
+        loaded = worker_orchestrations
+    results = { 'repositories' : {}, 'orchestrations' : {}, 'audits' : [] }
+    with contextlib.redirect_stdout(io.StringIO()):
+        repository = None
+        if repository_filename is not None:
+            try:
+                repository, seconds = timed(Repository, repository_filename, cache_directory)
+                result = { 'load_seconds' : seconds }
+                result['errors'], result['validate_seconds'] = timed(validate_repository, repository)
+            except Exception as ex:
+                result = { 'error' : str(ex) }
+            results['repositories'][repository_filename] = result
+        for index, orchestration_filename, check_orchestration in orchestrations:
+            audit = { 'orchestration' : orchestration_filename, 'repository' : repository_filename, 'passed' : False }
+            results['audits'].append((index, audit))
+            # The orchestration is still validated when the repository failed to load, plan_batch()
+            # gives each orchestration's validation to one audit only.
+            repository_failed = repository_filename is not None and repository is None
+            if orchestration_filename is None:
+                audit['passed'] = not repository_failed
+                continue
+            if repository_failed and not check_orchestration:
+                continue
+            try:
+                orchestration, seconds = load_worker_orchestration(orchestration_filename, cache_directory, loaded)
+            except Exception as ex:
+                audit['error'] = str(ex)
+                if check_orchestration:
+                    results['orchestrations'][orchestration_filename] = { 'error' : str(ex) }
+                continue
+            if check_orchestration:
+                result = {} if seconds is None else { 'load_seconds' : seconds }
+                result['errors'], result['validate_seconds'] = timed(validate_orchestration, orchestration)
+                results['orchestrations'][orchestration_filename] = result
+            if repository_failed:
+                continue
+            if repository is None:
+                audit['passed'] = True
+                continue
+            try:
+                audit['errors'], audit['compare_seconds'] = timed(compare_repository_with_orchestration, repository, orchestration)
+                audit['passed'] = not comparison_failed(audit['errors'])
+            except Exception as ex:
+                audit['error'] = str(ex)
+    return results
+
+
+def run_batch(audits, jobs = 1, cache_directory = None):
+    # Returns the summary of every audit, suitable for writing as JSON.
+    start = time.perf_counter()
+    summary = { 'repositories' : {}, 'orchestrations' : {}, 'audits' : [] }
+    tasks = [(task, cache_directory) for task in plan_batch(audits)]
+    if jobs > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(run_batch_task, tasks))
+    else:
+        loaded = {}
+        results = [run_batch_task(task, loaded) for task in tasks]
+    for result in results:
+        summary['repositories'].update(result['repositories'])
+        summary['orchestrations'].update(result['orchestrations'])
+        summary['audits'].extend(result['audits'])
+    summary['audits'] = [audit for index, audit in sorted(summary['audits'], key=lambda item: item[0])]
+    summary['passed'] = all(audit['passed'] for audit in summary['audits'])
+    summary['elapsed_seconds'] = time.perf_counter() - start
+    return summary
+
 
 def main():
 
@@ -197,21 +359,63 @@ def main():
 
     parser.add_argument('--orchestration', metavar='file', help='The orchestration to load')
     parser.add_argument('--repository', metavar='directory', help='A directory containing a repository to load e.g. fix_repository_2010_edition_20200402/FIX.4.4/Base')
+    parser.add_argument('--cache-directory', default=snapshot.default_cache_directory(), metavar='directory', help='Where snapshots of loaded orchestrations and repositories are kept (default $FIXORCHESTRA_CACHE or ~/.cache/fixorchestra)')
+    parser.add_argument('--no-cache', default=False, action='store_true', help='Always parse the XML and do not read or write snapshots')
+    parser.add_argument('--jobs', default=1, type=int, metavar='N', help='Parse the repository files, or with --manifest run the audits, in N worker processes')
+    parser.add_argument('--manifest', metavar='file', help='Run every audit listed in a JSON manifest instead of a single --orchestration and/or --repository')
+    parser.add_argument('--summary', metavar='file', help='Write the JSON summary of a --manifest run to this file rather than stdout')
+    parser.add_argument('--profile', default=False, action='store_true', help='Display the time and memory taken by each phase of loading and auditing, and the number and size of the objects loaded, on stderr (use --no-cache to profile parsing the XML, tracing memory makes everything 2-3x slower)')
 
     args = parser.parse_args()
 
-    if args.orchestration and args.repository:
-        orchestration = Orchestration(args.orchestration)
-        validate_orchestration(orchestration)
-        repository = Repository(args.repository)
-        validate_repository(repository)
-        compare_repository_with_orchestration(repository, orchestration)
-    elif args.repository:
-        repository = Repository(args.repository)
-        validate_repository(repository)
-    elif args.orchestration:
-        orchestration = Orchestration(args.orchestration)
-        validate_orchestration(orchestration)
+    cache_directory = None if args.no_cache else args.cache_directory
+
+    if args.manifest:
+        if args.profile:
+            parser.error('--profile is not supported with --manifest, its summary records the load, validate, and compare time of each audit')
+        summary = run_batch(read_manifest(args.manifest), args.jobs, cache_directory)
+        if args.summary:
+            with open(args.summary, 'w') as file:
+                json.dump(summary, file, indent=4)
+            for audit in summary['audits']:
+                print('{} {} {}'.format('PASSED' if audit['passed'] else 'FAILED', audit['orchestration'], audit['repository']))
+        else:
+            print(json.dumps(summary, indent=4))
+        if not summary['passed']:
+            sys.exit(-1)
+        return
+
+    profile = profiling.Profile() if args.profile else None
+    objects = {}    # 'orchestration|repository <entity type>' -> [object] for the profile
+
+    orchestration = None
+    if args.orchestration:
+        with profiling.phase(profile, 'load orchestration'):
+            orchestration = Orchestration(args.orchestration, cache_directory=cache_directory, profile=profile)
+        with profiling.phase(profile, 'validate_orchestration'):
+            validate_orchestration(orchestration)
+        if profile:
+            objects.update(('orchestration ' + kind, values) for kind, values in profiling.orchestration_objects(orchestration).items())
+
+    repository = None
+    if args.repository:
+        with profiling.phase(profile, 'load repository'):
+            repository = Repository(args.repository, cache_directory, args.jobs, profile)
+        with profiling.phase(profile, 'validate_repository'):
+            validate_repository(repository)
+        if profile:
+            objects.update(('repository ' + kind, values) for kind, values in profiling.repository_objects(repository).items())
+
+    failed = False
+    if orchestration is not None and repository is not None:
+        with profiling.phase(profile, 'compare_repository_with_orchestration'):
+            failed = comparison_failed(compare_repository_with_orchestration(repository, orchestration))
+
+    if profile:
+        profile.report(objects)
+
+    if failed:
+        sys.exit(-1)
 
 if __name__ == '__main__':
     main()
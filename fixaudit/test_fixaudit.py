@@ -0,0 +1,64 @@
+import json
+import pytest
+from fixorchestra.test_orchestration import ORCHESTRATION
+from fixrepository.test_repository import REPOSITORY
+from fixaudit.fixaudit import *
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    (tmp_path / 'orchestration.xml').write_text(ORCHESTRATION)
+    (tmp_path / 'repository').mkdir()
+    for filename, content in REPOSITORY.items():
+        (tmp_path / 'repository' / filename).write_text(content)
+    path = tmp_path / 'manifest.json'
+    path.write_text(json.dumps([
+        { 'orchestration' : 'orchestration.xml', 'repository' : 'repository' },
+        { 'orchestration' : 'orchestration.xml' },
+        { 'repository' : 'repository' },
+        { 'orchestration' : 'missing.xml' }
+    ]))
+    return str(path)
+
+
+def test_plan_batch(manifest):
+    audits = read_manifest(manifest)
+    tasks = plan_batch(audits)
+    assert [(repository, [(index, orchestration, validate) for index, orchestration, validate in entries]) for repository, entries in tasks] == [
+        (audits[0][1], [(0, audits[0][0], True), (2, None, False)]),
+        (None, [(1, audits[0][0], False)]),
+        (None, [(3, audits[3][0], True)]),
+    ]
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_run_batch(manifest, jobs, capsys):
+    summary = run_batch(read_manifest(manifest), jobs)
+    assert capsys.readouterr().out == ''
+    assert [(os.path.basename(audit['orchestration'] or ''), audit['passed']) for audit in summary['audits']] == \
+        [('orchestration.xml', False), ('orchestration.xml', True), ('', True), ('missing.xml', False)]
+    assert summary['audits'][0]['errors']['messages'][0] == 'message MsgType = D has 7 fields in the repository and 8 fields in the orchestration'
+    assert 'error' in summary['audits'][3]
+    assert len(summary['orchestrations']) == 2 and len(summary['repositories']) == 1
+    assert not summary['passed']
+    json.dumps(summary)
+
+
+def test_run_batch_reloads_changed_files(manifest, tmp_path):
+    audits = read_manifest(manifest)[1:2]
+    summary = run_batch(audits)
+    assert 'load_seconds' in summary['orchestrations'][audits[0][0]]
+    assert summary['orchestrations'][audits[0][0]]['errors']['data_types'] == []
+    (tmp_path / 'orchestration.xml').write_text(ORCHESTRATION.replace('<fixr:field id="54" name="Side" type="SideCodeSet"', '<fixr:field id="54" name="Side" type="NoSuchCodeSet"'))
+    summary = run_batch(audits)
+    assert 'load_seconds' in summary['orchestrations'][audits[0][0]]
+    assert summary['orchestrations'][audits[0][0]]['errors']['data_types'] == ['field id=54 has type=NoSuchCodeSet but there is no such data type or code set defined']
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_run_batch_validates_when_repository_fails(manifest, tmp_path, jobs):
+    orchestration, repository = read_manifest(manifest)[0]
+    summary = run_batch([(orchestration, str(tmp_path / 'missing')), (orchestration, repository)], jobs)
+    assert [audit['passed'] for audit in summary['audits']] == [False, False]
+    assert 'error' in summary['repositories'][str(tmp_path / 'missing')]
+    assert summary['orchestrations'][orchestration]['errors']['data_types'] == []
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+sys.path.append("..")
+from fixorchestra.orchestration import Orchestration
+from fixrepository.repository import Repository
+from fixreptorc.fixreptorc import convert
+from fixaudit.fixaudit import validate_repository, validate_orchestration, compare_repository_with_orchestration
+from fixbenchmark import synthetic
+
+#
+# Time the library on a synthetic orchestration and repository of a given scale, see
+# synthetic.py, and compare the results with a saved baseline. Each benchmark is run
+# repeat times and the fastest run is what is compared as it is the least disturbed by
+# whatever else the machine is doing.
+#
+# A benchmark is a setup function that is passed the Context and returns the function to
+# time. Setup runs before every repetition so it can discard whatever the previous one
+# cached e.g. flattened message layouts.
+#
+
+format_version = 1
+
+
+class Context:
+    # The generated files and the models loaded from them, loaded before anything is timed.
+
+    def __init__(self, orchestration_filename, repository_directory):
+        self.orchestration_filename = orchestration_filename
+        self.repository_directory = repository_directory
+        self.orchestration = Orchestration(orchestration_filename)
+        self.repository = Repository(repository_directory)
+
+
+def load_orchestration(loader):
+    def setup(context):
+        def run():
+            orchestration = Orchestration(context.orchestration_filename, loader)
+            orchestration.require_sections(*orchestration.sections)
+        return run
+    return setup
+
+
+def load_repository(context):
+    return lambda: Repository(context.repository_directory)
+
+
+def orchestration_message_fields(context):
+    orchestration = context.orchestration
+    orchestration.invalidate_caches()
+    def run():
+        for message in orchestration.messages.values():
+            orchestration.message_fields(message)
+    return run
+
+
+def repository_message_fields(context):
+    repository = context.repository
+    repository.invalidate_caches()
+    def run():
+        for message in repository.messages:
+            repository.message_fields(message)
+    return run
+
+
+def to_xml(context):
+    return context.orchestration.to_xml
+
+
+def write_xml(context):
+    return lambda: context.orchestration.write_xml(io.StringIO())
+
+
+def fixreptorc_convert(context):
+    return lambda: convert(context.repository)
+
+
+def quietly(function, *args):
+    # The fixaudit checks print as they go, that isn't what is being measured.
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            function(*args)
+    return run
+
+
+def audit_validate_repository(context):
+    return quietly(validate_repository, context.repository)
+
+
+def audit_validate_orchestration(context):
+    return quietly(validate_orchestration, context.orchestration)
+
+
+def audit_compare(context):
+    context.orchestration.invalidate_caches()
+    context.repository.invalidate_caches()
+    return quietly(compare_repository_with_orchestration, context.repository, context.orchestration)
+
+
+benchmarks = {
+    'orchestration.load.tree' : load_orchestration('tree'),
+    'orchestration.load.streaming' : load_orchestration('streaming'),
+    'orchestration.load.lazy' : load_orchestration('lazy'),
+    'orchestration.load.expat' : load_orchestration('expat'),
+    'orchestration.message_fields' : orchestration_message_fields,
+    'orchestration.to_xml' : to_xml,
+    'orchestration.write_xml' : write_xml,
+    'repository.load' : load_repository,
+    'repository.message_fields' : repository_message_fields,
+    'fixreptorc.convert' : fixreptorc_convert,
+    'fixaudit.validate_repository' : audit_validate_repository,
+    'fixaudit.validate_orchestration' : audit_validate_orchestration,
+    'fixaudit.compare' : audit_compare,
+}
+
+
+def run_benchmarks(context, names, repeat):
+    # Returns name -> { min_seconds, median_seconds, repeat } for each benchmark.
+    results = {}
+    for name in names:
+        setup = benchmarks[name]
+        times = []
+        for _ in range(repeat):
+            run = setup(context)
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+        results[name] = { 'min_seconds' : min(times), 'median_seconds' : statistics.median(times), 'repeat' : repeat }
+    return results
+
+
+def run(scale, names, repeat, directory):
+    orchestration_filename, repository_directory = synthetic.generate(scale, directory)
+    context = Context(orchestration_filename, repository_directory)
+    return {
+        'format_version' : format_version,
+        'scale' : scale.to_json(),
+        'python' : platform.python_version(),
+        'results' : run_benchmarks(context, names, repeat),
+    }
+
+
+def compare(baseline, report, threshold, minimum_seconds):
+    # Returns [(name, baseline seconds, seconds)] for each benchmark whose fastest run is more
+    # than threshold slower than the baseline and by more than minimum_seconds so timer noise
+    # in very short benchmarks isn't reported.
+    if baseline.get('format_version') != format_version:
+        raise Exception("baseline format version {} is not {}".format(baseline.get('format_version'), format_version))
+    if baseline['scale'] != report['scale']:
+        raise Exception("baseline scale {} is not the scale benchmarked {}".format(baseline['scale'], report['scale']))
+    regressions = []
+    for name, result in report['results'].items():
+        try:
+            expected = baseline['results'][name]['min_seconds']
+        except KeyError:
+            continue
+        seconds = result['min_seconds']
+        if seconds > expected * (1 + threshold) and seconds - expected > minimum_seconds:
+            regressions.append((name, expected, seconds))
+    return regressions
+
+
+def dump_report(report, baseline):
+    width = max(len(name) for name in report['results'])
+    for name, result in report['results'].items():
+        line = '{}  {:10.4f}s  (median {:.4f}s)'.format(name.ljust(width), result['min_seconds'], result['median_seconds'])
+        if baseline is not None and name in baseline['results']:
+            expected = baseline['results'][name]['min_seconds']
+            line += '  baseline {:.4f}s {:+.1f}%'.format(expected, (result['min_seconds'] - expected) * 100 / expected if expected else 0)
+        print(line)
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fields', default=2000, type=int, metavar='N', help='The number of fields in the synthetic dictionary, every fourth one is enumerated')
+    parser.add_argument('--codes', default=10, type=int, metavar='N', help='The number of codes for each enumerated field')
+    parser.add_argument('--depth', default=3, type=int, metavar='N', help='How deeply components are nested in each message')
+    parser.add_argument('--messages', default=100, type=int, metavar='N', help='The number of messages in the synthetic dictionary')
+    parser.add_argument('--seed', default=0, type=int, metavar='N', help='The seed the synthetic dictionary is generated from')
+    parser.add_argument('--repeat', default=5, type=int, metavar='N', help='The number of times each benchmark is run')
+    parser.add_argument('--benchmark', default=[], action='append', choices=list(benchmarks), metavar='name', help='Only run this benchmark, may be repeated')
+    parser.add_argument('--directory', required=False, metavar='directory', help='Write the synthetic dictionary here and keep it rather than using a temporary directory')
+    parser.add_argument('--generate-only', default=False, action='store_true', help='Write the synthetic dictionary to --directory and exit')
+    parser.add_argument('--output', required=False, metavar='file', help='Write the results as JSON, use it as a --baseline later')
+    parser.add_argument('--baseline', required=False, metavar='file', help='Compare the results with a previous --output and exit with 1 if anything is slower')
+    parser.add_argument('--threshold', default=0.25, type=float, metavar='fraction', help='How much slower than the baseline a benchmark must be to be a regression (default 0.25)')
+    parser.add_argument('--minimum', default=0.005, type=float, metavar='seconds', help='How many seconds slower than the baseline a benchmark must also be to be a regression (default 0.005)')
+
+    args = parser.parse_args()
+
+    scale = synthetic.Scale(args.fields, args.codes, args.depth, args.messages, args.seed)
+
+    if args.generate_only:
+        if not args.directory:
+            parser.error('--generate-only requires --directory')
+        for path in synthetic.generate(scale, args.directory):
+            print(path)
+        return
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    names = args.benchmark or list(benchmarks)
+    if args.directory:
+        report = run(scale, names, args.repeat, args.directory)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            report = run(scale, names, args.repeat, directory)
+
+    dump_report(report, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if baseline is not None:
+        regressions = compare(baseline, report, args.threshold, args.minimum)
+        for name, expected, seconds in regressions:
+            print('{} regressed from {:.4f}s to {:.4f}s'.format(name, expected, seconds))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+import os
+import random
+from xml.sax.saxutils import escape, quoteattr
+
+#
+# Generate an orchestration and a repository describing the same synthetic dictionary at
+# any scale so the library can be measured on dictionaries larger than any published one.
+# The two are written independently rather than one being converted from the other so
+# neither depends on the code being measured and fixaudit finds no discrepancies between
+# them.
+#
+# Every message has the standard header and trailer, a handful of its own fields, and one
+# chain of components nested depth deep with a repeating group at the bottom. The chains
+# are shared by several messages as Instrument or Parties are in the real thing. Every
+# fourth field is enumerated with codes values. The same seed always produces the same
+# dictionary.
+#
+
+version = 'FIX.4.4'
+
+# The ids of messages, components, and groups are kept apart as a repository has one namespace for all three.
+first_field = 100
+first_component = 100001
+first_group = 200001
+
+standard_header = first_component - 2
+standard_trailer = first_component - 1
+
+fields_per_message = 6
+fields_per_component = 4
+fields_per_group = 3
+messages_per_chain = 8
+
+
+class Scale:
+
+    __slots__ = ('fields', 'codes', 'depth', 'messages', 'seed')
+
+    def __init__(self, fields = 2000, codes = 10, depth = 3, messages = 100, seed = 0):
+        if fields < fields_per_message + fields_per_component + fields_per_group:
+            raise Exception("a dictionary needs at least {} fields".format(fields_per_message + fields_per_component + fields_per_group))
+        if depth < 1 or messages < 1 or codes < 1:
+            raise Exception("depth, messages, and codes must be at least 1")
+        self.fields = fields
+        self.codes = codes
+        self.depth = depth
+        self.messages = messages
+        self.seed = seed
+
+    def to_json(self):
+        return { name : getattr(self, name) for name in self.__slots__ }
+
+
+class SyntheticField:
+
+    __slots__ = ('tag', 'name', 'type', 'codes')
+
+    def __init__(self, tag, name, type, codes):
+        self.tag = tag
+        self.name = name
+        self.type = type
+        self.codes = codes      # [(value, name)] for an enumerated field
+
+
+class SyntheticComponent:
+    # contents is [(kind, id, required)] where kind is 'field', 'component', or 'group'.
+    __slots__ = ('id', 'name', 'group', 'counter', 'contents')
+
+    def __init__(self, id, name, group, counter, contents):
+        self.id = id
+        self.name = name
+        self.group = group
+        self.counter = counter  # The NumInGroup tag of a group
+        self.contents = contents
+
+
+class SyntheticMessage:
+
+    __slots__ = ('id', 'msg_type', 'name', 'contents')
+
+    def __init__(self, id, msg_type, name, contents):
+        self.id = id
+        self.msg_type = msg_type
+        self.name = name
+        self.contents = contents
+
+
+class Dictionary:
+    # The synthetic dictionary both files are written from.
+
+    def __init__(self, scale):
+        self.scale = scale
+        random_ = random.Random(scale.seed)
+        chains = max(1, scale.messages // messages_per_chain)
+        self.messages = []
+        for index in range(scale.messages):
+            self.messages.append(SyntheticMessage(index + 1, msg_type(index), 'Message{}'.format(index + 1), []))
+        self.fields = [
+            SyntheticField(8, 'BeginString', 'String', None),
+            SyntheticField(9, 'BodyLength', 'int', None),
+            SyntheticField(10, 'CheckSum', 'String', None),
+            SyntheticField(35, 'MsgType', 'String', [(message.msg_type, message.name) for message in self.messages]),
+        ]
+        pool = []
+        for index in range(scale.fields):
+            tag = first_field + index
+            if index % 4 == 0:
+                codes = [(str(code), 'Field{}Code{}'.format(tag, code)) for code in range(scale.codes)]
+                self.fields.append(SyntheticField(tag, 'Field{}'.format(tag), 'String', codes))
+            else:
+                self.fields.append(SyntheticField(tag, 'Field{}'.format(tag), ('String', 'int', 'float')[index % 3], None))
+            pool.append(tag)
+        self.components = [
+            SyntheticComponent(standard_header, 'StandardHeader', False, None, [('field', 8, True), ('field', 9, True), ('field', 35, True)]),
+            SyntheticComponent(standard_trailer, 'StandardTrailer', False, None, [('field', 10, True)]),
+        ]
+        chain_roots = []
+        for chain in range(chains):
+            counter = first_field + scale.fields + chain
+            self.fields.append(SyntheticField(counter, 'NoGroup{}'.format(chain + 1), 'NumInGroup', None))
+            group = SyntheticComponent(first_group + chain, 'Group{}Grp'.format(chain + 1), True, counter,
+                [('field', tag, False) for tag in random_.sample(pool, fields_per_group)])
+            self.components.append(group)
+            below = ('group', group.id, False)
+            for level in reversed(range(scale.depth)):
+                contents = [('field', tag, random_.random() < 0.25) for tag in random_.sample(pool, fields_per_component)]
+                component = SyntheticComponent(first_component + chain * scale.depth + level, 'Block{}Level{}'.format(chain + 1, level + 1), False, None, contents + [below])
+                self.components.append(component)
+                below = ('component', component.id, False)
+            chain_roots.append(below[1])
+        for index, message in enumerate(self.messages):
+            message.contents.append(('component', standard_header, True))
+            message.contents.extend(('field', tag, random_.random() < 0.5) for tag in random_.sample(pool, fields_per_message))
+            message.contents.append(('component', chain_roots[index % chains], False))
+            message.contents.append(('component', standard_trailer, True))
+        self.components_by_id = { component.id : component for component in self.components }
+
+
+def msg_type(index):
+    # UA, UB, ... UZ, UAA, ... in the U range FIX leaves for user defined messages.
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return 'U' + letters
+
+
+data_types = [('int', None), ('NumInGroup', 'int'), ('String', None), ('float', None)]
+
+
+def synopsis(text):
+    return '<fixr:annotation><fixr:documentation purpose="SYNOPSIS">{}</fixr:documentation></fixr:annotation>'.format(escape(text))
+
+
+def write_orchestration(dictionary, filename):
+    added = 'added={}'.format(quoteattr(version))
+    lines = []
+    lines.append('<?xml version="1.0" encoding="UTF-8"?>')
+    lines.append('<fixr:repository xmlns:fixr="http://fixprotocol.io/2020/orchestra/repository" xmlns:dc="http://purl.org/dc/elements/1.1/" name="{0}" version="{0}">'.format(version))
+    lines.append('<fixr:metadata><dc:title>Synthetic</dc:title></fixr:metadata>')
+    lines.append('<fixr:datatypes>')
+    for name, base_type in data_types:
+        base = ' baseType="{}"'.format(base_type) if base_type else ''
+        lines.append('<fixr:datatype name="{}"{} {}/>'.format(name, base, added))
+    lines.append('</fixr:datatypes>')
+    lines.append('<fixr:codeSets>')
+    for field in dictionary.fields:
+        if field.codes is None:
+            continue
+        lines.append('<fixr:codeSet name="{}CodeSet" id="{}" type="{}">'.format(field.name, field.tag, field.type))
+        for position, (value, name) in enumerate(field.codes):
+            lines.append('<fixr:code name="{}" id="{}" value={} {}>{}</fixr:code>'.format(name, field.tag * 1000 + position, quoteattr(value), added, synopsis(name)))
+        lines.append('</fixr:codeSet>')
+    lines.append('</fixr:codeSets>')
+    lines.append('<fixr:fields>')
+    for field in dictionary.fields:
+        type = field.name + 'CodeSet' if field.codes is not None else field.type
+        lines.append('<fixr:field id="{}" name="{}" type="{}" {}>{}</fixr:field>'.format(field.tag, field.name, type, added, synopsis('Synthetic field {}'.format(field.name))))
+    lines.append('</fixr:fields>')
+
+    def references(contents):
+        for kind, id, required in contents:
+            presence = ' presence="required"' if required else ''
+            lines.append('<fixr:{}Ref id="{}"{} {}/>'.format(kind, id, presence, added))
+
+    lines.append('<fixr:components>')
+    for component in dictionary.components:
+        if not component.group:
+            lines.append('<fixr:component name="{}" id="{}" category="Common" {}>'.format(component.name, component.id, added))
+            references(component.contents)
+            lines.append('</fixr:component>')
+    lines.append('</fixr:components>')
+    lines.append('<fixr:groups>')
+    for component in dictionary.components:
+        if component.group:
+            lines.append('<fixr:group name="{}" id="{}" category="Common" {}>'.format(component.name, component.id, added))
+            lines.append('<fixr:numInGroup id="{}"/>'.format(component.counter))
+            references(component.contents)
+            lines.append('</fixr:group>')
+    lines.append('</fixr:groups>')
+    lines.append('<fixr:messages>')
+    for message in dictionary.messages:
+        lines.append('<fixr:message name="{}" id="{}" msgType="{}" category="Synthetic" {}>'.format(message.name, message.id, message.msg_type, added))
+        lines.append('<fixr:structure>')
+        references(message.contents)
+        lines.append('</fixr:structure>')
+        lines.append(synopsis('Synthetic message {}'.format(message.name)))
+        lines.append('</fixr:message>')
+    lines.append('</fixr:messages>')
+    lines.append('</fixr:repository>')
+    with open(filename, 'w') as file:
+        file.write('\n'.join(lines))
+    return filename
+
+
+def write_repository(dictionary, directory):
+    added = 'added={}'.format(quoteattr(version))
+    os.makedirs(directory, exist_ok=True)
+
+    def write(name, root, elements):
+        with open(os.path.join(directory, name), 'w') as file:
+            file.write('<?xml version="1.0" encoding="UTF-8"?>\n<{} version="{}">\n'.format(root, version))
+            file.write('\n'.join(elements))
+            file.write('\n</{}>\n'.format(root))
+
+    elements = []
+    for name, base_type in data_types:
+        base = '<BaseType>{}</BaseType>'.format(base_type) if base_type else ''
+        elements.append('<Datatype {}><Name>{}</Name>{}<Description>{}</Description></Datatype>'.format(added, name, base, name))
+    write('Datatypes.xml', 'Datatypes', elements)
+    elements = []
+    for field in dictionary.fields:
+        elements.append('<Field {}><Tag>{}</Tag><Name>{}</Name><Type>{}</Type><Description>Synthetic field {}</Description></Field>'.format(added, field.tag, field.name, field.type, field.name))
+    write('Fields.xml', 'Fields', elements)
+    elements = []
+    for field in dictionary.fields:
+        for value, name in field.codes or []:
+            elements.append('<Enum {}><Tag>{}</Tag><Value>{}</Value><SymbolicName>{}</SymbolicName><Description>{}</Description></Enum>'.format(added, field.tag, escape(value), name, name))
+    write('Enums.xml', 'Enums', elements)
+    elements = []
+    for component in dictionary.components:
+        component_type = 'BlockRepeating' if component.group else 'Block'
+        elements.append('<Component {}><ComponentID>{}</ComponentID><ComponentType>{}</ComponentType><CategoryID>Common</CategoryID><Name>{}</Name><Description>Synthetic component {}</Description></Component>'.format(
+            added, component.id, component_type, component.name, component.name))
+    write('Components.xml', 'Components', elements)
+    elements = []
+    for message in dictionary.messages:
+        elements.append('<Message {}><ComponentID>{}</ComponentID><MsgType>{}</MsgType><Name>{}</Name><CategoryID>Synthetic</CategoryID><SectionID>Synthetic</SectionID><Description>Synthetic message {}</Description></Message>'.format(
+            added, message.id, message.msg_type, message.name, message.name))
+    write('Messages.xml', 'Messages', elements)
+    elements = []
+
+    def contents(owner, entries, indent):
+        for position, (kind, id, required) in enumerate(entries):
+            tag_text = id if kind == 'field' else dictionary.components_by_id[id].name
+            elements.append('<MsgContent {}><ComponentID>{}</ComponentID><TagText>{}</TagText><Indent>{}</Indent><Position>{}</Position><Reqd>{}</Reqd></MsgContent>'.format(
+                added, owner, tag_text, indent, position + 1, 1 if required else 0))
+
+    for component in dictionary.components:
+        entries = component.contents
+        if component.group:
+            entries = [('field', component.counter, False)] + entries
+        contents(component.id, entries, 0)
+    for message in dictionary.messages:
+        contents(message.id, message.contents, 0)
+    write('MsgContents.xml', 'MsgContents', elements)
+    return directory
+
+
+def generate(scale, directory):
+    # Writes synthetic.xml and a repository in synthetic/ to directory and returns their paths.
+    dictionary = Dictionary(scale)
+    os.makedirs(directory, exist_ok=True)
+    orchestration = write_orchestration(dictionary, os.path.join(directory, 'synthetic.xml'))
+    repository = write_repository(dictionary, os.path.join(directory, 'synthetic'))
+    return orchestration, repository
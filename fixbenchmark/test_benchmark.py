@@ -0,0 +1,50 @@
+import contextlib
+import io
+import pytest
+from fixorchestra.orchestration import Orchestration
+from fixrepository.repository import Repository
+from fixaudit.fixaudit import validate_repository, validate_orchestration, compare_repository_with_orchestration
+from fixbenchmark import benchmark
+from fixbenchmark import synthetic
+
+
+def test_synthetic(tmp_path):
+    scale = synthetic.Scale(fields=40, codes=3, depth=4, messages=20)
+    orchestration_filename, repository_directory = synthetic.generate(scale, str(tmp_path))
+    orchestration = Orchestration(orchestration_filename)
+    repository = Repository(repository_directory)
+    assert len(orchestration.messages) == len(repository.messages) == 20
+    assert len(orchestration.groups) == len(repository.groups_by_id) == 2
+    assert len(orchestration.components) == 2 + 2 * 4
+    assert [code.value for code in orchestration.code_sets['Field100CodeSet'].codes] == ['0', '1', '2']
+    message = orchestration.messages_by_msg_type['UA']
+    assert max(field.depth for field in orchestration.message_fields(message)) == 1
+    assert max(field.depth for field in repository.message_fields(repository.messages_by_msg_type['UA'])) == 5
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert not any(validate_repository(repository).values())
+        assert not any(validate_orchestration(orchestration).values())
+        assert not any(compare_repository_with_orchestration(repository, orchestration).values())
+    again = tmp_path / 'again'
+    synthetic.generate(scale, str(again))
+    assert (again / 'synthetic.xml').read_text() == (tmp_path / 'synthetic.xml').read_text()
+    with pytest.raises(Exception):
+        synthetic.Scale(fields=5)
+
+
+def test_benchmark(tmp_path):
+    scale = synthetic.Scale(fields=40, codes=3, depth=2, messages=10)
+    report = benchmark.run(scale, list(benchmark.benchmarks), 1, str(tmp_path))
+    assert list(report['results']) == list(benchmark.benchmarks)
+    assert benchmark.compare(report, report, 0.25, 0) == []
+    slower = { 'format_version' : benchmark.format_version, 'scale' : report['scale'], 'results' : {
+        'fixaudit.compare' : { 'min_seconds' : 2.0, 'median_seconds' : 2.0, 'repeat' : 1 },
+        'repository.load' : { 'min_seconds' : 1.1, 'median_seconds' : 1.1, 'repeat' : 1 },
+    } }
+    baseline = { 'format_version' : benchmark.format_version, 'scale' : report['scale'], 'results' : {
+        'fixaudit.compare' : { 'min_seconds' : 1.0 },
+        'repository.load' : { 'min_seconds' : 1.0 },
+    } }
+    assert benchmark.compare(baseline, slower, 0.25, 0.005) == [('fixaudit.compare', 1.0, 2.0)]
+    baseline['scale'] = synthetic.Scale().to_json()
+    with pytest.raises(Exception):
+        benchmark.compare(baseline, slower, 0.25, 0.005)
@@ -0,0 +1,117 @@
+import importlib.util
+import keyword
+import os
+import py_compile
+
+#
+# Generate a plain Python module from an orchestration so a process that only needs the
+# dictionary can import it rather than parsing XML. Everything is written as literals so
+# importing the module is just unmarshalling its cached bytecode.
+#
+# The generated module contains:
+#
+#   version                 The orchestration version e.g. FIX.4.4
+#   fingerprint             The fingerprint of the orchestration it was generated from
+#   class Tag               A constant for each field e.g. Tag.Side = 54
+#   class MsgType           A constant for each message e.g. MsgType.NewOrderSingle = 'D'
+#   fields                  tag -> (name, type)
+#   messages                MsgType -> name
+#   values                  tag -> { value : name } for every enumerated field
+#   multiple_value_fields   The tags whose values are a space separated list
+#   layouts                 MsgType -> ((tag, presence, depth, group_path, required), ...)
+#   required                MsgType -> frozenset of tags required at the top level
+#
+
+def identifier(name):
+    # Orchestration names are normally valid identifiers, anything else can't be a constant.
+    return name.isidentifier() and not keyword.iskeyword(name)
+
+
+def generate(orchestration):
+    # Returns the source of the module as a string.
+    orchestration.require_sections('codeSets', 'fields', 'components', 'groups', 'messages')
+    lines = []
+    source = os.path.basename(orchestration.filename) if orchestration.filename else orchestration.version
+    lines.append('# Generated from {} by fixorchestra, do not edit.'.format(source))
+    lines.append('')
+    lines.append('version = {!r}'.format(orchestration.version))
+    lines.append('fingerprint = {!r}'.format(orchestration.orchestration_fingerprint()))
+    lines.append('')
+    lines.append('')
+    lines.append('class Tag:')
+    constants = [field for field in orchestration.fields_by_tag.values() if identifier(field.name)]
+    for field in constants:
+        lines.append('    {} = {!r}'.format(field.name, field.id))
+    if not constants:
+        lines.append('    pass')
+    lines.append('')
+    lines.append('')
+    lines.append('class MsgType:')
+    constants = [message for message in orchestration.messages_by_msg_type.values() if identifier(message.name)]
+    for message in constants:
+        lines.append('    {} = {!r}'.format(message.name, message.msg_type))
+    if not constants:
+        lines.append('    pass')
+    lines.append('')
+    lines.append('')
+    lines.append('fields = {')
+    for field in orchestration.fields_by_tag.values():
+        lines.append('    {!r} : ({!r}, {!r}),'.format(field.id, field.name, field.type))
+    lines.append('}')
+    lines.append('')
+    lines.append('messages = {')
+    for message in orchestration.messages_by_msg_type.values():
+        lines.append('    {!r} : {!r},'.format(message.msg_type, message.name))
+    lines.append('}')
+    lines.append('')
+    lines.append('values = {')
+    multiple = []
+    for id, table in orchestration.value_index().items():
+        lines.append('    {!r} : {{'.format(id))
+        for value, code in table.by_value.items():
+            lines.append('        {!r} : {!r},'.format(value, code.name))
+        lines.append('    },')
+        if table.multiple:
+            multiple.append(id)
+    lines.append('}')
+    lines.append('')
+    lines.append('multiple_value_fields = frozenset({!r})'.format(multiple))
+    lines.append('')
+    layouts = orchestration.layout_index()
+    lines.append('layouts = {')
+    for msg_type, layout in layouts.items():
+        lines.append('    {!r} : ('.format(msg_type))
+        for entry in layout.fields:
+            lines.append('        {!r},'.format((entry.field.id, entry.presence, entry.depth, entry.group_path, entry.required)))
+        lines.append('    ),')
+    lines.append('}')
+    lines.append('')
+    lines.append('required = {')
+    for msg_type, layout in layouts.items():
+        lines.append('    {!r} : frozenset({!r}),'.format(msg_type, sorted(layout.required)))
+    lines.append('}')
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def generated_fingerprint(filename):
+    # The fingerprint recorded in an existing generated module, None if there isn't one.
+    try:
+        with open(filename) as file:
+            for line in file:
+                if line.startswith('fingerprint = '):
+                    return line[len('fingerprint = '):].strip().strip("'")
+    except OSError:
+        pass
+    return None
+
+
+def write_module(orchestration, filename):
+    # Write the module and compile it so the first import doesn't have to. A module
+    # generated from an orchestration with the same content is left alone.
+    if generated_fingerprint(filename) == orchestration.orchestration_fingerprint() and os.path.exists(importlib.util.cache_from_source(filename)):
+        return filename
+    with open(filename, 'w') as file:
+        file.write(generate(orchestration))
+    py_compile.compile(filename, doraise=True)
+    return filename
@@ -0,0 +1,240 @@
+import os
+import sqlite3
+import sys
+sys.path.append("..")
+from fixorchestra.orchestration import *
+from fixorchestra import search
+
+#
+# Export an orchestration, or a repository converted to one, to a SQLite database and query
+# it without loading the whole model. A Database presents the same indexes as an
+# Orchestration, fields_by_tag, messages_by_msg_type etc, backed by indexed queries so
+# the dump_ and list_ functions in orchestration.py work unchanged against it.
+#
+# Pedigrees are stored once each, as they are shared in memory, and referenced by id. The
+# ids of fields, groups, components, and references are stored without a column type so
+# they come back as the int or str they were written as.
+#
+
+schema = '''
+CREATE TABLE metadata (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE pedigrees (id INTEGER PRIMARY KEY, added TEXT, added_ep TEXT, updated TEXT, updated_ep TEXT, deprecated TEXT, deprecated_ep TEXT);
+CREATE TABLE datatypes (name TEXT PRIMARY KEY, base_type TEXT, synopsis TEXT, pedigree INTEGER REFERENCES pedigrees(id));
+CREATE TABLE code_sets (name TEXT PRIMARY KEY, id, type TEXT, synopsis TEXT, pedigree INTEGER REFERENCES pedigrees(id));
+CREATE TABLE codes (code_set TEXT REFERENCES code_sets(name), position INTEGER, id, name TEXT, value TEXT, synopsis TEXT, pedigree INTEGER REFERENCES pedigrees(id), PRIMARY KEY (code_set, position));
+CREATE TABLE fields (tag INTEGER PRIMARY KEY, name TEXT, type TEXT, synopsis TEXT, pedigree INTEGER REFERENCES pedigrees(id), discriminator_id);
+CREATE TABLE components (id PRIMARY KEY, name TEXT, category TEXT, synopsis TEXT, pedigree INTEGER REFERENCES pedigrees(id));
+CREATE TABLE groups (id PRIMARY KEY, name TEXT, category TEXT, synopsis TEXT, pedigree INTEGER REFERENCES pedigrees(id));
+CREATE TABLE messages (msg_type TEXT PRIMARY KEY, id, name TEXT, category TEXT, synopsis TEXT, pedigree INTEGER REFERENCES pedigrees(id));
+CREATE TABLE refs (owner_kind TEXT, owner_id, position INTEGER, kind TEXT, id, presence TEXT, synopsis TEXT, pedigree INTEGER REFERENCES pedigrees(id), PRIMARY KEY (owner_kind, owner_id, position));
+CREATE INDEX fields_name ON fields (name COLLATE NOCASE);
+CREATE INDEX messages_name ON messages (name COLLATE NOCASE);
+CREATE INDEX refs_id ON refs (kind, id);
+'''
+
+MESSAGE = 'message'
+
+
+def export(orchestration, filename):
+    # Write the orchestration to a new database, replacing any existing file.
+    orchestration.require_sections('datatypes', 'codeSets', 'fields', 'components', 'groups', 'messages')
+    if os.path.exists(filename):
+        os.remove(filename)
+    connection = sqlite3.connect(filename)
+    try:
+        connection.executescript(schema)
+        pedigrees = {}  # Pedigree -> id
+
+        def pedigree_id(pedigree):
+            if pedigree is None:
+                return None
+            key = (pedigree.added, pedigree.addedEP, pedigree.updated, pedigree.updatedEP, pedigree.deprecated, pedigree.deprecatedEP)
+            try:
+                return pedigrees[key]
+            except KeyError:
+                id = len(pedigrees) + 1
+                pedigrees[key] = id
+                connection.execute('INSERT INTO pedigrees VALUES (?, ?, ?, ?, ?, ?, ?)', (id,) + key)
+                return id
+
+        def insert_references(owner_kind, owner_id, references):
+            connection.executemany('INSERT INTO refs VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(owner_kind, owner_id, position, reference.kind, reference.id, reference.presence, reference.synopsis, pedigree_id(reference.pedigree)) for position, reference in enumerate(references)])
+
+        connection.execute('INSERT INTO metadata VALUES (?, ?)', ('version', orchestration.version))
+        for data_type in orchestration.data_types.values():
+            connection.execute('INSERT INTO datatypes VALUES (?, ?, ?, ?)', (data_type.name, data_type.base_type, data_type.synopsis, pedigree_id(data_type.pedigree)))
+        for code_set in orchestration.code_sets.values():
+            connection.execute('INSERT INTO code_sets VALUES (?, ?, ?, ?, ?)', (code_set.name, code_set.id, code_set.type, code_set.synopsis, pedigree_id(code_set.pedigree)))
+            connection.executemany('INSERT INTO codes VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(code_set.name, position, code.id, code.name, code.value, code.synopsis, pedigree_id(code.pedigree)) for position, code in enumerate(code_set.codes)])
+        for field in orchestration.fields_by_tag.values():
+            connection.execute('INSERT INTO fields VALUES (?, ?, ?, ?, ?, ?)', (field.id, field.name, field.type, field.synopsis, pedigree_id(field.pedigree), field.discriminator_id))
+        for component in orchestration.components.values():
+            connection.execute('INSERT INTO components VALUES (?, ?, ?, ?, ?)', (component.id, component.name, component.category, component.synopsis, pedigree_id(component.pedigree)))
+            insert_references(Reference.COMPONENT, component.id, component.references)
+        for group in orchestration.groups.values():
+            connection.execute('INSERT INTO groups VALUES (?, ?, ?, ?, ?)', (group.id, group.name, group.category, group.synopsis, pedigree_id(group.pedigree)))
+            insert_references(Reference.GROUP, group.id, group.references)
+        for message in orchestration.messages_by_msg_type.values():
+            connection.execute('INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?)', (message.msg_type, message.id, message.name, message.category, message.synopsis, pedigree_id(message.pedigree)))
+            insert_references(MESSAGE, message.id, message.references)
+        connection.commit()
+    finally:
+        connection.close()
+    return filename
+
+
+def export_repository(repository, filename):
+    # Repositories are stored in the orchestration schema using the same conversion as
+    # fixreptorc.
+    from fixreptorc.fixreptorc import convert
+    return export(convert(repository), filename)
+
+
+class Table:
+    # A read only mapping over one table keyed on a single indexed column. Rows are
+    # converted to model objects each time they are accessed.
+
+    def __init__(self, database, table, column, build, collate = ''):
+        self.database = database
+        self.table = table
+        self.column = column
+        self.build = build
+        self.collate = collate
+
+    def __getitem__(self, key):
+        row = self.database.connection.execute('SELECT * FROM {} WHERE {} = ? {}'.format(self.table, self.column, self.collate), (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return self.build(row)
+
+    def get(self, key, default = None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return self.database.connection.execute('SELECT 1 FROM {} WHERE {} = ? {}'.format(self.table, self.column, self.collate), (key,)).fetchone() is not None
+
+    def __len__(self):
+        return self.database.connection.execute('SELECT COUNT(*) FROM {}'.format(self.table)).fetchone()[0]
+
+    def values(self):
+        for row in self.database.connection.execute('SELECT * FROM {} ORDER BY rowid'.format(self.table)):
+            yield self.build(row)
+
+
+class Database:
+
+    def __init__(self, filename):
+        if not os.path.exists(filename):
+            raise Exception("database '{}' does not exist".format(filename))
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.row_factory = sqlite3.Row
+        self.pedigrees = {}     # pedigree id -> Pedigree
+        self.version = self.connection.execute("SELECT value FROM metadata WHERE name = 'version'").fetchone()[0]
+        self.data_types = Table(self, 'datatypes', 'name', self.build_data_type)
+        self.code_sets = Table(self, 'code_sets', 'name', self.build_code_set)
+        self.fields_by_tag = Table(self, 'fields', 'tag', self.build_field)
+        self.fields_by_name = Table(self, 'fields', 'name', self.build_field, 'COLLATE NOCASE')
+        self.components = Table(self, 'components', 'id', self.build_component)
+        self.groups = Table(self, 'groups', 'id', self.build_group)
+        self.messages_by_msg_type = Table(self, 'messages', 'msg_type', self.build_message)
+        self.messages_by_name = Table(self, 'messages', 'name', self.build_message, 'COLLATE NOCASE')
+        self.messages = Table(self, 'messages', 'id', self.build_message)
+        self.usages = {}        # (kind, id) -> (Usage)
+
+
+    def close(self):
+        self.connection.close()
+
+
+    def require_sections(self, *sections):
+        # Everything is always available, this is here so the Orchestration functions work.
+        pass
+
+
+    def field_values(self, field):
+        try:
+            return self.code_sets[field.type].codes
+        except KeyError:
+            return []
+
+
+    def references_to(self, kind, id):
+        # [(user kind, user, Reference)] from the refs index rather than the reverse index an
+        # Orchestration builds from every reference.
+        users = []
+        for row in self.connection.execute('SELECT owner_kind, owner_id, position FROM refs WHERE kind = ? AND id = ? ORDER BY rowid', (kind, id)):
+            owner_kind = row['owner_kind']
+            if owner_kind == Reference.COMPONENT:
+                user = self.components[row['owner_id']]
+            elif owner_kind == Reference.GROUP:
+                user = self.groups[row['owner_id']]
+            else:
+                user = self.messages[row['owner_id']]
+            users.append((owner_kind, user, user.references[row['position']]))
+        return users
+
+
+    where_used = Orchestration.where_used
+
+
+    def search_index(self, cache_directory = None):
+        return search.cached_index(cache_directory, 'database', self.filename, [self.filename], lambda: search.orchestration_documents(self))
+
+
+    def pedigree(self, id):
+        if id is None:
+            return None
+        try:
+            return self.pedigrees[id]
+        except KeyError:
+            row = self.connection.execute('SELECT * FROM pedigrees WHERE id = ?', (id,)).fetchone()
+            pedigree = Pedigree.intern(row['added'], row['added_ep'], row['updated'], row['updated_ep'], row['deprecated'], row['deprecated_ep'])
+            self.pedigrees[id] = pedigree
+            return pedigree
+
+
+    def references(self, owner_kind, owner_id):
+        references = []
+        for row in self.connection.execute('SELECT * FROM refs WHERE owner_kind = ? AND owner_id = ? ORDER BY position', (owner_kind, owner_id)):
+            kind = row['kind']
+            references.append(Reference(
+                row['id'] if kind == Reference.FIELD else None,
+                row['id'] if kind == Reference.GROUP else None,
+                row['id'] if kind == Reference.COMPONENT else None,
+                row['presence'],
+                row['synopsis'],
+                self.pedigree(row['pedigree'])
+            ))
+        return references
+
+
+    def build_data_type(self, row):
+        return DataType(row['name'], row['base_type'], row['synopsis'], self.pedigree(row['pedigree']))
+
+
+    def build_code_set(self, row):
+        codes = [Code(code['id'], code['name'], code['value'], code['synopsis'], self.pedigree(code['pedigree']))
+            for code in self.connection.execute('SELECT * FROM codes WHERE code_set = ? ORDER BY position', (row['name'],))]
+        return CodeSet(row['id'], row['name'], row['type'], row['synopsis'], self.pedigree(row['pedigree']), codes)
+
+
+    def build_field(self, row):
+        return Field(row['tag'], row['name'], row['type'], row['synopsis'], self.pedigree(row['pedigree']), row['discriminator_id'])
+
+
+    def build_component(self, row):
+        return Component(row['id'], row['name'], row['category'], row['synopsis'], self.pedigree(row['pedigree']), self.references(Reference.COMPONENT, row['id']))
+
+
+    def build_group(self, row):
+        return Group(row['id'], row['name'], row['category'], row['synopsis'], self.pedigree(row['pedigree']), self.references(Reference.GROUP, row['id']))
+
+
+    def build_message(self, row):
+        return Message(row['id'], row['name'], row['msg_type'], row['category'], row['synopsis'], self.pedigree(row['pedigree']), self.references(MESSAGE, row['id']))
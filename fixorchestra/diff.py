@@ -0,0 +1,198 @@
+import difflib
+
+#
+# Structural differences between two orchestrations e.g. consecutive extension packs. Each
+# kind of entity is matched by id, datatypes by name as they have no id, and reported as
+# added, removed, or changed with a line of detail for each difference. References are
+# compared by what they refer to so a reordering is reported as moves rather than as every
+# reference after the first one that moved having changed.
+#
+# Unchanged subtrees are skipped by their fingerprints, see Orchestration.fingerprint(),
+# which include the fingerprints of everything an entity refers to. Orchestrations with
+# the same fingerprint have no differences at all, and an entity with the same fingerprint
+# in both has none in it or anything below it. An entity whose fingerprint differs may only
+# have changed below, which is reported against what did change, so it is then compared on
+# a signature tuple of its own content and references. Only entities whose signatures
+# differ are compared attribute by attribute.
+#
+
+ADDED = 'added'
+REMOVED = 'removed'
+CHANGED = 'changed'
+
+
+class Change:
+
+    __slots__ = ('kind', 'id', 'name', 'change', 'details')
+
+    def __init__(self, kind, id, name, change, details):
+        self.kind = kind
+        self.id = id
+        self.name = name
+        self.change = change
+        self.details = details
+
+    def __str__(self):
+        if self.name is None or self.name == self.id:
+            return '{} {} {}'.format(self.kind, self.id, self.change)
+        return '{} {} ({}) {}'.format(self.kind, self.id, self.name, self.change)
+
+
+# The attributes compared for each kind of entity, references and codes are compared separately.
+attributes = {
+    'datatype'  : ('name', 'base_type', 'synopsis', 'pedigree'),
+    'codeSet'   : ('name', 'type', 'synopsis', 'pedigree'),
+    'code'      : ('name', 'value', 'synopsis', 'pedigree'),
+    'field'     : ('name', 'type', 'synopsis', 'pedigree', 'discriminator_id'),
+    'component' : ('name', 'category', 'synopsis', 'pedigree'),
+    'group'     : ('name', 'category', 'synopsis', 'pedigree'),
+    'message'   : ('name', 'msg_type', 'category', 'synopsis', 'pedigree'),
+}
+
+
+def reference_signature(reference):
+    return (reference.kind, reference.id, reference.presence, reference.synopsis, reference.pedigree)
+
+
+def signature(kind, entity):
+    values = tuple(getattr(entity, name) for name in attributes[kind])
+    if kind == 'codeSet':
+        return values + tuple((code.id,) + signature('code', code) for code in entity.codes)
+    if kind in ('component', 'group', 'message'):
+        return values + tuple(reference_signature(reference) for reference in entity.references)
+    return values
+
+
+def describe(value):
+    return str(value) if value is not None and not isinstance(value, str) else repr(value)
+
+
+def compare_attributes(kind, old, new):
+    details = []
+    for name in attributes[kind]:
+        old_value = getattr(old, name)
+        new_value = getattr(new, name)
+        if old_value != new_value:
+            details.append('{} {} -> {}'.format(name, describe(old_value), describe(new_value)))
+    return details
+
+
+def reference_keys(references):
+    # (kind, id, occurrence) for each reference so the rare entity that references the same
+    # thing twice still has a unique key for each reference.
+    counts = {}
+    keys = []
+    for reference in references:
+        key = (reference.kind, reference.id)
+        occurrence = counts.get(key, 0)
+        counts[key] = occurrence + 1
+        keys.append(key + (occurrence,))
+    return keys
+
+
+def describe_reference(key):
+    kind, id, occurrence = key
+    if occurrence:
+        return 'reference {} {} (occurrence {})'.format(kind, id, occurrence + 1)
+    return 'reference {} {}'.format(kind, id)
+
+
+def compare_references(old_references, new_references):
+    details = []
+    old_keys = reference_keys(old_references)
+    new_keys = reference_keys(new_references)
+    old_positions = { key : position for position, key in enumerate(old_keys) }
+    new_positions = { key : position for position, key in enumerate(new_keys) }
+    for position, key in enumerate(old_keys):
+        if key not in new_positions:
+            details.append('{} removed from position {}'.format(describe_reference(key), position + 1))
+    for position, key in enumerate(new_keys):
+        if key not in old_positions:
+            details.append('{} added at position {}'.format(describe_reference(key), position + 1))
+    # The common references that are not part of the longest run in the same relative
+    # order have moved.
+    old_common = [key for key in old_keys if key in new_positions]
+    new_common = [key for key in new_keys if key in old_positions]
+    if old_common != new_common:
+        in_order = set()
+        matcher = difflib.SequenceMatcher(None, old_common, new_common, autojunk=False)
+        for block in matcher.get_matching_blocks():
+            in_order.update(old_common[block.a:block.a + block.size])
+        for key in new_common:
+            if key not in in_order:
+                details.append('{} moved from position {} to {}'.format(describe_reference(key), old_positions[key] + 1, new_positions[key] + 1))
+    for key in new_common:
+        old = old_references[old_positions[key]]
+        new = new_references[new_positions[key]]
+        for name in ('presence', 'synopsis', 'pedigree'):
+            old_value = getattr(old, name)
+            new_value = getattr(new, name)
+            if old_value != new_value:
+                details.append('{} {} {} -> {}'.format(describe_reference(key), name, describe(old_value), describe(new_value)))
+    return details
+
+
+def compare_codes(old_codes, new_codes):
+    details = []
+    old_by_id = { code.id : code for code in old_codes }
+    new_by_id = { code.id : code for code in new_codes }
+    for id, code in old_by_id.items():
+        if id not in new_by_id:
+            details.append('code {} ({}) removed'.format(id, code.name))
+    for id, code in new_by_id.items():
+        if id not in old_by_id:
+            details.append('code {} ({}) added'.format(id, code.name))
+            continue
+        for detail in compare_attributes('code', old_by_id[id], code):
+            details.append('code {} ({}) {}'.format(id, code.name, detail))
+    if [code.id for code in old_codes if code.id in new_by_id] != [code.id for code in new_codes if code.id in old_by_id]:
+        details.append('codes reordered')
+    return details
+
+
+def compare_entities(kind, old_orchestration, new_orchestration, old_entities, new_entities):
+    # old_entities and new_entities map id -> entity for one kind.
+    changes = []
+    for id, old in old_entities.items():
+        try:
+            new = new_entities[id]
+        except KeyError:
+            changes.append(Change(kind, id, old.name, REMOVED, []))
+            continue
+        if old_orchestration.fingerprint(old) == new_orchestration.fingerprint(new):
+            continue
+        if signature(kind, old) == signature(kind, new):
+            continue
+        details = compare_attributes(kind, old, new)
+        if kind == 'codeSet':
+            details += compare_codes(old.codes, new.codes)
+        elif kind in ('component', 'group', 'message'):
+            details += compare_references(old.references, new.references)
+        changes.append(Change(kind, id, new.name, CHANGED, details))
+    for id, new in new_entities.items():
+        if id not in old_entities:
+            changes.append(Change(kind, id, new.name, ADDED, []))
+    return changes
+
+
+def diff(old, new):
+    # Returns a list of Change from the old orchestration to the new one.
+    for orchestration in (old, new):
+        orchestration.require_sections(*orchestration.sections)
+    if old.orchestration_fingerprint() == new.orchestration_fingerprint():
+        return []
+    changes = []
+    changes += compare_entities('datatype', old, new, old.data_types, new.data_types)
+    changes += compare_entities('codeSet', old, new, { code_set.id : code_set for code_set in old.code_sets.values() }, { code_set.id : code_set for code_set in new.code_sets.values() })
+    changes += compare_entities('field', old, new, old.fields_by_tag, new.fields_by_tag)
+    changes += compare_entities('component', old, new, old.components, new.components)
+    changes += compare_entities('group', old, new, old.groups, new.groups)
+    changes += compare_entities('message', old, new, old.messages, new.messages)
+    return changes
+
+
+def dump_diff(changes):
+    for change in changes:
+        print(change)
+        for detail in change.details:
+            print('    ' + detail)
@@ -1,8 +1,19 @@
 #!/usr/bin/env python3
 
 import argparse
+import hashlib
 import xml.etree.ElementTree as ET
+import xml.parsers.expat
 import datetime
+import sys
+sys.path.append("..")
+from fixorchestra import snapshot
+from fixorchestra import tagvalue
+from fixorchestra import codegen
+from fixorchestra import diff
+from fixorchestra import search
+from fixorchestra import shell
+from fixorchestra import profiling
 
 xs_namespace = 'http://www.w3.org/2001/XMLSchema'
 functx_namespace = 'http://www.functx.com'
@@ -18,7 +29,25 @@ namespaces = {
     'xsi'    : xsi_namespace 
 }
 
+# The data types whose values are a space separated list of code set values.
+multiple_value_types = frozenset(['MultipleCharValue', 'MultipleStringValue', 'MultipleValueString'])
+
 class Pedigree:
+    # Most pedigrees are identical, e.g. added=FIX.4.4 with nothing else set, so loaders
+    # share instances through intern() and they must be treated as immutable.
+    __slots__ = ('added', 'addedEP', 'updated', 'updatedEP', 'deprecated', 'deprecatedEP')
+
+    instances = {}
+
+    @classmethod
+    def intern(cls, added, addedEP, updated, updatedEP, deprecated, deprecatedEP):
+        key = (added, addedEP, updated, updatedEP, deprecated, deprecatedEP)
+        try:
+            return cls.instances[key]
+        except KeyError:
+            pedigree = cls(*key)
+            cls.instances[key] = pedigree
+            return pedigree
 
     def __init__(self, added, addedEP, updated, updatedEP, deprecated, deprecatedEP):
         self.added = added
@@ -54,14 +83,23 @@ class Pedigree:
             buffer += 'deprecatedEP=' + self.deprecatedEP
         return '(' + buffer + ')'
 
+    def __reduce__(self):
+        # Unpickled pedigrees, e.g. from a snapshot, go through the same cache.
+        return (Pedigree.intern, (self.added, self.addedEP, self.updated, self.updatedEP, self.deprecated, self.deprecatedEP))
+
     def __eq__(self, rhs):
         return self.added == rhs.added and self.addedEP == rhs.addedEP and self.updated == rhs.updated and self.updatedEP == rhs.updatedEP and self.deprecated == rhs.deprecated and self.deprecatedEP == rhs.deprecatedEP
 
+    def __hash__(self):
+        return hash((self.added, self.addedEP, self.updated, self.updatedEP, self.deprecated, self.deprecatedEP))
+
 
 
 
 class DataType:
 
+    __slots__ = ('name', 'base_type', 'synopsis', 'pedigree')
+
     def __init__(self, name, base_type, synopsis, pedigree):
         self.name = name
         self.base_type = base_type
@@ -73,6 +111,8 @@ class Code:
     # This class needs to be kept in sync with repository.Enum because fixaudit.py stores 
     # instances of these classes in Sets. Specifically both implementations have to be hashable 
     # and they have to be hashing the same thing.
+    __slots__ = ('id', 'name', 'value', 'synopsis', 'pedigree')
+
     def __init__(self, id, name, value, synopsis, pedigree):
         self.id = id
         self.name = name
@@ -89,6 +129,8 @@ class Code:
 
 class CodeSet:
  
+    __slots__ = ('id', 'name', 'type', 'synopsis', 'pedigree', 'codes')
+
     def __init__(self, id, name, type, synopsis, pedigree, codes):
         self.id = id
         self.name = name
@@ -101,6 +143,8 @@ class Field:
     # This class needs to be kept in sync with repository.Field because fixaudit.py stores 
     # nstances of these classes in Sets. Specifically both implementations have to be hashable 
     # and they have to be hashing the same thing.
+    __slots__ = ('id', 'name', 'type', 'synopsis', 'pedigree', 'discriminator_id')
+
     def __init__(self, id, name, type, synopsis, pedigree, discriminator_id):
         self.id = id
         self.name = name
@@ -117,19 +161,45 @@ class Field:
 
 
 class Reference:
+    # A reference is to exactly one of a field, group, or component so rather than three id
+    # slots that are mostly None it stores the kind of thing referenced and its id. The
+    # field_id, group_id, and component_id properties preserve the original interface.
+    __slots__ = ('kind', 'id', 'presence', 'synopsis', 'pedigree')
+
+    FIELD = 'field'
+    GROUP = 'group'
+    COMPONENT = 'component'
 
     def __init__(self, field_id, group_id, component_id, presence, synopsis, pedigree):
-        #if field_id and group_id:
-        #    raise Exception('A Reference cannot have both a field_id and a group_id')
-        self.field_id = field_id
-        self.group_id = group_id
-        self.component_id = component_id
+        if field_id:
+            self.kind = Reference.FIELD
+            self.id = field_id
+        elif group_id:
+            self.kind = Reference.GROUP
+            self.id = group_id
+        else:
+            self.kind = Reference.COMPONENT
+            self.id = component_id
         self.presence = presence
         self.synopsis = synopsis
         self.pedigree = pedigree
 
+    @property
+    def field_id(self):
+        return self.id if self.kind == Reference.FIELD else None
+
+    @property
+    def group_id(self):
+        return self.id if self.kind == Reference.GROUP else None
+
+    @property
+    def component_id(self):
+        return self.id if self.kind == Reference.COMPONENT else None
+
 class Component:
 
+    __slots__ = ('id', 'name', 'category', 'synopsis', 'pedigree', 'references')
+
     def __init__(self, id, name, category, synopsis, pedigree, references):
         self.id = id
         self.name = name
@@ -140,6 +210,8 @@ class Component:
 
 class Group:
 
+    __slots__ = ('id', 'name', 'category', 'synopsis', 'pedigree', 'references')
+
     def __init__(self, id, name, category, synopsis, pedigree, references):
         self.id = id
         self.name = name
@@ -150,6 +222,8 @@ class Group:
 
 class Message:
 
+    __slots__ = ('id', 'name', 'msg_type', 'category', 'synopsis', 'pedigree', 'references')
+
     def __init__(self, id, name, msg_type, category, synopsis, pedigree, references):
         self.id = id
         self.name = name
@@ -162,57 +236,333 @@ class Message:
        
 class MessageField:
 
+    __slots__ = ('field', 'presence', 'depth')
+
     def __init__(self, field, presence, depth):
         self.field = field
         self.presence = presence
         self.depth = depth
 
 
+class LayoutEntry:
+    # Where a field appears in a message. group_path is the ids of the enclosing groups from
+    # the outermost in and position is the index of the field in message_fields. required is
+    # True if this field and every component enclosing it within its group, or within the
+    # message if it is not in a group, are required.
+    __slots__ = ('field', 'presence', 'depth', 'group_path', 'position', 'required')
+
+    def __init__(self, field, presence, depth, group_path, position, required):
+        self.field = field
+        self.presence = presence
+        self.depth = depth
+        self.group_path = group_path
+        self.position = position
+        self.required = required
+
+
+class MessageLayout:
+    # The flattened structure of a message indexed for constant time lookup. entries maps a
+    # tag to its first occurrence. required holds the tags that must be present in every
+    # message and required_by_group the tags that must be present in every instance of
+    # each group.
+    __slots__ = ('message', 'fields', 'entries', 'required', 'required_by_group')
+
+    def __init__(self, message, fields):
+        self.message = message
+        self.fields = fields
+        self.entries = {}
+        required_by_group = {}
+        for entry in fields:
+            self.entries.setdefault(entry.field.id, entry)
+            if entry.required:
+                required_by_group.setdefault(entry.group_path[-1] if entry.group_path else None, set()).add(entry.field.id)
+        self.required = frozenset(required_by_group.pop(None, ()))
+        self.required_by_group = { group_id : frozenset(tags) for group_id, tags in required_by_group.items() }
+
+    def __contains__(self, tag):
+        return tag in self.entries
+
+    def get(self, tag):
+        return self.entries.get(tag)
+
+
+class FieldValues:
+    # Constant time lookups between the values of an enumerated field and their Codes.
+    # Multiple value fields hold a space separated list of values which decode() splits.
+    __slots__ = ('field', 'multiple', 'by_value', 'by_name')
+
+    def __init__(self, field, codes, multiple):
+        self.field = field
+        self.multiple = multiple
+        self.by_value = { code.value : code for code in codes }
+        self.by_name = { code.name : code for code in codes }
+
+    def code(self, value):
+        return self.by_value.get(value)
+
+    def value(self, name):
+        code = self.by_name.get(name)
+        return None if code is None else code.value
+
+    def decode(self, value):
+        # A tuple with the Code, or None, for each value in the field.
+        if self.multiple:
+            return tuple(self.by_value.get(token) for token in value.split(' '))
+        return (self.by_value.get(value),)
+
+
+class Usage:
+    # A use of a field, group, or component by a message, group, or component. The use is
+    # direct if path is empty, otherwise it is through the groups and components whose ids
+    # are in path from the outermost in. presence is that of the reference to the thing used
+    # and depth is where it appears in user as in message_fields.
+    __slots__ = ('kind', 'user', 'presence', 'depth', 'path')
+
+    def __init__(self, kind, user, presence, depth, path):
+        self.kind = kind
+        self.user = user
+        self.presence = presence
+        self.depth = depth
+        self.path = path
+
+
 class Orchestration:
 
-    data_types = {}             # DataType.name -> DataType
-    code_sets = {}              # CodeSet.name -> CodeSet
-    fields_by_tag = {}          # Field.id -> Field
-    fields_by_name = {}         # Field.name.lower() -> Field
-    components = {}             # Componnet.id -> Component
-    groups = {}                 # Group.id -> Group
-    messages = {}               # Message.id -> Message
-    messages_by_msg_type = {}   # Message.msg_type -> Message
-    messages_by_name = {}       # Message.name.lower() -> Message
-    version = ''
-
-    def __init__(self, filename = None):
+    # data_types             DataType.name -> DataType
+    # code_sets              CodeSet.name -> CodeSet
+    # fields_by_tag          Field.id -> Field
+    # fields_by_name         Field.name.lower() -> Field
+    # components             Componnet.id -> Component
+    # groups                 Group.id -> Group
+    # messages               Message.id -> Message
+    # messages_by_msg_type   Message.msg_type -> Message
+    # messages_by_name       Message.name.lower() -> Message
+
+    # The top level sections of an orchestration and the attributes each one populates.
+    sections = {
+        'datatypes'  : ['data_types'],
+        'codeSets'   : ['code_sets'],
+        'fields'     : ['fields_by_tag', 'fields_by_name'],
+        'components' : ['components'],
+        'groups'     : ['groups'],
+        'messages'   : ['messages', 'messages_by_msg_type', 'messages_by_name']
+    }
+
+    section_attributes = { name : section for section, names in sections.items() for name in names }
+
+    loaders = ['tree', 'streaming', 'lazy', 'expat']
+
+    # The attributes that make up a loaded model, these are what a snapshot stores.
+    snapshot_attributes = [
+        'version',
+        'data_types',
+        'code_sets',
+        'fields_by_tag',
+        'fields_by_name',
+        'components',
+        'groups',
+        'messages',
+        'messages_by_msg_type',
+        'messages_by_name'
+    ]
+
+    # The phases of the tree loader in the order they run, see load().
+    load_phases = ['load_meta_data', 'load_data_types', 'load_code_sets', 'load_fields', 'load_components', 'load_groups', 'load_messages']
+
+    def __init__(self, filename = None, loader = 'tree', cache_directory = None, profile = None):
+        if loader not in self.loaders:
+            raise Exception("unknown loader '{}' expected one of {}".format(loader, self.loaders))
+        # If profile is a profiling.Profile each phase of loading is recorded in it.
+        self.profile = profile
+        self.version = ''
+        # The lazy loader leaves each section unset until it is first accessed, see __getattr__.
+        self.pending_sections = set(self.sections) if filename and loader == 'lazy' else set()
+        for section, names in self.sections.items():
+            if section not in self.pending_sections:
+                for name in names:
+                    setattr(self, name, {})
+        self.invalidate_caches()
+        self.filename = filename
         if filename == None:
             return
-        self.filename = filename
-        tree = ET.parse(filename)
+        if cache_directory:
+            with profiling.phase(self.profile, 'load_snapshot'):
+                loaded = self.load_snapshot(cache_directory)
+            if loaded:
+                return
+        if loader == 'lazy':
+            # Only read the metadata now, a partial model is not worth a snapshot.
+            with profiling.phase(self.profile, 'load_meta_data'):
+                self.load_streaming(filename, [])
+            return
+        self.load(filename, loader)
+        if cache_directory:
+            with profiling.phase(self.profile, 'save_snapshot'):
+                self.save_snapshot(cache_directory)
+
+    def __getattr__(self, name):
+        # This is only called when normal attribute lookup fails which for a lazily loaded
+        # orchestration means a section that has not been parsed yet.
+        section = self.section_attributes.get(name)
+        pending_sections = self.__dict__.get('pending_sections')
+        if section is None or not pending_sections or section not in pending_sections:
+            raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
+        self.load_sections([section])
+        return self.__dict__[name]
+
+    def load_sections(self, sections):
+        # Parse the requested sections that have not been loaded yet in a single pass.
+        sections = [section for section in sections if section in self.pending_sections]
+        if len(sections) == 0:
+            return
+        for section in sections:
+            for name in self.sections[section]:
+                setattr(self, name, {})
+        with profiling.phase(self.profile, 'load_sections ' + ','.join(sections)):
+            self.load_streaming(self.filename, sections)
+        self.pending_sections.difference_update(sections)
+        self.invalidate_caches()
+
+    def require_sections(self, *sections):
+        # Callers that are about to touch several sections declare them up front so a
+        # lazily loaded orchestration parses them together rather than one pass each.
+        if self.pending_sections:
+            self.load_sections(sections)
+
+    def load(self, filename, loader):
+        # The single pass loaders build every section as they go so they are one phase.
+        if loader == 'streaming':
+            with profiling.phase(self.profile, 'load_streaming'):
+                self.load_streaming(filename)
+            return
+        if loader == 'expat':
+            with profiling.phase(self.profile, 'load_expat'):
+                ExpatLoader(self).load(filename)
+            return
+        with profiling.phase(self.profile, 'parse'):
+            tree = ET.parse(filename)
         repository = tree.getroot()
-        self.load_meta_data(repository)
-        self.load_data_types(repository)
-        self.load_code_sets(repository)
-        self.load_fields(repository)
-        self.load_components(repository)
-        self.load_groups(repository)
-        self.load_messages(repository)
+        for method in self.load_phases:
+            with profiling.phase(self.profile, method):
+                getattr(self, method)(repository)
+
+    def load_snapshot(self, cache_directory):
+        state = snapshot.load(cache_directory, 'orchestration', self.filename, [self.filename])
+        if state is None:
+            return False
+        for name in self.snapshot_attributes:
+            setattr(self, name, state[name])
+        self.pending_sections = set()
+        self.invalidate_caches()
+        return True
+
+    def save_snapshot(self, cache_directory):
+        self.require_sections(*self.sections)
+        state = { name : getattr(self, name) for name in self.snapshot_attributes }
+        return snapshot.save(cache_directory, 'orchestration', self.filename, [self.filename], state)
+
+    def invalidate_caches(self):
+        # Derived data such as flattened layouts is computed on demand and kept, anything that
+        # modifies the model after it has been loaded must call this.
+        self.flattened = {}
+        self.layouts = {}
+        self.value_tables = None
+        self.fingerprints = {}
+        self.referenced_by = None
+        self.usages = {}
+        self.text_index = None
+
+
+    def flatten(self, kind, id, depth):
+        # The fields of a group or component as they appear at a given depth, shared by every
+        # message that references it e.g. StandardHeader and StandardTrailer.
+        key = (kind, id, depth)
+        try:
+            return self.flattened[key]
+        except KeyError:
+            pass
+        if kind == Reference.GROUP:
+            references = self.groups[id].references
+        else:
+            references = self.components[id].references
+        fields = tuple(self.references_to_fields(references, depth))
+        self.flattened[key] = fields
+        return fields
+
 
     def references_to_fields(self, references, depth):
         result = []
         for reference in references:
-            if reference.field_id:
-                result.append(MessageField(self.fields_by_tag[reference.field_id], reference.presence, depth))
-            elif reference.group_id:
-                group = self.groups[reference.group_id]
-                result = result + self.references_to_fields(group.references, depth + 1)
-            elif reference.component_id:
-                component = self.components[reference.component_id]
-                result = result + self.references_to_fields(component.references, depth)
+            if reference.kind == Reference.FIELD:
+                result.append(MessageField(self.fields_by_tag[reference.id], reference.presence, depth))
+            elif reference.kind == Reference.GROUP:
+                result.extend(self.flatten(Reference.GROUP, reference.id, depth + 1))
+            else:
+                result.extend(self.flatten(Reference.COMPONENT, reference.id, depth))
         return result
 
 
+    def iter_references_to_fields(self, references, depth):
+        for reference in references:
+            if reference.kind == Reference.FIELD:
+                yield MessageField(self.fields_by_tag[reference.id], reference.presence, depth)
+                continue
+            child_depth = depth + 1 if reference.kind == Reference.GROUP else depth
+            try:
+                yield from self.flattened[(reference.kind, reference.id, child_depth)]
+            except KeyError:
+                if reference.kind == Reference.GROUP:
+                    yield from self.iter_references_to_fields(self.groups[reference.id].references, child_depth)
+                else:
+                    yield from self.iter_references_to_fields(self.components[reference.id].references, child_depth)
+
+
     def message_fields(self, message):
+        self.require_sections('fields', 'components', 'groups')
         return self.references_to_fields(message.references, 0)
 
 
+    def iter_message_fields(self, message):
+        # A lazy equivalent of message_fields for callers that may stop early, it uses but
+        # does not populate the flattened layout cache.
+        self.require_sections('fields', 'components', 'groups')
+        return self.iter_references_to_fields(message.references, 0)
+
+
+    def build_layout(self, references, depth, group_path, required, fields):
+        for reference in references:
+            reference_required = required and reference.presence == 'required'
+            if reference.kind == Reference.FIELD:
+                field = self.fields_by_tag[reference.id]
+                fields.append(LayoutEntry(field, reference.presence, depth, group_path, len(fields), reference_required))
+            elif reference.kind == Reference.GROUP:
+                # Requiredness within a group is relative to an instance of that group.
+                group = self.groups[reference.id]
+                self.build_layout(group.references, depth + 1, group_path + (group.id,), True, fields)
+            else:
+                self.build_layout(self.components[reference.id].references, depth, group_path, reference_required, fields)
+
+
+    def message_layout(self, message):
+        try:
+            return self.layouts[message.id]
+        except KeyError:
+            pass
+        self.require_sections('fields', 'components', 'groups')
+        fields = []
+        self.build_layout(message.references, 0, (), True, fields)
+        layout = MessageLayout(message, tuple(fields))
+        self.layouts[message.id] = layout
+        return layout
+
+
+    def layout_index(self):
+        # MsgType -> MessageLayout for every message, built once and kept until the caches
+        # are invalidated.
+        self.require_sections('messages', 'fields', 'components', 'groups')
+        return { msg_type : self.message_layout(message) for msg_type, message in self.messages_by_msg_type.items() }
+
+
     def field_values(self, field):
         try:
             return self.code_sets[field.type].codes
@@ -220,6 +570,193 @@ class Orchestration:
             return []
 
 
+    def value_index(self):
+        # Field.id -> FieldValues for every field with a code set, built once and kept until
+        # the caches are invalidated.
+        if self.value_tables is None:
+            self.require_sections('codeSets', 'fields')
+            tables = {}
+            for field in self.fields_by_tag.values():
+                try:
+                    code_set = self.code_sets[field.type]
+                except KeyError:
+                    continue
+                tables[field.id] = FieldValues(field, code_set.codes, code_set.type in multiple_value_types)
+            self.value_tables = tables
+        return self.value_tables
+
+
+    def field_value_table(self, field):
+        # The FieldValues for a field or None if it is not enumerated.
+        return self.value_index().get(field.id)
+
+
+    def decode_values(self, fields):
+        # Returns [(tag, value, codes)] for [(tag, value)] where codes is the result of
+        # FieldValues.decode() or an empty tuple if the field is not enumerated.
+        tables = self.value_index()
+        decoded = []
+        for tag, value in fields:
+            table = tables.get(tag)
+            decoded.append((tag, value, () if table is None else table.decode(value)))
+        return decoded
+
+
+    def reference_index(self):
+        # (kind, id) -> [(user kind, user, Reference)] for every reference made by a component,
+        # group, or message, built once and kept until the caches are invalidated.
+        if self.referenced_by is None:
+            self.require_sections('components', 'groups', 'messages')
+            index = {}
+            for kind, users in ((Reference.COMPONENT, self.components), (Reference.GROUP, self.groups), ('message', self.messages)):
+                for user in users.values():
+                    for reference in user.references:
+                        index.setdefault((reference.kind, reference.id), []).append((kind, user, reference))
+            self.referenced_by = index
+        return self.referenced_by
+
+
+    def references_to(self, kind, id):
+        return self.reference_index().get((kind, id), ())
+
+
+    def where_used(self, kind, id):
+        # A Usage for every message, group, and component that uses a field, group, or
+        # component either directly or through other groups and components. The usages of
+        # each group and component are kept so those shared by many things, such as
+        # Instrument or Parties, are only expanded once.
+        key = (kind, id)
+        try:
+            return self.usages[key]
+        except KeyError:
+            pass
+        usages = []
+        for user_kind, user, reference in self.references_to(kind, id):
+            usages.append(Usage(user_kind, user, reference.presence, 0, ()))
+            if user_kind != 'message':
+                # Only groups nest, the contents of a component are at the depth it is.
+                nesting = 1 if user_kind == Reference.GROUP else 0
+                for usage in self.where_used(user_kind, user.id):
+                    usages.append(Usage(usage.kind, usage.user, reference.presence, usage.depth + nesting, usage.path + (user.id,)))
+        usages = tuple(usages)
+        self.usages[key] = usages
+        return usages
+
+
+    def search_index(self, cache_directory = None):
+        # The full text search index, kept until the caches are invalidated. Given a cache
+        # directory it is also kept on disk and only rebuilt when the orchestration changes.
+        if self.text_index is None:
+            self.text_index = search.cached_index(cache_directory, 'orchestration', self.filename, [self.filename], lambda: search.orchestration_documents(self))
+        return self.text_index
+
+
+    # The kinds of entity that have a fingerprint and the attribute each is indexed by.
+    fingerprint_indexes = {
+        'datatype'          : 'data_types',
+        'codeSet'           : 'code_sets',
+        Reference.FIELD     : 'fields_by_tag',
+        Reference.COMPONENT : 'components',
+        Reference.GROUP     : 'groups',
+        'message'           : 'messages',
+    }
+
+    def fingerprint(self, entity):
+        # A stable SHA-256 hex digest of the content of a DataType, CodeSet, Field, Component,
+        # Group, or Message. The fingerprint of anything that refers to another entity, a
+        # field to its code set or a message to its components for example, includes the
+        # fingerprint of that entity so a change anywhere in a subtree changes every
+        # fingerprint above it.
+        if isinstance(entity, DataType):
+            return self.entity_fingerprint('datatype', entity.name)
+        if isinstance(entity, CodeSet):
+            return self.entity_fingerprint('codeSet', entity.name)
+        if isinstance(entity, Field):
+            return self.entity_fingerprint(Reference.FIELD, entity.id)
+        if isinstance(entity, Component):
+            return self.entity_fingerprint(Reference.COMPONENT, entity.id)
+        if isinstance(entity, Group):
+            return self.entity_fingerprint(Reference.GROUP, entity.id)
+        if isinstance(entity, Message):
+            return self.entity_fingerprint('message', entity.id)
+        raise Exception("cannot fingerprint a {}".format(type(entity).__name__))
+
+
+    def orchestration_fingerprint(self):
+        # Built from the fingerprint of every entity so it changes if anything does.
+        try:
+            return self.fingerprints['orchestration']
+        except KeyError:
+            pass
+        self.require_sections(*self.sections)
+        content = [self.version]
+        for kind, attribute in self.fingerprint_indexes.items():
+            ids = sorted(getattr(self, attribute), key=str)
+            content.append((kind, [(id, self.entity_fingerprint(kind, id)) for id in ids]))
+        fingerprint = hashlib.sha256(repr(content).encode('utf-8')).hexdigest()
+        self.fingerprints['orchestration'] = fingerprint
+        return fingerprint
+
+
+    def entity_fingerprint(self, kind, id):
+        # Fingerprints are kept until the caches are invalidated, None marks one that is
+        # being computed so a cycle of references is reported rather than overflowing the stack.
+        key = (kind, id)
+        try:
+            fingerprint = self.fingerprints[key]
+            if fingerprint is None:
+                raise Exception('{} {} references itself'.format(kind, id))
+            return fingerprint
+        except KeyError:
+            pass
+        self.fingerprints[key] = None
+        try:
+            entity = getattr(self, self.fingerprint_indexes[kind])[id]
+            content = self.fingerprint_content(kind, entity)
+        except BaseException:
+            del self.fingerprints[key]
+            raise
+        fingerprint = hashlib.sha256(repr(content).encode('utf-8')).hexdigest()
+        self.fingerprints[key] = fingerprint
+        return fingerprint
+
+
+    def fingerprint_content(self, kind, entity):
+        pedigree = self.pedigree_content(entity.pedigree)
+        if kind == 'datatype':
+            return (kind, entity.name, entity.base_type, entity.synopsis, pedigree, self.type_fingerprint(entity.base_type))
+        if kind == 'codeSet':
+            codes = [(code.id, code.name, code.value, code.synopsis, self.pedigree_content(code.pedigree)) for code in entity.codes]
+            return (kind, entity.id, entity.name, entity.type, entity.synopsis, pedigree, codes, self.type_fingerprint(entity.type))
+        if kind == Reference.FIELD:
+            return (kind, entity.id, entity.name, entity.type, entity.synopsis, pedigree, entity.discriminator_id, self.type_fingerprint(entity.type))
+        references = []
+        for reference in entity.references:
+            if reference.id in getattr(self, self.fingerprint_indexes[reference.kind]):
+                target = self.entity_fingerprint(reference.kind, reference.id)
+            else:
+                target = None
+            references.append((reference.kind, reference.id, reference.presence, reference.synopsis, self.pedigree_content(reference.pedigree), target))
+        if kind == 'message':
+            return (kind, entity.id, entity.name, entity.msg_type, entity.category, entity.synopsis, pedigree, references)
+        return (kind, entity.id, entity.name, entity.category, entity.synopsis, pedigree, references)
+
+
+    def type_fingerprint(self, type):
+        # The fingerprint of the code set or datatype a name refers to, if any.
+        if type in self.code_sets:
+            return self.entity_fingerprint('codeSet', type)
+        if type in self.data_types:
+            return self.entity_fingerprint('datatype', type)
+        return None
+
+
+    def pedigree_content(self, pedigree):
+        if pedigree is None:
+            return None
+        return (pedigree.added, pedigree.addedEP, pedigree.updated, pedigree.updatedEP, pedigree.deprecated, pedigree.deprecatedEP)
+
+
     def extract_synopsis(self, element):
         # <element>
         #   <fixr:annotation>
@@ -234,7 +771,7 @@ class Orchestration:
   
     
     def extract_pedigree(self, element):
-        return Pedigree(
+        return Pedigree.intern(
             element.get('added'),
             element.get('addedEP'),
             element.get('updated'),
@@ -266,14 +803,17 @@ class Orchestration:
         #   </fixr:datatype>
         dataTypesElement = repository.find('fixr:datatypes', namespaces)
         for dataTypeElement in dataTypesElement.findall('fixr:datatype', namespaces):
-            dataType = DataType(
-                dataTypeElement.get('name'),
-                dataTypeElement.get('baseType'),
-                self.extract_synopsis(dataTypeElement),
-                self.extract_pedigree(dataTypeElement)
-            )
-            self.data_types[dataType.name] = dataType
-        
+            self.load_data_type(dataTypeElement)
+
+    def load_data_type(self, dataTypeElement):
+        dataType = DataType(
+            dataTypeElement.get('name'),
+            dataTypeElement.get('baseType'),
+            self.extract_synopsis(dataTypeElement),
+            self.extract_pedigree(dataTypeElement)
+        )
+        self.data_types[dataType.name] = dataType
+
 
     def load_code_sets(self, repository):
         # <fixr:codeSets>
@@ -287,25 +827,28 @@ class Orchestration:
         #       </fixr:code>
         codeSetsElement = repository.find('fixr:codeSets', namespaces)
         for codeSetElement in codeSetsElement.findall('fixr:codeSet', namespaces):
-            codes = []
-            for codeElement in codeSetElement.findall('fixr:code', namespaces):
-                code = Code(
-                    codeElement.get('id'),
-                    codeElement.get('name'),
-                    codeElement.get('value'),
-                    self.extract_synopsis(codeElement),
-                    self.extract_pedigree(codeElement)
-                )
-                codes.append(code)
-            code_set = CodeSet(
-                codeSetElement.get('id'),
-                codeSetElement.get('name'),
-                codeSetElement.get('type'),
-                self.extract_synopsis(codeSetElement),
-                self.extract_pedigree(codeSetElement),
-                codes
+            self.load_code_set(codeSetElement)
+
+    def load_code_set(self, codeSetElement):
+        codes = []
+        for codeElement in codeSetElement.findall('fixr:code', namespaces):
+            code = Code(
+                codeElement.get('id'),
+                codeElement.get('name'),
+                codeElement.get('value'),
+                self.extract_synopsis(codeElement),
+                self.extract_pedigree(codeElement)
             )
-            self.code_sets[code_set.name] = code_set
+            codes.append(code)
+        code_set = CodeSet(
+            codeSetElement.get('id'),
+            codeSetElement.get('name'),
+            codeSetElement.get('type'),
+            self.extract_synopsis(codeSetElement),
+            self.extract_pedigree(codeSetElement),
+            codes
+        )
+        self.code_sets[code_set.name] = code_set
 
     def load_fields(self, repository):
         # <fixr:fields>
@@ -318,16 +861,19 @@ class Orchestration:
 		#   </fixr:field>
         fieldsElement = repository.find('fixr:fields', namespaces)
         for fieldElement in fieldsElement.findall('fixr:field', namespaces):
-            field = Field(
-                int(fieldElement.get('id')),
-                fieldElement.get('name'),
-                fieldElement.get('type'),
-                self.extract_synopsis(fieldElement),
-                self.extract_pedigree(fieldElement),
-                fieldElement.get('discriminatorId')
-            )
-            self.fields_by_tag[field.id] = field
-            self.fields_by_name[field.name.lower()] = field
+            self.load_field(fieldElement)
+
+    def load_field(self, fieldElement):
+        field = Field(
+            int(fieldElement.get('id')),
+            fieldElement.get('name'),
+            fieldElement.get('type'),
+            self.extract_synopsis(fieldElement),
+            self.extract_pedigree(fieldElement),
+            fieldElement.get('discriminatorId')
+        )
+        self.fields_by_tag[field.id] = field
+        self.fields_by_name[field.name.lower()] = field
 
 
     def extract_references(self, element):
@@ -382,15 +928,18 @@ class Orchestration:
         #   </fixr:fieldRef>
         componentsElement = repository.find('fixr:components', namespaces)
         for componentElement in componentsElement.findall('fixr:component', namespaces):
-            component = Component(
-                componentElement.get('id'), 
-                componentElement.get('name'), 
-                componentElement.get('category'), 
-                self.extract_synopsis(componentElement),
-                self.extract_pedigree(componentElement),
-                self.extract_references(componentElement)
-            )
-            self.components[component.id] = component
+            self.load_component(componentElement)
+
+    def load_component(self, componentElement):
+        component = Component(
+            componentElement.get('id'), 
+            componentElement.get('name'), 
+            componentElement.get('category'), 
+            self.extract_synopsis(componentElement),
+            self.extract_pedigree(componentElement),
+            self.extract_references(componentElement)
+        )
+        self.components[component.id] = component
 
     def load_groups(self, repository):
         # <fixr:groups>
@@ -414,15 +963,18 @@ class Orchestration:
         #    </fixr:group>
         groupsElement = repository.find('fixr:groups', namespaces)
         for groupElement in groupsElement.findall('fixr:group', namespaces):
-            group = Group(
-                groupElement.get('id'),
-                groupElement.get('name'),
-                groupElement.get('category'),
-                self.extract_synopsis(groupElement),
-                self.extract_pedigree(groupElement),
-                self.extract_references(groupElement)
-            )
-            self.groups[group.id] = group    
+            self.load_group(groupElement)
+
+    def load_group(self, groupElement):
+        group = Group(
+            groupElement.get('id'),
+            groupElement.get('name'),
+            groupElement.get('category'),
+            self.extract_synopsis(groupElement),
+            self.extract_pedigree(groupElement),
+            self.extract_references(groupElement)
+        )
+        self.groups[group.id] = group    
 
 
     def load_messages(self, repository):
@@ -438,19 +990,68 @@ class Orchestration:
         #           </fixr:componentRef>
         messagesElement = repository.find('fixr:messages', namespaces)
         for messageElement in messagesElement.findall('fixr:message', namespaces):
-            structureElement = messageElement.find('fixr:structure', namespaces)
-            message = Message(
-                messageElement.get('id'),
-                messageElement.get('name'),
-                messageElement.get('msgType'),
-                messageElement.get('category'),
-                self.extract_synopsis(messageElement),
-                self.extract_pedigree(messageElement),
-                self.extract_references(structureElement)
-            )
-            self.messages[message.id] = message
-            self.messages_by_msg_type[message.msg_type] = message
-            self.messages_by_name[message.name.lower()] = message
+            self.load_message(messageElement)
+
+    def load_message(self, messageElement):
+        structureElement = messageElement.find('fixr:structure', namespaces)
+        message = Message(
+            messageElement.get('id'),
+            messageElement.get('name'),
+            messageElement.get('msgType'),
+            messageElement.get('category'),
+            self.extract_synopsis(messageElement),
+            self.extract_pedigree(messageElement),
+            self.extract_references(structureElement)
+        )
+        self.messages[message.id] = message
+        self.messages_by_msg_type[message.msg_type] = message
+        self.messages_by_name[message.name.lower()] = message
+
+
+    def load_streaming(self, filename, sections = None):
+        # Build the model from incremental parse events rather than a complete DOM. Each
+        # datatype, codeSet, field, component, group, and message element is turned into
+        # its model object as soon as it closes and is then detached from its section so
+        # peak memory is bounded by the largest single entity rather than the whole file.
+        # If sections is specified only those sections are built, the others are discarded
+        # as they are read, and parsing stops as soon as the last requested section closes.
+        handlers = {
+            '{%s}datatypes' % (fixr_namespace)  : ('datatypes', '{%s}datatype' % (fixr_namespace), self.load_data_type),
+            '{%s}codeSets' % (fixr_namespace)   : ('codeSets', '{%s}codeSet' % (fixr_namespace), self.load_code_set),
+            '{%s}fields' % (fixr_namespace)     : ('fields', '{%s}field' % (fixr_namespace), self.load_field),
+            '{%s}components' % (fixr_namespace) : ('components', '{%s}component' % (fixr_namespace), self.load_component),
+            '{%s}groups' % (fixr_namespace)     : ('groups', '{%s}group' % (fixr_namespace), self.load_group),
+            '{%s}messages' % (fixr_namespace)   : ('messages', '{%s}message' % (fixr_namespace), self.load_message)
+        }
+        remaining = set(self.sections if sections is None else sections)
+        repository = None
+        section = None
+        with open(filename, 'rb') as source:
+            for event, element in ET.iterparse(source, events=('start', 'end')):
+                if event == 'start':
+                    if repository is None:
+                        repository = element
+                        self.load_meta_data(repository)
+                        if len(remaining) == 0:
+                            break
+                    elif section is None and element.tag in handlers:
+                        section = element
+                        name, entity_tag, load_entity = handlers[element.tag]
+                        if name not in remaining:
+                            load_entity = None
+                    continue
+                if section is None:
+                    continue
+                if element is section:
+                    repository.remove(section)
+                    section = None
+                    remaining.discard(name)
+                    if len(remaining) == 0:
+                        break
+                elif element.tag == entity_tag:
+                    if load_entity:
+                        load_entity(element)
+                    section.remove(element)
 
     
     def create_xml_metadata(self, root):
@@ -678,6 +1279,8 @@ class Orchestration:
     def to_xml(self):
         # <?xml version="1.0" encoding="UTF-8"?>
         # <fixr:repository xmlns:xs="http://www.w3.org/2001/XMLSchema" xmlns:functx="http://www.functx.com" xmlns:fixr="http://fixprotocol.io/2020/orchestra/repository" xmlns:dc="http://purl.org/dc/elements/1.1/" name="FIX.4.2" version="FIX.4.2" specUrl="http://www.fixprotocol.org/specifications/fix4.2spec" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+        self.require_sections(*self.sections)
+
         for prefix, uri in namespaces.items():
             ET.register_namespace(prefix, uri)
 
@@ -697,8 +1300,434 @@ class Orchestration:
         return root
 
 
+    def write_xml(self, file):
+        # Write the complete document, with the XML declaration, straight to a file. The
+        # output is identical to ET.dump(indent(to_xml())), see test_write_xml, without
+        # building a tree.
+        self.require_sections(*self.sections)
+        XmlWriter(self, file).write()
+
+
+
+class XmlWriter:
+    # Streams an orchestration as XML in the same form as serialising to_xml() after the
+    # classic ElementTree indent() recipe, see test_write_xml. That puts the first child of
+    # an element on a new line indented one level deeper than the element and every
+    # element's closing tag, and so the siblings that follow it, indented one level
+    # shallower than the element itself.
+
+    def __init__(self, orchestration, file):
+        self.orchestration = orchestration
+        self.write_text = file.write
+
+    def escape_text(self, text):
+        if '&' in text:
+            text = text.replace('&', '&amp;')
+        if '<' in text:
+            text = text.replace('<', '&lt;')
+        if '>' in text:
+            text = text.replace('>', '&gt;')
+        return text
+
+    def escape_attribute(self, value):
+        value = self.escape_text(value)
+        if '"' in value:
+            value = value.replace('"', '&quot;')
+        if '\r' in value:
+            value = value.replace('\r', '&#13;')
+        if '\n' in value:
+            value = value.replace('\n', '&#10;')
+        if '\t' in value:
+            value = value.replace('\t', '&#09;')
+        return value
+
+    def tail(self, level):
+        return '\n' + '  ' * (level - 1) if level else '\n'
+
+    def start_tag(self, tag, attributes):
+        return '<' + tag + ''.join(' {}="{}"'.format(name, self.escape_attribute(value)) for name, value in attributes)
+
+    def start(self, level, tag, attributes = ()):
+        # An element with children.
+        self.write_text(self.start_tag(tag, attributes) + '>\n' + '  ' * (level + 1))
+
+    def end(self, level, tag):
+        self.write_text('</' + tag + '>' + self.tail(level))
+
+    def leaf(self, level, tag, attributes = (), text = None):
+        if text:
+            self.write_text(self.start_tag(tag, attributes) + '>' + self.escape_text(text) + '</' + tag + '>' + self.tail(level))
+        else:
+            self.write_text(self.start_tag(tag, attributes) + ' />' + self.tail(level))
+
+    def pedigree(self, pedigree):
+        attributes = []
+        if pedigree.added:
+            attributes.append(('added', pedigree.added))
+        if self.orchestration.ep_is_valid(pedigree.addedEP):
+            attributes.append(('addedEP', pedigree.addedEP))
+        if pedigree.updated:
+            attributes.append(('updated', pedigree.updated))
+        if self.orchestration.ep_is_valid(pedigree.updatedEP):
+            attributes.append(('updatedEP', pedigree.updatedEP))
+        if pedigree.deprecated:
+            attributes.append(('deprecated', pedigree.deprecated))
+        if self.orchestration.ep_is_valid(pedigree.deprecatedEP):
+            attributes.append(('deprecatedEP', pedigree.deprecatedEP))
+        return attributes
+
+    def synopsis(self, level, synopsis):
+        self.start(level, 'fixr:annotation')
+        self.leaf(level + 1, 'fixr:documentation', [('purpose', 'SYNOPSIS')], synopsis)
+        self.end(level, 'fixr:annotation')
+
+    def write(self):
+        orchestration = self.orchestration
+        self.write_text('<?xml version="1.0" encoding="UTF-8"?>\n')
+        self.start(0, 'fixr:repository', [('xmlns:dc', dc_namespace), ('xmlns:fixr', fixr_namespace), ('version', orchestration.version), ('name', orchestration.version)])
+        self.write_metadata()
+        self.write_section('fixr:datatypes', orchestration.data_types.values(), self.write_data_type)
+        self.write_section('fixr:codeSets', orchestration.code_sets.values(), self.write_code_set)
+        self.write_section('fixr:fields', orchestration.fields_by_tag.values(), self.write_field)
+        self.write_section('fixr:components', orchestration.components.values(), self.write_component)
+        self.write_section('fixr:groups', orchestration.groups.values(), self.write_group)
+        self.write_section('fixr:messages', orchestration.messages_by_msg_type.values(), self.write_message)
+        self.end(0, 'fixr:repository')
+
+    def write_metadata(self):
+        self.start(1, 'fixr:metadata')
+        self.leaf(2, 'dc:title', text='Orchestra')
+        self.leaf(2, 'dc:creator', text='https://github.com/GaryHughes/fixorchestra')
+        self.leaf(2, 'dc:publisher', text='Gary Hughes')
+        self.leaf(2, 'dc:date', text=datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%f UTC'))
+        self.leaf(2, 'dc:format', text='Orchestra schema')
+        self.leaf(2, 'dc:source', text='FIX Unified Repository')
+        self.end(1, 'fixr:metadata')
+
+    def write_section(self, tag, values, write_value):
+        values = list(values)
+        if not values:
+            self.leaf(1, tag)
+            return
+        self.start(1, tag)
+        for value in values:
+            write_value(value)
+        self.end(1, tag)
+
+    def write_data_type(self, source):
+        attributes = [('name', source.name)] + self.pedigree(source.pedigree)
+        if source.base_type:
+            attributes.append(('baseType', source.base_type))
+        if not source.synopsis:
+            self.leaf(2, 'fixr:datatype', attributes)
+            return
+        self.start(2, 'fixr:datatype', attributes)
+        self.synopsis(3, source.synopsis)
+        self.end(2, 'fixr:datatype')
+
+    def write_code_set(self, source):
+        attributes = [('name', source.name), ('id', str(source.id)), ('type', source.type)]
+        if not source.codes and not source.synopsis:
+            self.leaf(2, 'fixr:codeSet', attributes)
+            return
+        self.start(2, 'fixr:codeSet', attributes)
+        # The code pedigree is the code set's to match to_xml().
+        pedigree = self.pedigree(source.pedigree)
+        for code in source.codes:
+            self.start(3, 'fixr:code', [('name', code.name), ('id', str(code.id)), ('value', code.value)] + pedigree)
+            self.synopsis(4, code.synopsis)
+            self.end(3, 'fixr:code')
+        if source.synopsis:
+            self.synopsis(3, source.synopsis)
+        self.end(2, 'fixr:codeSet')
+
+    def write_field(self, source):
+        attributes = [('id', str(source.id)), ('name', source.name), ('type', source.type)]
+        if source.discriminator_id:
+            attributes.append(('discriminatorId', str(source.discriminator_id)))
+        self.start(2, 'fixr:field', attributes + self.pedigree(source.pedigree))
+        if source.synopsis:
+            self.synopsis(3, source.synopsis)
+        else:
+            self.leaf(3, 'fixr:annotation')
+        self.end(2, 'fixr:field')
+
+    def write_references(self, level, references):
+        for reference in references:
+            if reference.field_id:
+                tag = 'fixr:fieldRef'
+            elif reference.component_id:
+                tag = 'fixr:componentRef'
+            elif reference.group_id:
+                tag = 'fixr:groupRef'
+            else:
+                continue
+            attributes = [('id', str(reference.id))] + self.pedigree(reference.pedigree)
+            if reference.presence:
+                attributes.append(('presence', reference.presence))
+            if not reference.synopsis:
+                self.leaf(level, tag, attributes)
+                continue
+            self.start(level, tag, attributes)
+            self.synopsis(level + 1, reference.synopsis)
+            self.end(level, tag)
+
+    def write_component(self, source):
+        attributes = [('name', source.name), ('id', str(source.id)), ('category', source.category)] + self.pedigree(source.pedigree)
+        if not source.references and not source.synopsis:
+            self.leaf(2, 'fixr:component', attributes)
+            return
+        self.start(2, 'fixr:component', attributes)
+        self.write_references(3, source.references)
+        if source.synopsis:
+            self.synopsis(3, source.synopsis)
+        self.end(2, 'fixr:component')
+
+    def write_group(self, source):
+        attributes = [('id', str(source.id)), ('name', source.name), ('category', source.category)] + self.pedigree(source.pedigree)
+        if not source.references:
+            self.leaf(2, 'fixr:group', attributes)
+            return
+        self.start(2, 'fixr:group', attributes)
+        self.write_references(3, source.references)
+        self.end(2, 'fixr:group')
+
+    def write_message(self, source):
+        self.start(2, 'fixr:message', [('name', source.name), ('id', str(source.id)), ('msgType', source.msg_type), ('category', source.category)] + self.pedigree(source.pedigree))
+        if source.references:
+            self.start(3, 'fixr:structure')
+            self.write_references(4, source.references)
+            self.end(3, 'fixr:structure')
+        else:
+            self.leaf(3, 'fixr:structure')
+        if source.synopsis:
+            self.synopsis(3, source.synopsis)
+        self.end(2, 'fixr:message')
+
+
+
+class ExpatRecord:
+    # The state accumulated for an element that becomes a model object when it closes.
+    __slots__ = ('attributes', 'synopsis', 'children')
+
+    def __init__(self, attributes):
+        self.attributes = attributes
+        self.synopsis = None
+        self.children = []
+
+
+class ExpatLoader:
+    # Builds the same model as the tree loader in a single expat pass. Tags are dispatched
+    # through tables keyed by the namespace qualified names expat reports, built once,
+    # rather than evaluating XPath expressions and formatting tag names for every element.
+    #
+    # Each open element has a frame on the stack recording what its children mean to us.
+    OTHER = 0           # nothing of interest
+    OWNER = 1           # record can have a synopsis, and for components and groups references
+    ANNOTATION = 2      # record is the owner of this annotation
+    STRUCTURE = 3       # record is the message these references belong to
+
+    def __init__(self, orchestration):
+        self.orchestration = orchestration
+        fixr = fixr_namespace + ' '
+        self.repository_tag = fixr + 'repository'
+        self.annotation_tag = fixr + 'annotation'
+        self.documentation_tag = fixr + 'documentation'
+        self.structure_tag = fixr + 'structure'
+        self.owner_tags = {
+            fixr + 'datatype'     : self.end_data_type,
+            fixr + 'codeSet'      : self.end_code_set,
+            fixr + 'code'         : self.end_code,
+            fixr + 'field'        : self.end_field,
+            fixr + 'component'    : self.end_component,
+            fixr + 'group'        : self.end_group,
+            fixr + 'message'      : self.end_message,
+            fixr + 'fieldRef'     : self.end_field_ref,
+            fixr + 'numInGroup'   : self.end_field_ref,
+            fixr + 'groupRef'     : self.end_group_ref,
+            fixr + 'componentRef' : self.end_component_ref
+        }
+        self.reference_tags = frozenset([fixr + 'fieldRef', fixr + 'numInGroup', fixr + 'groupRef', fixr + 'componentRef'])
+        self.reference_containers = frozenset([fixr + 'component', fixr + 'group'])
+        self.stack = []
+        self.text = None
+        self.text_owner = None
+
+    def load(self, filename):
+        parser = xml.parsers.expat.ParserCreate(namespace_separator=' ')
+        parser.buffer_text = True
+        parser.StartElementHandler = self.start_element
+        parser.EndElementHandler = self.end_element
+        parser.CharacterDataHandler = self.character_data
+        with open(filename, 'rb') as file:
+            parser.ParseFile(file)
+
+    def extract_pedigree(self, attributes):
+        return Pedigree.intern(
+            attributes.get('added'),
+            attributes.get('addedEP'),
+            attributes.get('updated'),
+            attributes.get('updatedEP'),
+            attributes.get('deprecated'),
+            attributes.get('deprecatedEP')
+        )
+
+    def flush_text(self):
+        # The synopsis is the text of the documentation element up to its first child.
+        if self.text is not None:
+            self.text_owner.synopsis = ''.join(self.text).strip()
+            self.text = None
+
+    def start_element(self, tag, attributes):
+        self.flush_text()
+        if len(self.stack) == 0:
+            if tag == self.repository_tag:
+                self.orchestration.load_meta_data(attributes)
+            self.stack.append((tag, ExpatLoader.OTHER, None))
+            return
+        parent_tag, parent_kind, parent = self.stack[-1]
+        if parent_kind == ExpatLoader.STRUCTURE or (parent_kind == ExpatLoader.OWNER and parent_tag in self.reference_containers):
+            if tag not in self.reference_tags and tag != self.annotation_tag:
+                raise Exception('Unexpected component element type {{{}}}{}'.format(*tag.split(' ', 1)))
+        if tag in self.owner_tags:
+            self.stack.append((tag, ExpatLoader.OWNER, ExpatRecord(attributes)))
+        elif tag == self.annotation_tag and parent_kind == ExpatLoader.OWNER:
+            self.stack.append((tag, ExpatLoader.ANNOTATION, parent))
+        elif tag == self.documentation_tag and parent_kind == ExpatLoader.ANNOTATION:
+            if parent.synopsis is None and attributes.get('purpose') == 'SYNOPSIS':
+                parent.synopsis = ''
+                self.text = []
+                self.text_owner = parent
+            self.stack.append((tag, ExpatLoader.OTHER, None))
+        elif tag == self.structure_tag and parent_kind == ExpatLoader.OWNER:
+            self.stack.append((tag, ExpatLoader.STRUCTURE, parent))
+        else:
+            self.stack.append((tag, ExpatLoader.OTHER, None))
+
+    def character_data(self, data):
+        if self.text is not None:
+            self.text.append(data)
+
+    def end_element(self, tag):
+        self.flush_text()
+        tag, kind, record = self.stack.pop()
+        if kind == ExpatLoader.OWNER:
+            if record.synopsis is None:
+                record.synopsis = ''
+            self.owner_tags[tag](record)
+
+    def end_data_type(self, record):
+        attributes = record.attributes
+        dataType = DataType(
+            attributes.get('name'),
+            attributes.get('baseType'),
+            record.synopsis,
+            self.extract_pedigree(attributes)
+        )
+        self.orchestration.data_types[dataType.name] = dataType
+
+    def end_code(self, record):
+        attributes = record.attributes
+        code = Code(
+            attributes.get('id'),
+            attributes.get('name'),
+            attributes.get('value'),
+            record.synopsis,
+            self.extract_pedigree(attributes)
+        )
+        self.stack[-1][2].children.append(code)
+
+    def end_code_set(self, record):
+        attributes = record.attributes
+        code_set = CodeSet(
+            attributes.get('id'),
+            attributes.get('name'),
+            attributes.get('type'),
+            record.synopsis,
+            self.extract_pedigree(attributes),
+            record.children
+        )
+        self.orchestration.code_sets[code_set.name] = code_set
+
+    def end_field(self, record):
+        attributes = record.attributes
+        field = Field(
+            int(attributes.get('id')),
+            attributes.get('name'),
+            attributes.get('type'),
+            record.synopsis,
+            self.extract_pedigree(attributes),
+            attributes.get('discriminatorId')
+        )
+        self.orchestration.fields_by_tag[field.id] = field
+        self.orchestration.fields_by_name[field.name.lower()] = field
+
+    def end_component(self, record):
+        attributes = record.attributes
+        component = Component(
+            attributes.get('id'),
+            attributes.get('name'),
+            attributes.get('category'),
+            record.synopsis,
+            self.extract_pedigree(attributes),
+            record.children
+        )
+        self.orchestration.components[component.id] = component
+
+    def end_group(self, record):
+        attributes = record.attributes
+        group = Group(
+            attributes.get('id'),
+            attributes.get('name'),
+            attributes.get('category'),
+            record.synopsis,
+            self.extract_pedigree(attributes),
+            record.children
+        )
+        self.orchestration.groups[group.id] = group
+
+    def end_message(self, record):
+        attributes = record.attributes
+        message = Message(
+            attributes.get('id'),
+            attributes.get('name'),
+            attributes.get('msgType'),
+            attributes.get('category'),
+            record.synopsis,
+            self.extract_pedigree(attributes),
+            record.children
+        )
+        self.orchestration.messages[message.id] = message
+        self.orchestration.messages_by_msg_type[message.msg_type] = message
+        self.orchestration.messages_by_name[message.name.lower()] = message
+
+    def add_reference(self, record, field_id, group_id, component_id):
+        attributes = record.attributes
+        reference = Reference(
+            field_id,
+            group_id,
+            component_id,
+            attributes.get('presence'),
+            record.synopsis,
+            self.extract_pedigree(attributes)
+        )
+        # The enclosing frame is either a component or group or a message structure
+        # and in all cases the record it holds is the owner of the references.
+        self.stack[-1][2].children.append(reference)
+
+    def end_field_ref(self, record):
+        self.add_reference(record, int(record.attributes.get('id')), None, None)
+
+    def end_group_ref(self, record):
+        self.add_reference(record, None, record.attributes.get('id'), None)
+
+    def end_component_ref(self, record):
+        self.add_reference(record, None, None, record.attributes.get('id'))
+
+
 
 def dump_field(orchestration, tag_or_name):
+    orchestration.require_sections('fields', 'codeSets')
     try:
         field = orchestration.fields_by_tag[int(tag_or_name)]
     except (KeyError, ValueError):
@@ -744,6 +1773,7 @@ def dump_references(orchestration, references, depth):
 
 
 def dump_message(orchestration, msg_type_or_name):
+    orchestration.require_sections('messages', 'fields', 'components', 'groups')
     try:
         message = orchestration.messages_by_msg_type[msg_type_or_name]
     except KeyError:
@@ -764,6 +1794,89 @@ def dump_message(orchestration, msg_type_or_name):
     print("}")
 
 
+def find_used(orchestration, tag_or_name):
+    # (kind, entity) for the field with a tag or name or failing that the group or component
+    # with a name, None if there isn't one.
+    try:
+        return (Reference.FIELD, orchestration.fields_by_tag[int(tag_or_name)])
+    except (KeyError, ValueError):
+        pass
+    try:
+        return (Reference.FIELD, orchestration.fields_by_name[tag_or_name.lower()])
+    except KeyError:
+        pass
+    for kind, entities in ((Reference.GROUP, orchestration.groups), (Reference.COMPONENT, orchestration.components)):
+        for entity in entities.values():
+            if entity.name.lower() == tag_or_name.lower():
+                return (kind, entity)
+    return None
+
+
+def dump_where_used(orchestration, tag_or_name):
+    orchestration.require_sections('fields', 'components', 'groups', 'messages')
+    used = find_used(orchestration, tag_or_name)
+    if used is None:
+        print("Could not find a field with Tag or Name, or a group or component with Name = '{}'".format(tag_or_name))
+        return
+    kind, entity = used
+    names = {}
+    print("{} (Kind = {}, Id = {}) {{".format(entity.name, kind, entity.id))
+    for usage in orchestration.where_used(kind, entity.id):
+        if usage.kind == 'message':
+            identity = 'MsgType = ' + usage.user.msg_type
+        else:
+            identity = 'Id = ' + str(usage.user.id)
+        line = "    {} {} ({}, Presence = {}, Depth = {}".format(usage.kind, usage.user.name, identity, usage.presence, usage.depth)
+        if usage.path:
+            via = []
+            for id in usage.path:
+                try:
+                    via.append(names[id])
+                except KeyError:
+                    container = orchestration.groups.get(id) or orchestration.components.get(id)
+                    names[id] = container.name
+                    via.append(container.name)
+            line += ", Via = " + " > ".join(via)
+        print(line + ")")
+    print("}")
+
+
+def decode_log(orchestration, filename, separator = tagvalue.SOH):
+    # Yields (offset, message, [(tag, field, value, value_name)]) for each message in a log.
+    # The log is memory mapped and decoded one message at a time so it can be any size. The
+    # message, field, and value_name are None when not defined in the orchestration, each
+    # value of a multiple value field is named with unknown values left as they are.
+    orchestration.require_sections('codeSets', 'fields', 'messages')
+    buffer = tagvalue.map_file(filename)
+    for offset, raw in tagvalue.iter_messages(buffer, separator):
+        message = None
+        fields = []
+        for tag, value, codes in orchestration.decode_values(tagvalue.parse_fields(raw, separator)):
+            value_name = None
+            if any(codes):
+                if len(codes) == 1:
+                    value_name = codes[0].name
+                else:
+                    value_name = ' '.join(code.name if code else token for code, token in zip(codes, value.split(' ')))
+            if tag == 35:
+                message = orchestration.messages_by_msg_type.get(value)
+            fields.append((tag, orchestration.fields_by_tag.get(tag), value, value_name))
+        yield offset, message, fields
+
+
+def dump_decoded_message(offset, message, fields):
+    print('{} (Offset = {}) {{'.format(message.name if message else 'Unknown', offset))
+    for tag, field, value, value_name in fields:
+        if field is None:
+            line = '    {} = {}'.format(tag, value)
+        else:
+            line = '    {} ({}) = {}'.format(field.name, tag, value)
+        if value_name is not None:
+            line += ' ({})'.format(value_name)
+        print(line)
+    print('}')
+
+
 def list_messages(orchestration):
     for message in orchestration.messages_by_msg_type.values():
         print('{}\t{}'.format(message.msg_type, message.name))
@@ -775,6 +1888,7 @@ def list_fields(orchestration):
 
 
 def list_enumerated_fields(orchestration):
+    orchestration.require_sections('fields', 'codeSets')
     for field in orchestration.fields_by_tag.values():
         try:
             _ = orchestration.code_sets[field.type]
@@ -793,12 +1907,50 @@ def list_components(repository):
         print('{} (Id={})'.format(component.name, component.id))
 
 
+def query_commands(orchestration, cache_directory = None, search_limit = 20):
+    # The queries answered by --batch and --shell, see shell.py.
+    fields = lambda: [field.name for field in orchestration.fields_by_tag.values()]
+    messages = lambda: [message.name for message in orchestration.messages_by_msg_type.values()]
+    used = lambda: fields() + [group.name for group in orchestration.groups.values()] + [component.name for component in orchestration.components.values()]
+    return {
+        'field' : shell.Command(lambda argument: dump_field(orchestration, argument), 'Display the definition of a field by tag or name', fields),
+        'message' : shell.Command(lambda argument: dump_message(orchestration, argument), 'Display the definition of a message by MsgType or name', messages),
+        'where-used' : shell.Command(lambda argument: dump_where_used(orchestration, argument), 'Display everything that uses a field by tag or name, or a group or component by name', used),
+        'search' : shell.Command(lambda argument: search.dump_search(orchestration.search_index(cache_directory), argument, search_limit), 'Display the best matches for some terms'),
+        'list-messages' : shell.Command(lambda argument: list_messages(orchestration), 'List all the messages'),
+        'list-fields' : shell.Command(lambda argument: list_fields(orchestration), 'List all the fields'),
+        'list-enumerated-fields' : shell.Command(lambda argument: list_enumerated_fields(orchestration), 'List all fields with an enumerated value'),
+        'list-groups' : shell.Command(lambda argument: list_groups(orchestration), 'List all the groups'),
+        'list-components' : shell.Command(lambda argument: list_components(orchestration), 'List all the components'),
+    }
+
+
 def main():
 
     parser = argparse.ArgumentParser()
-    parser.add_argument('--orchestration', required=True, metavar='file', help='The orchestration to load')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--orchestration', metavar='file', help='The orchestration to load')
+    source.add_argument('--database', metavar='file', help='Query a database written by --export-database instead of loading an orchestration')
+    parser.add_argument('--loader', default='tree', choices=Orchestration.loaders, help='The XML loading strategy, streaming bounds peak memory during the load, lazy only parses sections when they are first used, and expat is the fastest single pass parser')
+    parser.add_argument('--cache-directory', default=snapshot.default_cache_directory(), metavar='directory', help='Where snapshots of loaded orchestrations are kept (default $FIXORCHESTRA_CACHE or ~/.cache/fixorchestra)')
+    parser.add_argument('--no-cache', default=False, action='store_true', help='Always parse the XML and do not read or write a snapshot')
+    parser.add_argument('--compile', default=False, action='store_true', help='Parse the orchestration, write its snapshot to the cache, and exit')
+    parser.add_argument('--generate-module', required=False, metavar='file', help='Write the orchestration as an importable Python module e.g. fix44_dict.py and exit')
+    parser.add_argument('--export-database', required=False, metavar='file', help='Write the orchestration to a SQLite database and exit')
+    parser.add_argument('--profile', default=False, action='store_true', help='Display the time and memory taken by each phase of the load, and the number and size of the objects loaded, on stderr (use --no-cache to profile parsing the XML, tracing memory makes the load 2-3x slower)')
+    parser.add_argument('--fingerprint', default=False, action='store_true', help='Display the content fingerprint of the orchestration, it changes if and only if the content does')
     parser.add_argument('--dump-field', required=False, metavar='(tag|name)', type=str, help='Display the definition of a field')
     parser.add_argument('--dump-message', required=False, metavar='(msgtype|name)', help='Display the definition of a message')
+    parser.add_argument('--search', required=False, metavar='terms', help='Display the fields, codes, components, groups, and messages whose names or synopses best match the terms')
+    parser.add_argument('--search-limit', default=20, type=int, metavar='N', help='The number of --search results to display (default 20)')
+    parser.add_argument('--where-used', required=False, metavar='(tag|name)', help='Display every message, group, and component that uses a field, or a group or component by name, directly or through other groups and components')
+    parser.add_argument('--diff', required=False, metavar='file', help='Display the differences between this orchestration and a newer one e.g. the next extension pack')
+    parser.add_argument('--decode-log', required=False, metavar='file', help='Display each tag=value message in a log with field and value names')
+    parser.add_argument('--separator', default='\x01', metavar='char', help='The field separator for --decode-log, defaults to SOH, | is common in logs')
+    parser.add_argument('--batch', required=False, metavar='file', help='Answer the queries in a file, - for stdin, one per line e.g. field 54 or message NewOrderSingle')
+    parser.add_argument('--shell', default=False, action='store_true', help='Answer queries typed into an interactive shell with tab completion')
+    parser.add_argument('--serve', required=False, metavar='address', help='Keep the orchestration loaded and answer JSON queries over HTTP on [host:]port or on a Unix socket path until interrupted')
+    parser.add_argument('--serve-also', default=[], action='append', metavar='file', help='Another orchestration to --serve, may be repeated')
     parser.add_argument('--list-messages', default=False, action='store_true', help='List all the messages in this orchestration')
     parser.add_argument('--list-fields', default=False, action='store_true', help='List all the fields in this orchestration')
     parser.add_argument('--list-enumerated-fields', default=False, action='store_true', help='List all fields with an enumerated value')
@@ -807,7 +1959,40 @@ def main():
 
     args = parser.parse_args()
 
-    orchestration = Orchestration(args.orchestration)
+    # database imports this module so it can't be imported at the top.
+    from fixorchestra import database
+
+    if args.database:
+        if args.compile or args.generate_module or args.export_database or args.decode_log or args.diff or args.fingerprint or args.serve or args.profile:
+            parser.error('--compile, --generate-module, --export-database, --decode-log, --diff, --fingerprint, --serve, and --profile require --orchestration')
+        orchestration = database.Database(args.database)
+    elif args.compile:
+        orchestration = Orchestration(args.orchestration, args.loader)
+        print(orchestration.save_snapshot(args.cache_directory))
+        return
+    else:
+        profile = profiling.Profile() if args.profile else None
+        with profiling.phase(profile, 'load'):
+            orchestration = Orchestration(args.orchestration, args.loader, None if args.no_cache else args.cache_directory, profile)
+        if profile:
+            profile.report(profiling.orchestration_objects(orchestration))
+
+    if args.generate_module:
+        print(codegen.write_module(orchestration, args.generate_module))
+        return
+
+    if args.export_database:
+        print(database.export(orchestration, args.export_database))
+        return
+
+    if args.serve:
+        from fixorchestra import server
+        orchestrations = [orchestration] + [Orchestration(filename, args.loader, None if args.no_cache else args.cache_directory) for filename in args.serve_also]
+        server.serve(orchestrations, args.serve)
+        return
+
+    if args.fingerprint:
+        print(orchestration.orchestration_fingerprint())
 
     if args.dump_field:
         dump_field(orchestration, args.dump_field)
@@ -815,6 +2000,20 @@ def main():
     if args.dump_message:
         dump_message(orchestration, args.dump_message)
 
+    if args.where_used:
+        dump_where_used(orchestration, args.where_used)
+
+    if args.search:
+        search.dump_search(orchestration.search_index(None if args.no_cache else args.cache_directory), args.search, args.search_limit)
+
+    if args.diff:
+        other = Orchestration(args.diff, args.loader, None if args.no_cache else args.cache_directory)
+        diff.dump_diff(diff.diff(orchestration, other))
+
+    if args.decode_log:
+        for offset, message, fields in decode_log(orchestration, args.decode_log, args.separator.encode('latin-1')):
+            dump_decoded_message(offset, message, fields)
+
     if args.list_messages:
         list_messages(orchestration)
 
@@ -830,6 +2029,21 @@ def main():
     if args.list_components:
         list_components(orchestration)
 
+    cache_directory = None if args.no_cache else args.cache_directory
+
+    if args.batch:
+        commands = query_commands(orchestration, cache_directory, args.search_limit)
+        if args.batch == '-':
+            failures = shell.run_batch(commands, sys.stdin)
+        else:
+            with open(args.batch) as file:
+                failures = shell.run_batch(commands, file)
+        if failures:
+            sys.exit(1)
+
+    if args.shell:
+        shell.Shell(query_commands(orchestration, cache_directory, args.search_limit), 'fixorchestra> ').cmdloop()
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,228 @@
+import contextlib
+import sys
+import time
+import tracemalloc
+
+#
+# Where the time and memory of loading a model, and of auditing or converting it, goes so
+# that when an extension pack makes startup slower the section responsible can be found.
+#
+# A Profile records a Phase for each step it is asked to time, phases nest so loading an
+# orchestration is one phase made up of load_fields, load_messages etc. The memory of a
+# phase is the change in the memory traced by tracemalloc, i.e. what the phase allocated
+# and did not free, which for a load phase is roughly the size of what it built. Tracing
+# makes everything it traces slower, typically by 2-3x, so the absolute times are only
+# comparable with other profiled runs.
+#
+# A Profile also records the number of objects of each entity type in a model and how many
+# bytes they take. The bytes of an object include the strings and containers it holds but
+# not the other model objects it refers to, which are counted as their own type, and shared
+# values such as interned pedigrees or names are only counted once.
+#
+#   profile = Profile()
+#   with profile.phase('load'):
+#       orchestration = Orchestration(filename, profile=profile)
+#   profile.count(orchestration_objects(orchestration))
+#   profile.dump()
+#
+
+format_version = 1
+
+
+class Phase:
+
+    __slots__ = ('name', 'depth', 'seconds', 'allocated')
+
+    def __init__(self, name, depth):
+        self.name = name
+        self.depth = depth      # The number of phases this phase is nested within
+        self.seconds = 0.0
+        self.allocated = None   # Bytes, None if memory is not being traced
+
+    def to_json(self):
+        return { name : getattr(self, name) for name in self.__slots__ }
+
+
+class Profile:
+
+    def __init__(self, trace_memory = True):
+        self.phases = []    # [Phase] in the order they started
+        self.objects = {}   # entity type -> (count, bytes)
+        self.depth = 0
+        self.peak = None    # The peak traced memory in bytes once closed
+        # Only stop tracing when closed if this profile started it.
+        self.tracing = trace_memory and not tracemalloc.is_tracing()
+        if self.tracing:
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        phase = Phase(name, self.depth)
+        self.phases.append(phase)
+        self.depth += 1
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield phase
+        finally:
+            phase.seconds = time.perf_counter() - start
+            if tracing:
+                phase.allocated = tracemalloc.get_traced_memory()[0] - before
+            self.depth -= 1
+
+    def count(self, objects):
+        # objects is entity type -> [object] e.g. from orchestration_objects().
+        seen = set()
+        for kind, values in objects.items():
+            self.objects[kind] = (len(values), sum(object_size(value, seen) for value in values))
+
+    def close(self):
+        if tracemalloc.is_tracing():
+            self.peak = tracemalloc.get_traced_memory()[1]
+        if self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
+
+    def report(self, objects, file = None):
+        # Finish profiling a model and display the results.
+        self.count(objects)
+        self.close()
+        self.dump(file)
+
+    def to_json(self):
+        return {
+            'format_version' : format_version,
+            'phases' : [phase.to_json() for phase in self.phases],
+            'objects' : { kind : { 'count' : count, 'bytes' : size } for kind, (count, size) in self.objects.items() },
+            'peak' : self.peak,
+        }
+
+    def dump(self, file = None):
+        # The report goes to stderr by default so it can't corrupt output written to stdout.
+        file = file or sys.stderr
+        width = max([len(phase.name) + 2 * phase.depth for phase in self.phases] + [len(kind) for kind in self.objects] + [5])
+        if self.phases:
+            file.write('{}  {:>10}  {:>12}\n'.format('Phase'.ljust(width), 'Seconds', 'Allocated'))
+            for phase in self.phases:
+                name = '  ' * phase.depth + phase.name
+                file.write('{}  {:>10.3f}  {:>12}\n'.format(name.ljust(width), phase.seconds, format_bytes(phase.allocated)))
+        if self.objects:
+            file.write('{}  {:>10}  {:>12}\n'.format('Objects'.ljust(width), 'Count', 'Bytes'))
+            for kind, (count, size) in self.objects.items():
+                file.write('{}  {:>10}  {:>12}\n'.format(kind.ljust(width), count, format_bytes(size)))
+            file.write('{}  {:>10}  {:>12}\n'.format('total'.ljust(width), sum(count for count, _ in self.objects.values()), format_bytes(sum(size for _, size in self.objects.values()))))
+        if self.peak is not None:
+            file.write('Peak traced memory {}\n'.format(format_bytes(self.peak)))
+
+
+class NotProfiling:
+    # Stands in for a phase when nothing is being profiled.
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exception):
+        return False
+
+
+def phase(profile, name):
+    # A phase of profile, or nothing if profile is None, so callers need not check.
+    if profile is None:
+        return NotProfiling()
+    return profile.phase(name)
+
+
+def format_bytes(size):
+    if size is None:
+        return '-'
+    if abs(size) < 1024:
+        return '{} B'.format(size)
+    for unit in ('KiB', 'MiB', 'GiB'):
+        size /= 1024
+        if abs(size) < 1024 or unit == 'GiB':
+            return '{:.1f} {}'.format(size, unit)
+
+
+def slot_names(cls):
+    return [name for base in cls.__mro__ for name in getattr(base, '__slots__', ())]
+
+
+def object_size(root, seen):
+    # The bytes of a model object, all of which are slotted, and of the values and containers
+    # it holds that are not themselves model objects or in seen.
+    size = 0
+    pending = [root]
+    while pending:
+        value = pending.pop()
+        if id(value) in seen:
+            continue
+        slots = getattr(type(value), '__slots__', None)
+        if slots is not None and value is not root:
+            continue
+        seen.add(id(value))
+        size += sys.getsizeof(value)
+        if isinstance(value, dict):
+            pending.extend(value.keys())
+            pending.extend(value.values())
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            pending.extend(value)
+        elif slots is not None:
+            pending.extend(getattr(value, name, None) for name in slot_names(type(value)))
+    return size
+
+
+def unique(values):
+    return list({ id(value) : value for value in values if value is not None }.values())
+
+
+def orchestration_objects(orchestration):
+    # The objects of each entity type in an orchestration. Sections a lazily loaded
+    # orchestration has not parsed yet are left out rather than being loaded to count them.
+    loaded = orchestration.__dict__
+    data_types = list(loaded.get('data_types', {}).values())
+    code_sets = list(loaded.get('code_sets', {}).values())
+    codes = [code for code_set in code_sets for code in code_set.codes]
+    fields = list(loaded.get('fields_by_tag', {}).values())
+    components = list(loaded.get('components', {}).values())
+    groups = list(loaded.get('groups', {}).values())
+    messages = list(loaded.get('messages_by_msg_type', {}).values())
+    references = [reference for owner in components + groups + messages for reference in owner.references]
+    entities = data_types + code_sets + codes + fields + components + groups + messages + references
+    # The dictionaries are counted last so they only account for their own keys and tables.
+    indexes = [loaded[name] for names in orchestration.sections.values() for name in names if name in loaded]
+    return {
+        'data types' : data_types,
+        'code sets' : code_sets,
+        'codes' : codes,
+        'fields' : fields,
+        'components' : components,
+        'groups' : groups,
+        'messages' : messages,
+        'references' : references,
+        'pedigrees' : unique(entity.pedigree for entity in entities),
+        'indexes' : indexes,
+    }
+
+
+def repository_objects(repository):
+    # The objects of each entity type in a repository.
+    data_types = list(repository.data_types.values())
+    enums = [enum for enums in repository.enums.values() for enum in enums]
+    fields = list(repository.fields_by_tag.values())
+    components = list(repository.components_by_id.values())
+    msg_contents = [content for contents in repository.msg_contents.values() for content in contents]
+    messages = list(repository.messages)
+    entities = data_types + enums + fields + components + msg_contents + messages
+    indexes = [getattr(repository, name) for name in repository.snapshot_attributes if name != 'version']
+    return {
+        'data types' : data_types,
+        'enums' : enums,
+        'fields' : fields,
+        'components' : components,
+        'msg contents' : msg_contents,
+        'messages' : messages,
+        'pedigrees' : unique(entity.pedigree for entity in entities),
+        'indexes' : indexes,
+    }
@@ -0,0 +1,120 @@
+import sys
+sys.path.append("..")
+from fixorchestra.orchestration import Orchestration
+from fixrepository.repository import Repository
+
+#
+# A Registry holds any number of orchestrations and repositories, typically one per FIX
+# version, in the same process. Names, synopses, descriptions, and pedigree values that
+# are identical across the loaded models are stored once in a shared string pool.
+#
+
+class Registry:
+
+    def __init__(self):
+        self.orchestrations = {}    # Orchestration.version -> Orchestration
+        self.repositories = {}      # Repository.version -> Repository
+        self.strings = {}           # str -> the single shared instance of that str
+
+
+    def load_orchestration(self, filename, loader = 'tree', cache_directory = None):
+        orchestration = Orchestration(filename, loader, cache_directory)
+        self.intern_model(orchestration)
+        self.orchestrations[orchestration.version] = orchestration
+        return orchestration
+
+
+    def load_repository(self, directory, cache_directory = None):
+        repository = Repository(directory, cache_directory)
+        self.intern_model(repository)
+        self.repositories[repository.version] = repository
+        return repository
+
+
+    def orchestration(self, version):
+        try:
+            return self.orchestrations[version]
+        except KeyError:
+            raise Exception("no orchestration with version '{}' has been loaded".format(version))
+
+
+    def repository(self, version):
+        try:
+            return self.repositories[version]
+        except KeyError:
+            raise Exception("no repository with version '{}' has been loaded".format(version))
+
+
+    def release_orchestration(self, version):
+        del self.orchestrations[version]
+        self.rebuild_strings()
+
+
+    def release_repository(self, version):
+        del self.repositories[version]
+        self.rebuild_strings()
+
+
+    def release_all(self):
+        self.orchestrations = {}
+        self.repositories = {}
+        self.strings = {}
+
+
+    def rebuild_strings(self):
+        # The pool would otherwise keep every string of a released model alive. The models
+        # that remain already share their strings so rebuilding just collects them again.
+        self.strings = {}
+        for model in list(self.orchestrations.values()) + list(self.repositories.values()):
+            self.intern_model(model)
+
+
+    def intern(self, string):
+        return self.strings.setdefault(string, string)
+
+
+    def intern_model(self, model):
+        # Only visit what has been loaded so a lazily loaded orchestration stays lazy,
+        # sections it parses later are not pooled.
+        seen = set()
+        for name in model.snapshot_attributes:
+            if name not in vars(model):
+                continue
+            value = getattr(model, name)
+            if isinstance(value, str):
+                setattr(model, name, self.intern(value))
+            elif isinstance(value, dict):
+                self.intern_index(value)
+                self.intern_values(value.values(), seen)
+            else:
+                self.intern_values(value, seen)
+
+
+    def intern_index(self, index):
+        items = list(index.items())
+        index.clear()
+        for key, value in items:
+            index[self.intern(key) if isinstance(key, str) else key] = value
+
+
+    def intern_values(self, values, seen):
+        for value in values:
+            if isinstance(value, (list, tuple)):
+                self.intern_values(value, seen)
+            elif hasattr(type(value), '__slots__') and id(value) not in seen:
+                seen.add(id(value))
+                self.intern_object(value, seen)
+
+
+    def intern_object(self, instance, seen):
+        # The model classes are all slotted, shared instances such as pedigrees are only 
+        # visited once.
+        for name in type(instance).__slots__:
+            value = getattr(instance, name)
+            if isinstance(value, str):
+                setattr(instance, name, self.intern(value))
+            elif isinstance(value, (list, tuple)):
+                self.intern_values(value, seen)
+            elif hasattr(type(value), '__slots__') and id(value) not in seen:
+                seen.add(id(value))
+                self.intern_object(value, seen)
@@ -0,0 +1,168 @@
+import math
+import re
+import sys
+sys.path.append("..")
+from fixorchestra import snapshot
+
+#
+# A ranked full text search over the names and descriptive text of the fields, codes,
+# components, groups, and messages in an orchestration or repository e.g. to find which
+# field means X. Names are split at case changes so PartyIDSource is found by party, id,
+# source, or partyidsource, and plurals are folded so orders finds order and parties party.
+#
+# Documents are ranked with BM25 where a word in a name counts name_weight times as much as
+# a word in the text, so a field called Price ranks above one that mentions price.
+#
+# An index is a plain object so it can be pickled and kept in the snapshot cache next to the
+# model it was built from, keyed on the same source files.
+#
+
+format_version = 1
+
+name_weight = 3
+
+# The usual BM25 parameters, k1 for term frequency saturation and b for length normalisation.
+k1 = 1.2
+b = 0.75
+
+word = re.compile('[A-Za-z0-9]+')
+word_part = re.compile('[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+')
+
+
+def fold(token):
+    token = token.lower()
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenise(text):
+    tokens = []
+    if not text:
+        return tokens
+    for match in word.finditer(text):
+        parts = word_part.findall(match.group())
+        tokens.extend(fold(part) for part in parts)
+        if len(parts) > 1:
+            tokens.append(fold(match.group()))
+    return tokens
+
+
+class Document:
+    # key identifies the document within its kind e.g. a tag, a MsgType, or tag=value for a code.
+    __slots__ = ('kind', 'key', 'name', 'text')
+
+    def __init__(self, kind, key, name, text):
+        self.kind = kind
+        self.key = key
+        self.name = name
+        self.text = text
+
+    def __str__(self):
+        return '{} {} {}'.format(self.kind, self.key, self.name)
+
+
+class Index:
+
+    __slots__ = ('documents', 'postings', 'lengths', 'average_length')
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.postings = {}      # token -> { document index : weighted term frequency }
+        self.lengths = []       # document index -> weighted length
+        for position, document in enumerate(documents):
+            frequencies = {}
+            name = tokenise(document.name)
+            text = tokenise(document.text)
+            for token in name:
+                frequencies[token] = frequencies.get(token, 0) + name_weight
+            for token in text:
+                frequencies[token] = frequencies.get(token, 0) + 1
+            for token, frequency in frequencies.items():
+                self.postings.setdefault(token, {})[position] = frequency
+            self.lengths.append(name_weight * len(name) + len(text))
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0
+
+    def search(self, terms, limit = None):
+        # Returns [(score, Document)] best first for the documents that contain any of the
+        # terms, documents that contain more of them naturally score higher.
+        scores = {}
+        count = len(self.documents)
+        for token in set(tokenise(terms)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, frequency in postings.items():
+                length = self.lengths[position] / self.average_length
+                score = idf * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * length))
+                scores[position] = scores.get(position, 0) + score
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [(score, self.documents[position]) for position, score in ranked]
+
+
+def orchestration_documents(orchestration):
+    orchestration.require_sections('codeSets', 'fields', 'components', 'groups', 'messages')
+    documents = []
+    fields_by_type = {}
+    for field in orchestration.fields_by_tag.values():
+        documents.append(Document('field', str(field.id), field.name, field.synopsis))
+        fields_by_type.setdefault(field.type, []).append(field)
+    for code_set in orchestration.code_sets.values():
+        # Codes are keyed by the tag of every field that uses the code set.
+        owners = [str(field.id) for field in fields_by_type.get(code_set.name, [])] or [code_set.name]
+        for code in code_set.codes:
+            for owner in owners:
+                documents.append(Document('code', '{}={}'.format(owner, code.value), code.name, code.synopsis))
+    for component in orchestration.components.values():
+        documents.append(Document('component', str(component.id), component.name, component.synopsis))
+    for group in orchestration.groups.values():
+        documents.append(Document('group', str(group.id), group.name, group.synopsis))
+    for message in orchestration.messages_by_msg_type.values():
+        documents.append(Document('message', message.msg_type, message.name, message.synopsis))
+    return documents
+
+
+def repository_documents(repository):
+    documents = []
+    for field in repository.fields_by_tag.values():
+        documents.append(Document('field', str(field.id), field.name, field.description))
+        for enum in repository.enums.get(field.id, []):
+            documents.append(Document('code', '{}={}'.format(field.id, enum.value), enum.symbolic_name, enum.description))
+    for component in repository.components.values():
+        kind = 'group' if component.componentID in repository.groups_by_id else 'component'
+        documents.append(Document(kind, component.componentID, component.name, component.description))
+    for message in repository.messages_by_msg_type.values():
+        documents.append(Document('message', message.msgType, message.name, message.description))
+    return documents
+
+
+def cached_index(cache_directory, kind, source, paths, documents):
+    # The index for a source from the cache, otherwise built from documents() and cached.
+    if cache_directory and source:
+        state = snapshot.load(cache_directory, kind + '-search', source, paths)
+        if state is not None and state[0] == format_version:
+            return state[1]
+    index = Index(documents())
+    if cache_directory and source:
+        snapshot.save(cache_directory, kind + '-search', source, paths, (format_version, index))
+    return index
+
+
+def dump_search(index, terms, limit):
+    results = index.search(terms, limit)
+    if not results:
+        print("Could not find anything matching '{}'".format(terms))
+        return
+    for score, document in results:
+        text = document.text
+        if not text:
+            print('{:.2f}\t{}'.format(score, document))
+            continue
+        if len(text) > 100:
+            text = text[:97] + '...'
+        print('{:.2f}\t{}\t({})'.format(score, document, text))
@@ -0,0 +1,362 @@
+import collections
+import http.server
+import json
+import os
+import signal
+import socketserver
+import stat
+import threading
+import time
+import urllib.parse
+import sys
+sys.path.append("..")
+from fixorchestra.orchestration import *
+
+#
+# A long lived server that keeps orchestrations loaded and answers queries with JSON so
+# tools that would otherwise run orchestration.py for every lookup pay for one socket round
+# trip instead of a parse. It listens on localhost HTTP, or on a Unix socket if the address
+# is a path, and every request is a GET of /<name>/<query>/<argument> where name is the
+# orchestration filename without its extension.
+#
+#   /                                   The orchestrations being served
+#   /stats                              Request counts and latencies for each query
+#   /<name>/field/<tag|name>            A field and its values
+#   /<name>/message/<msgtype|name>      A message and its references
+#   /<name>/values/<tag|name>           value -> name for an enumerated field
+#   /<name>/layout/<msgtype|name>       The flattened fields of a message
+#   /<name>/where-used/<tag|name>       Every message, group, and component using a field, group, or component
+#   /<name>/search?terms=...&limit=N    Ranked full text search
+#
+# e.g. curl --unix-socket /tmp/fixorchestra.sock http://localhost/FixRepository44/field/54
+#
+
+# The number of recent latencies kept for each query to calculate percentiles from.
+latency_samples = 1000
+
+
+class NotFound(Exception):
+    pass
+
+
+class Statistics:
+    # Request counts and latencies for each query, updated by every request thread.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = {}   # query -> [count, total seconds, maximum seconds, deque of recent seconds]
+
+    def record(self, query, seconds):
+        with self.lock:
+            try:
+                statistics = self.queries[query]
+            except KeyError:
+                statistics = [0, 0.0, 0.0, collections.deque(maxlen=latency_samples)]
+                self.queries[query] = statistics
+            statistics[0] += 1
+            statistics[1] += seconds
+            statistics[2] = max(statistics[2], seconds)
+            statistics[3].append(seconds)
+
+    def summary(self):
+        # Latencies are in milliseconds and the percentiles are of the recent samples.
+        summary = {}
+        with self.lock:
+            for query, (count, total, maximum, samples) in self.queries.items():
+                samples = sorted(samples)
+                summary[query] = {
+                    'count' : count,
+                    'mean_ms' : total * 1000 / count,
+                    'p50_ms' : samples[len(samples) // 2] * 1000,
+                    'p99_ms' : samples[min(len(samples) - 1, len(samples) * 99 // 100)] * 1000,
+                    'max_ms' : maximum * 1000,
+                }
+        return summary
+
+
+def pedigree_json(pedigree):
+    if pedigree is None:
+        return None
+    return {
+        'added' : pedigree.added,
+        'added_ep' : pedigree.addedEP,
+        'updated' : pedigree.updated,
+        'updated_ep' : pedigree.updatedEP,
+        'deprecated' : pedigree.deprecated,
+        'deprecated_ep' : pedigree.deprecatedEP,
+    }
+
+
+def find_field(orchestration, tag_or_name):
+    try:
+        return orchestration.fields_by_tag[int(tag_or_name)]
+    except (KeyError, ValueError):
+        try:
+            return orchestration.fields_by_name[tag_or_name.lower()]
+        except KeyError:
+            raise NotFound("Could not find a field with Tag or Name = '{}'".format(tag_or_name))
+
+
+def find_message(orchestration, msg_type_or_name):
+    try:
+        return orchestration.messages_by_msg_type[msg_type_or_name]
+    except KeyError:
+        try:
+            return orchestration.messages_by_name[msg_type_or_name.lower()]
+        except KeyError:
+            raise NotFound("Could not find a message with MsgType or Name = '{}'".format(msg_type_or_name))
+
+
+def field_json(orchestration, field):
+    return {
+        'id' : field.id,
+        'name' : field.name,
+        'type' : field.type,
+        'synopsis' : field.synopsis,
+        'pedigree' : pedigree_json(field.pedigree),
+        'discriminator_id' : field.discriminator_id,
+        'values' : [{ 'value' : code.value, 'name' : code.name, 'synopsis' : code.synopsis } for code in orchestration.field_values(field)],
+    }
+
+
+def references_json(orchestration, references):
+    result = []
+    for reference in references:
+        if reference.kind == Reference.FIELD:
+            entity = orchestration.fields_by_tag[reference.id]
+        elif reference.kind == Reference.GROUP:
+            entity = orchestration.groups[reference.id]
+        else:
+            entity = orchestration.components[reference.id]
+        value = { 'kind' : reference.kind, 'id' : reference.id, 'name' : entity.name, 'presence' : reference.presence }
+        if reference.kind != Reference.FIELD:
+            value['references'] = references_json(orchestration, entity.references)
+        result.append(value)
+    return result
+
+
+def message_json(orchestration, message):
+    return {
+        'id' : message.id,
+        'name' : message.name,
+        'msg_type' : message.msg_type,
+        'category' : message.category,
+        'synopsis' : message.synopsis,
+        'pedigree' : pedigree_json(message.pedigree),
+        'references' : references_json(orchestration, message.references),
+    }
+
+
+def values_json(orchestration, field):
+    table = orchestration.field_value_table(field)
+    if table is None:
+        raise NotFound("Field '{}' is not enumerated".format(field.name))
+    return {
+        'id' : field.id,
+        'name' : field.name,
+        'multiple' : table.multiple,
+        'values' : { value : code.name for value, code in table.by_value.items() },
+    }
+
+
+def layout_json(orchestration, message):
+    layout = orchestration.message_layout(message)
+    return {
+        'msg_type' : message.msg_type,
+        'name' : message.name,
+        'fields' : [{
+            'id' : entry.field.id,
+            'name' : entry.field.name,
+            'presence' : entry.presence,
+            'depth' : entry.depth,
+            'group_path' : entry.group_path,
+            'required' : entry.required,
+        } for entry in layout.fields],
+        'required' : sorted(layout.required),
+    }
+
+
+def where_used_json(orchestration, tag_or_name):
+    used = find_used(orchestration, tag_or_name)
+    if used is None:
+        raise NotFound("Could not find a field with Tag or Name, or a group or component with Name = '{}'".format(tag_or_name))
+    kind, entity = used
+    return {
+        'kind' : kind,
+        'id' : entity.id,
+        'name' : entity.name,
+        'used_by' : [{
+            'kind' : usage.kind,
+            'id' : usage.user.msg_type if usage.kind == 'message' else usage.user.id,
+            'name' : usage.user.name,
+            'presence' : usage.presence,
+            'depth' : usage.depth,
+            'path' : usage.path,
+        } for usage in orchestration.where_used(kind, entity.id)],
+    }
+
+
+def search_json(orchestration, terms, limit):
+    return [{
+        'score' : score,
+        'kind' : document.kind,
+        'key' : document.key,
+        'name' : document.name,
+        'text' : document.text,
+    } for score, document in orchestration.search_index().search(terms, limit)]
+
+
+class Queries:
+    # Answers the path of a request independently of how the request arrived.
+
+    # Statistics are only kept for these and 'unknown' so clients can't grow them without bound.
+    names = frozenset(['field', 'message', 'values', 'layout', 'where-used', 'search'])
+
+    def __init__(self, orchestrations):
+        self.orchestrations = orchestrations    # name -> Orchestration
+        self.statistics = Statistics()
+        # Build everything the queries use up front so the first requests aren't slow.
+        for orchestration in orchestrations.values():
+            orchestration.require_sections(*orchestration.sections)
+            orchestration.layout_index()
+            orchestration.value_index()
+            orchestration.reference_index()
+            orchestration.search_index()
+
+    def query(self, path):
+        # Returns (query, status, value) where query names the kind of query for statistics.
+        url = urllib.parse.urlsplit(path)
+        parts = [urllib.parse.unquote(part) for part in url.path.split('/') if part]
+        parameters = urllib.parse.parse_qs(url.query)
+        if not parts:
+            return ('orchestrations', 200, [{
+                'name' : name,
+                'version' : orchestration.version,
+                'fingerprint' : orchestration.orchestration_fingerprint(),
+            } for name, orchestration in self.orchestrations.items()])
+        if parts == ['stats']:
+            return ('stats', 200, self.statistics.summary())
+        if len(parts) < 2:
+            return ('unknown', 404, { 'error' : "Expected /<name>/<query>/<argument> not '{}'".format(url.path) })
+        name, query = parts[0], parts[1]
+        try:
+            orchestration = self.orchestrations[name]
+        except KeyError:
+            return ('unknown', 404, { 'error' : "Not serving an orchestration called '{}'".format(name) })
+        if query not in self.names:
+            return ('unknown', 404, { 'error' : "Unknown query '{}'".format(query) })
+        try:
+            if query == 'search':
+                terms = ' '.join(parameters.get('terms', []))
+                limit = int(parameters.get('limit', ['20'])[0])
+                return (query, 200, search_json(orchestration, terms, limit))
+            if len(parts) != 3:
+                return (query, 404, { 'error' : "Expected /<name>/<query>/<argument> not '{}'".format(url.path) })
+            argument = parts[2]
+            if query == 'field':
+                return (query, 200, field_json(orchestration, find_field(orchestration, argument)))
+            if query == 'message':
+                return (query, 200, message_json(orchestration, find_message(orchestration, argument)))
+            if query == 'values':
+                return (query, 200, values_json(orchestration, find_field(orchestration, argument)))
+            if query == 'layout':
+                return (query, 200, layout_json(orchestration, find_message(orchestration, argument)))
+            if query == 'where-used':
+                return (query, 200, where_used_json(orchestration, argument))
+        except NotFound as ex:
+            return (query, 404, { 'error' : str(ex) })
+        except ValueError as ex:
+            return (query, 400, { 'error' : str(ex) })
+        except Exception as ex:
+            # Still answer, and record, a request that found a fault in the model or here.
+            return (query, 500, { 'error' : '{}: {}'.format(type(ex).__name__, ex) })
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+
+    server_version = 'fixorchestra'
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        start = time.perf_counter()
+        query, status, value = self.server.queries.query(self.path)
+        body = json.dumps(value).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.queries.statistics.record(query, time.perf_counter() - start)
+
+    def address_string(self):
+        # Unix socket clients have no address.
+        return self.client_address[0] if self.client_address else 'local'
+
+    def log_message(self, format, *args):
+        # /stats replaces a line per request.
+        pass
+
+
+class HttpServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def is_unix_address(address):
+    return os.sep in address or address.endswith('.sock')
+
+
+def is_socket(path):
+    try:
+        return stat.S_ISSOCK(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return False
+
+
+def create_server(address, queries):
+    # address is a Unix socket path or [host:]port where host defaults to localhost.
+    if is_unix_address(address):
+        # Only a socket left by an earlier server is replaced, a mistyped address must not
+        # delete e.g. the orchestration.
+        if is_socket(address):
+            os.remove(address)
+        elif os.path.exists(address):
+            raise Exception("cannot listen on '{}', it exists and is not a socket".format(address))
+        server = UnixServer(address, RequestHandler)
+    else:
+        host, _, port = address.rpartition(':')
+        try:
+            server = HttpServer((host or 'localhost', int(port)), RequestHandler)
+        except ValueError:
+            raise Exception("expected a Unix socket path or [host:]port not '{}'".format(address))
+    server.queries = queries
+    return server
+
+
+def orchestration_name(filename):
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def serve(orchestrations, address):
+    served = {}
+    for orchestration in orchestrations:
+        name = orchestration_name(orchestration.filename)
+        if name in served:
+            raise Exception("cannot serve two orchestrations called '{}'".format(name))
+        served[name] = orchestration
+    queries = Queries(served)
+    server = create_server(address, queries)
+    print('Serving {} on {}'.format(', '.join(queries.orchestrations), address), flush=True)
+    # Stop cleanly when terminated as well as when interrupted so a Unix socket is removed.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if is_unix_address(address) and is_socket(address):
+            os.remove(address)
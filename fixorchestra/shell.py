@@ -0,0 +1,112 @@
+import cmd
+import sys
+
+#
+# Answer many queries against a model that is only loaded once, either read one per line
+# from a file or typed into an interactive shell with tab completion. Each CLI describes
+# its queries as a command table:
+#
+#   name -> Command(function(argument), help, candidates)
+#
+# where candidates, if not None, returns the words an argument can be completed from e.g.
+# field names. A query line is a command name followed by its argument, blank lines and
+# lines starting with # are ignored.
+#
+
+
+class Command:
+
+    __slots__ = ('function', 'help', 'candidates')
+
+    def __init__(self, function, help, candidates = None):
+        self.function = function
+        self.help = help
+        self.candidates = candidates
+
+
+def run(commands, line):
+    # Answers one query line, returns False if the command is unknown.
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return True
+    name, _, argument = line.partition(' ')
+    try:
+        command = commands[name]
+    except KeyError:
+        sys.stderr.write("Unknown command '{}', expected one of {}\n".format(name, ', '.join(commands)))
+        return False
+    command.function(argument.strip())
+    return True
+
+
+def run_batch(commands, file):
+    # Answers every query in a file and returns the number of unknown commands.
+    failures = 0
+    for line in file:
+        if not run(commands, line):
+            failures += 1
+    return failures
+
+
+def complete(candidates, text):
+    # Names are not case sensitive so complete them regardless of case.
+    folded = text.lower()
+    return [candidate for candidate in candidates if candidate.lower().startswith(folded)]
+
+
+class Shell(cmd.Cmd):
+
+    identchars = cmd.IDENTCHARS + '-'
+
+    def __init__(self, commands, prompt, stdin = None, stdout = None):
+        super().__init__(stdin=stdin, stdout=stdout)
+        self.commands = commands
+        self.prompt = prompt
+        self.intro = "Type help for a list of commands, quit or Ctrl-D to exit"
+        self.candidates = {}    # command name -> [word], built on first completion
+        if stdin is not None:
+            self.use_rawinput = False
+
+    def preloop(self):
+        # readline treats - as a word break which would stop where-used completing.
+        try:
+            import readline
+            readline.set_completer_delims(' \t\n')
+        except ImportError:
+            pass
+
+    def emptyline(self):
+        pass
+
+    def default(self, line):
+        run(self.commands, line)
+
+    def do_quit(self, argument):
+        return True
+
+    def do_exit(self, argument):
+        return True
+
+    def do_EOF(self, argument):
+        self.stdout.write('\n')
+        return True
+
+    def do_help(self, argument):
+        width = max(len(name) for name in self.commands)
+        for name, command in self.commands.items():
+            self.stdout.write('{}  {}\n'.format(name.ljust(width), command.help))
+
+    def completenames(self, text, *ignored):
+        return complete(list(self.commands) + ['help', 'quit'], text)
+
+    def completedefault(self, text, line, begidx, endidx):
+        name = line.split(' ', 1)[0]
+        command = self.commands.get(name)
+        if command is None or command.candidates is None:
+            return []
+        try:
+            candidates = self.candidates[name]
+        except KeyError:
+            candidates = sorted(command.candidates())
+            self.candidates[name] = candidates
+        return complete(candidates, text)
@@ -0,0 +1,91 @@
+import hashlib
+import os
+import pickle
+
+#
+# A snapshot is a pickled copy of a fully loaded model kept in a cache directory. The file is named after the absolute path of
+# the source it was built from and begins with a key recording the path, size, mtime,
+# and content hash of every file that went into it. A snapshot is only used if that
+# key still matches the files on disk.
+#
+
+format_version = 1
+
+magic = b'FIXSNAP'
+
+
+def default_cache_directory():
+    try:
+        return os.environ['FIXORCHESTRA_CACHE']
+    except KeyError:
+        return os.path.join(os.path.expanduser('~'), '.cache', 'fixorchestra')
+
+
+def content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_key(paths):
+    key = []
+    for path in paths:
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        key.append((path, stat.st_size, stat.st_mtime_ns, content_hash(path)))
+    return key
+
+
+def key_matches(key, paths):
+    # Size is a cheap rejection and an unchanged mtime lets us skip hashing altogether.
+    # If only the mtime has moved, as it does after a fresh checkout, fall back to
+    # comparing content hashes.
+    if len(key) != len(paths):
+        return False
+    for (path, size, mtime, digest), source in zip(key, paths):
+        source = os.path.abspath(source)
+        if path != source:
+            return False
+        try:
+            stat = os.stat(source)
+        except OSError:
+            return False
+        if stat.st_size != size:
+            return False
+        if stat.st_mtime_ns != mtime and content_hash(source) != digest:
+            return False
+    return True
+
+
+def snapshot_filename(cache_directory, kind, source):
+    name = hashlib.sha256(os.path.abspath(source).encode('utf-8')).hexdigest()
+    return os.path.join(cache_directory, '{}-{}.snapshot'.format(kind, name))
+
+
+def load(cache_directory, kind, source, paths):
+    filename = snapshot_filename(cache_directory, kind, source)
+    try:
+        with open(filename, 'rb') as file:
+            if file.read(len(magic)) != magic:
+                return None
+            version, key = pickle.load(file)
+            if version != format_version or not key_matches(key, paths):
+                return None
+            return pickle.load(file)
+    except Exception:
+        # A missing, truncated, or incompatible snapshot is just a cache miss.
+        return None
+
+
+def save(cache_directory, kind, source, paths, state):
+    os.makedirs(cache_directory, exist_ok=True)
+    filename = snapshot_filename(cache_directory, kind, source)
+    temporary = '{}.{}.tmp'.format(filename, os.getpid())
+    with open(temporary, 'wb') as file:
+        file.write(magic)
+        pickle.dump((format_version, source_key(paths)), file, pickle.HIGHEST_PROTOCOL)
+        pickle.dump(state, file, pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, filename)
+    return filename
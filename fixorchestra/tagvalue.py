@@ -0,0 +1,83 @@
+import mmap
+
+#
+# Helpers for reading raw FIX tag=value messages out of session logs. Logs usually have a
+# timestamp or other prefix in front of each message so rather than assuming one message
+# per line a message is taken to start at 8=FIX and end with its CheckSum field.
+#
+
+SOH = b'\x01'
+
+begin_string = b'8=FIX'
+
+preceding_field = frozenset(b'0123456789=')
+
+
+def map_file(filename):
+    # Returns a read only memory map of the file, or an empty bytes object for an empty file
+    # which mmap refuses to map.
+    with open(filename, 'rb') as file:
+        try:
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return b''
+
+
+def find_message(buffer, position):
+    # The start of the first message at or after position. A BeginString preceded by a digit
+    # or an equals sign is part of another field e.g. 58=8=FIX... in free text.
+    while True:
+        start = buffer.find(begin_string, position)
+        if start <= 0 or buffer[start - 1] not in preceding_field:
+            return start
+        position = start + 1
+
+
+def iter_messages(buffer, separator = SOH, start = 0, end = None):
+    # Yields (offset, message) for every message that begins at or after start and before end,
+    # a message that begins before end is returned in full even if it extends past it. This
+    # lets a large file be split into ranges at arbitrary offsets.
+    if end is None:
+        end = len(buffer)
+    checksum = separator + b'10='
+    position = find_message(buffer, start)
+    while 0 <= position < end:
+        trailer = buffer.find(checksum, position)
+        following = find_message(buffer, position + len(begin_string))
+        if trailer < 0 or (following >= 0 and trailer > following):
+            # No CheckSum so the message is truncated, it ends where the next one begins.
+            message_end = following if following >= 0 else len(buffer)
+        else:
+            message_end = trailer + len(checksum) + 3
+            if buffer[message_end:message_end + len(separator)] == separator:
+                message_end += len(separator)
+        yield position, bytes(buffer[position:message_end])
+        position = following if following >= message_end else find_message(buffer, message_end)
+
+
+def parse_fields(message, separator = SOH):
+    # Returns [(tag, value)] with the value decoded as latin-1 so it can be compared with
+    # the string values in a CodeSet. A field without a numeric tag has a tag of None and
+    # the entire field text as its value.
+    fields = []
+    for item in message.rstrip(b'\r\n').split(separator):
+        if not item:
+            continue
+        tag, _, value = item.partition(b'=')
+        try:
+            fields.append((int(tag), value.decode('latin-1')))
+        except ValueError:
+            fields.append((None, item.decode('latin-1')))
+    return fields
+
+
+def split_ranges(size, count):
+    # Divide [0, size) into count roughly equal ranges for iter_messages.
+    count = max(1, min(count, size))
+    step = size // count
+    ranges = []
+    for index in range(count):
+        start = index * step
+        end = size if index == count - 1 else start + step
+        ranges.append((start, end))
+    return ranges
@@ -1,4 +1,569 @@
+import http.client
+import io
+import json
+import os
+import re
+import threading
 import pytest
+import xml.etree.ElementTree as ET
+from fixorchestra.orchestration import Orchestration, decode_log, dump_field, dump_message, dump_where_used, query_commands
+from fixorchestra import codegen
+from fixorchestra import database
+from fixorchestra import diff
+from fixorchestra import profiling
+from fixorchestra import search
+from fixorchestra import server
+from fixorchestra import shell
+
+ORCHESTRATION = '''<?xml version="1.0" encoding="UTF-8"?>
+<fixr:repository xmlns:fixr="http://fixprotocol.io/2020/orchestra/repository" xmlns:dc="http://purl.org/dc/elements/1.1/" name="FIX.4.4" version="FIX.4.4">
+    <fixr:metadata>
+        <dc:title>Orchestra</dc:title>
+    </fixr:metadata>
+    <fixr:datatypes>
+        <fixr:datatype name="int" added="FIX.2.7">
+            <fixr:annotation>
+                <fixr:documentation purpose="SYNOPSIS">Sequence of digits</fixr:documentation>
+            </fixr:annotation>
+        </fixr:datatype>
+        <fixr:datatype name="NumInGroup" baseType="int" added="FIX.4.3">
+            <fixr:mappedDatatype standard="XML" base="xs:positiveInteger" builtin="0">
+                <fixr:annotation>
+                    <fixr:documentation purpose="SYNOPSIS">Not the datatype synopsis</fixr:documentation>
+                </fixr:annotation>
+            </fixr:mappedDatatype>
+            <fixr:annotation>
+                <fixr:documentation purpose="SYNOPSIS">Number of entries in a repeating group</fixr:documentation>
+            </fixr:annotation>
+        </fixr:datatype>
+        <fixr:datatype name="String" added="FIX.4.2"/>
+        <fixr:datatype name="char" added="FIX.2.7"/>
+        <fixr:datatype name="MultipleCharValue" baseType="String" added="FIX.4.4"/>
+    </fixr:datatypes>
+    <fixr:codeSets>
+        <fixr:codeSet name="SideCodeSet" id="54" type="char">
+            <fixr:code name="Buy" id="54001" value="1" sort="1" added="FIX.2.7">
+                <fixr:annotation>
+                    <fixr:documentation purpose="SYNOPSIS">Buy</fixr:documentation>
+                </fixr:annotation>
+            </fixr:code>
+            <fixr:code name="Sell" id="54002" value="2" sort="2" added="FIX.2.7">
+                <fixr:annotation>
+                    <fixr:documentation purpose="SYNOPSIS">Sell</fixr:documentation>
+                </fixr:annotation>
+            </fixr:code>
+            <fixr:annotation>
+                <fixr:documentation purpose="SYNOPSIS">Side of order</fixr:documentation>
+            </fixr:annotation>
+        </fixr:codeSet>
+        <fixr:codeSet name="MsgTypeCodeSet" id="35" type="String">
+            <fixr:code name="Heartbeat" id="35001" value="0" added="FIX.2.7"/>
+            <fixr:code name="NewOrderSingle" id="35002" value="D" added="FIX.2.7"/>
+        </fixr:codeSet>
+        <fixr:codeSet name="ExecInstCodeSet" id="18" type="MultipleCharValue">
+            <fixr:code name="NotHeld" id="18001" value="1" added="FIX.2.7"/>
+            <fixr:code name="Work" id="18002" value="2" added="FIX.2.7"/>
+        </fixr:codeSet>
+    </fixr:codeSets>
+    <fixr:fields>
+        <fixr:field id="8" name="BeginString" type="String" added="FIX.2.7">
+            <fixr:annotation>
+                <fixr:documentation purpose="SYNOPSIS">Identifies beginning of new message</fixr:documentation>
+            </fixr:annotation>
+        </fixr:field>
+        <fixr:field id="10" name="CheckSum" type="String" added="FIX.2.7"/>
+        <fixr:field id="11" name="ClOrdID" type="String" added="FIX.2.7"/>
+        <fixr:field id="18" name="ExecInst" type="ExecInstCodeSet" added="FIX.2.7"/>
+        <fixr:field id="35" name="MsgType" type="MsgTypeCodeSet" added="FIX.2.7"/>
+        <fixr:field id="54" name="Side" type="SideCodeSet" added="FIX.2.7">
+            <fixr:annotation>
+                <fixr:documentation purpose="SYNOPSIS">Side of order</fixr:documentation>
+            </fixr:annotation>
+        </fixr:field>
+        <fixr:field id="448" name="PartyID" type="String" added="FIX.4.3"/>
+        <fixr:field id="453" name="NoPartyIDs" type="NumInGroup" added="FIX.4.3"/>
+    </fixr:fields>
+    <fixr:components>
+        <fixr:component name="StandardHeader" id="1024" category="Session" added="FIX.4.0">
+            <fixr:fieldRef id="8" presence="required" added="FIX.4.0"/>
+            <fixr:fieldRef id="35" presence="required" added="FIX.4.0"/>
+            <fixr:annotation>
+                <fixr:documentation purpose="SYNOPSIS">The standard FIX message header</fixr:documentation>
+            </fixr:annotation>
+        </fixr:component>
+        <fixr:component name="StandardTrailer" id="1025" category="Session" added="FIX.4.0">
+            <fixr:fieldRef id="10" presence="required" added="FIX.4.0"/>
+        </fixr:component>
+        <fixr:component name="Parties" id="1012" category="Common" added="FIX.4.3">
+            <fixr:groupRef id="2012" added="FIX.4.3"/>
+        </fixr:component>
+    </fixr:components>
+    <fixr:groups>
+        <fixr:group id="2012" added="FIX.4.3" name="PartyIDGrp" category="Common">
+            <fixr:numInGroup id="453"/>
+            <fixr:fieldRef id="448" added="FIX.4.3">
+                <fixr:annotation>
+                    <fixr:documentation>Required if NoPartyIDs &gt; 0</fixr:documentation>
+                    <fixr:documentation purpose="SYNOPSIS">  Identifies the party &amp; its role </fixr:documentation>
+                    <fixr:documentation purpose="SYNOPSIS">Not the first synopsis</fixr:documentation>
+                </fixr:annotation>
+            </fixr:fieldRef>
+        </fixr:group>
+    </fixr:groups>
+    <fixr:messages>
+        <fixr:message name="Heartbeat" id="1" msgType="0" category="Session" added="FIX.2.7">
+            <fixr:structure>
+                <fixr:componentRef id="1024" presence="required" added="FIX.2.7"/>
+                <fixr:componentRef id="1025" presence="required" added="FIX.2.7"/>
+            </fixr:structure>
+            <fixr:annotation>
+                <fixr:documentation purpose="SYNOPSIS">The Heartbeat monitors the status of the communication link.</fixr:documentation>
+            </fixr:annotation>
+        </fixr:message>
+        <fixr:message name="NewOrderSingle" id="14" msgType="D" category="SingleGeneralOrderHandling" added="FIX.2.7">
+            <fixr:structure>
+                <fixr:componentRef id="1024" presence="required" added="FIX.2.7"/>
+                <fixr:fieldRef id="11" presence="required" added="FIX.2.7"/>
+                <fixr:componentRef id="1012" added="FIX.4.3"/>
+                <fixr:fieldRef id="54" presence="required" added="FIX.2.7"/>
+                <fixr:fieldRef id="18" added="FIX.2.7"/>
+                <fixr:componentRef id="1025" presence="required" added="FIX.2.7"/>
+            </fixr:structure>
+        </fixr:message>
+    </fixr:messages>
+</fixr:repository>
+'''
+
+
+@pytest.fixture
+def orchestration_file(tmp_path):
+    path = tmp_path / 'orchestration.xml'
+    path.write_text(ORCHESTRATION)
+    return str(path)
+
 
 def test_orchestration():
     pass
+
+
+def test_streaming_loader(orchestration_file):
+    orchestration = Orchestration(orchestration_file, 'streaming')
+    assert orchestration.version == 'FIX.4.4'
+    assert orchestration.data_types['NumInGroup'].base_type == 'int'
+    assert [code.value for code in orchestration.code_sets['SideCodeSet'].codes] == ['1', '2']
+    assert orchestration.fields_by_name['side'].synopsis == 'Side of order'
+    assert orchestration.groups['2012'].references[0].field_id == 453
+    message = orchestration.messages_by_msg_type['D']
+    assert [field.field.id for field in orchestration.message_fields(message)] == [8, 35, 11, 453, 448, 54, 18, 10]
+
+
+def test_unknown_loader(orchestration_file):
+    with pytest.raises(Exception):
+        Orchestration(orchestration_file, 'bogus')
+
+
+def test_snapshot(orchestration_file, tmp_path, monkeypatch):
+    cache_directory = str(tmp_path / 'cache')
+    parsed = Orchestration(orchestration_file, cache_directory=cache_directory)
+    def fail(self, filename, loader):
+        raise AssertionError('snapshot was not used')
+    monkeypatch.setattr(Orchestration, 'load', fail)
+    orchestration = Orchestration(orchestration_file, cache_directory=cache_directory)
+    assert orchestration.version == 'FIX.4.4'
+    assert orchestration.fields_by_tag[54].name == 'Side'
+    assert orchestration.messages_by_name['newordersingle'].msg_type == 'D'
+    # Reference kinds come back from a snapshot as equal but not identical strings.
+    message = orchestration.messages_by_msg_type['D']
+    assert [field.field.id for field in orchestration.message_fields(message)] == [8, 35, 11, 453, 448, 54, 18, 10]
+    layout = lambda orchestration: [(entry.field.id, entry.depth, entry.group_path) for entry in orchestration.message_layout(orchestration.messages_by_msg_type['D']).fields]
+    assert layout(orchestration) == layout(parsed)
+    assert [reference.component_id for reference in message.references] == [reference.component_id for reference in parsed.messages_by_msg_type['D'].references]
+    assert message.references[0].component_id is not None
+
+
+def test_snapshot_invalidated_by_change(orchestration_file, tmp_path):
+    cache_directory = str(tmp_path / 'cache')
+    Orchestration(orchestration_file, cache_directory=cache_directory)
+    with open(orchestration_file, 'w') as file:
+        file.write(ORCHESTRATION.replace('name="ClOrdID"', 'name="ClientOrderID"'))
+    orchestration = Orchestration(orchestration_file, cache_directory=cache_directory)
+    assert orchestration.fields_by_tag[11].name == 'ClientOrderID'
+
+
+def test_lazy_loader(orchestration_file):
+    orchestration = Orchestration(orchestration_file, 'lazy')
+    assert orchestration.version == 'FIX.4.4'
+    assert orchestration.pending_sections == set(Orchestration.sections)
+    assert orchestration.fields_by_tag[54].name == 'Side'
+    assert orchestration.pending_sections == {'datatypes', 'codeSets', 'components', 'groups', 'messages'}
+    message = orchestration.messages_by_msg_type['D']
+    assert orchestration.pending_sections == {'datatypes', 'codeSets', 'components', 'groups'}
+    assert [field.field.id for field in orchestration.message_fields(message)] == [8, 35, 11, 453, 448, 54, 18, 10]
+    assert orchestration.pending_sections == {'datatypes', 'codeSets'}
+
+
+def test_instances_are_independent(orchestration_file):
+    orchestration = Orchestration(orchestration_file)
+    assert len(Orchestration().fields_by_tag) == 0
+    assert len(orchestration.fields_by_tag) == 8
+
+
+def test_registry(orchestration_file, tmp_path):
+    from fixorchestra.registry import Registry
+    other_file = tmp_path / 'other.xml'
+    other_file.write_text(ORCHESTRATION.replace('version="FIX.4.4"', 'version="FIX.5.0"').replace('Sequence of digits', 'Integer'))
+    registry = Registry()
+    fix44 = registry.load_orchestration(orchestration_file)
+    fix50 = registry.load_orchestration(str(other_file))
+    assert registry.orchestration('FIX.4.4') is fix44
+    assert registry.orchestration('FIX.5.0') is fix50
+    assert fix44.fields_by_tag[54] is not fix50.fields_by_tag[54]
+    assert fix44.fields_by_tag[54].synopsis is fix50.fields_by_tag[54].synopsis
+    assert fix44.messages_by_msg_type['0'].synopsis is fix50.messages_by_msg_type['0'].synopsis
+    registry.release_orchestration('FIX.4.4')
+    with pytest.raises(Exception):
+        registry.orchestration('FIX.4.4')
+    assert 'Sequence of digits' not in registry.strings
+    assert fix50.fields_by_tag[54].synopsis in registry.strings
+
+
+def test_compact_model(orchestration_file):
+    import pickle
+    from fixorchestra.orchestration import Reference
+    orchestration = Orchestration(orchestration_file)
+    buy, sell = orchestration.code_sets['SideCodeSet'].codes
+    assert buy.pedigree is sell.pedigree
+    assert not hasattr(buy, '__dict__')
+    assert pickle.loads(pickle.dumps(buy.pedigree)) is buy.pedigree
+    reference = orchestration.components['1012'].references[0]
+    assert reference.kind == Reference.GROUP
+    assert (reference.field_id, reference.group_id, reference.component_id) == (None, '2012', None)
+
+
+def model_state(value):
+    # A comparable representation of a model object graph built by walking slots.
+    if isinstance(value, dict):
+        return { key : model_state(item) for key, item in value.items() }
+    if isinstance(value, list):
+        return [model_state(item) for item in value]
+    if hasattr(type(value), '__slots__'):
+        return (type(value).__name__, tuple(model_state(getattr(value, name)) for name in type(value).__slots__))
+    return value
+
+
+@pytest.mark.parametrize('loader', ['streaming', 'lazy', 'expat'])
+def test_loader_parity(orchestration_file, loader):
+    expected = Orchestration(orchestration_file)
+    actual = Orchestration(orchestration_file, loader)
+    for name in Orchestration.snapshot_attributes:
+        assert model_state(getattr(actual, name)) == model_state(getattr(expected, name)), name
+    assert expected.data_types['NumInGroup'].synopsis == 'Number of entries in a repeating group'
+    assert expected.groups['2012'].references[1].synopsis == 'Identifies the party & its role'
+
+
+def test_message_fields_cached(orchestration_file):
+    orchestration = Orchestration(orchestration_file)
+    new_order = orchestration.messages_by_msg_type['D']
+    heartbeat = orchestration.messages_by_msg_type['0']
+    fields = orchestration.message_fields(new_order)
+    assert [(field.field.id, field.depth) for field in fields] == [(8, 0), (35, 0), (11, 0), (453, 1), (448, 1), (54, 0), (18, 0), (10, 0)]
+    assert orchestration.message_fields(heartbeat)[0] is fields[0]
+    assert [field.field.id for field in orchestration.iter_message_fields(new_order)] == [field.field.id for field in fields]
+    iterator = orchestration.iter_message_fields(new_order)
+    assert next(iterator).field.id == 8
+    orchestration.components['1025'].references = []
+    orchestration.invalidate_caches()
+    assert [field.field.id for field in orchestration.message_fields(heartbeat)] == [8, 35]
+
+
+def test_layout_index(orchestration_file):
+    orchestration = Orchestration(orchestration_file)
+    index = orchestration.layout_index()
+    layout = index['D']
+    assert 54 in layout and 55 not in layout
+    assert layout.get(448).group_path == ('2012',)
+    assert layout.get(448).depth == 1
+    assert layout.get(54).position == 5
+    assert layout.required == frozenset([8, 35, 11, 54, 10])
+    assert layout.required_by_group == {}
+    assert orchestration.layout_index()['D'] is layout
+    assert [entry.field.id for entry in layout.fields] == [field.field.id for field in orchestration.message_fields(layout.message)]
+
+
+def test_decode_log(orchestration_file, tmp_path):
+    log = tmp_path / 'messages.log'
+    log.write_bytes(b'12:00:00 8=FIX.4.4|35=D|54=2|18=2 9|99=x|10=000|\n12:00:01 8=FIX.4.4|35=0|10=000|\n')
+    orchestration = Orchestration(orchestration_file)
+    decoded = list(decode_log(orchestration, str(log), b'|'))
+    assert [(offset, message.name) for offset, message, fields in decoded] == [(9, 'NewOrderSingle'), (58, 'Heartbeat')]
+    fields = decoded[0][2]
+    assert [(tag, field.name if field else None, value, value_name) for tag, field, value, value_name in fields] == \
+        [(8, 'BeginString', 'FIX.4.4', None), (35, 'MsgType', 'D', 'NewOrderSingle'), (54, 'Side', '2', 'Sell'), (18, 'ExecInst', '2 9', 'Work 9'), (99, None, 'x', None), (10, 'CheckSum', '000', None)]
+
+
+def test_value_index(orchestration_file):
+    orchestration = Orchestration(orchestration_file)
+    index = orchestration.value_index()
+    assert sorted(index) == [18, 35, 54]
+    side = orchestration.field_value_table(orchestration.fields_by_tag[54])
+    assert side.code('2').name == 'Sell' and side.code('3') is None
+    assert side.value('Buy') == '1'
+    assert orchestration.field_value_table(orchestration.fields_by_tag[11]) is None
+    decoded = orchestration.decode_values([(54, '1'), (18, '2 1 9'), (11, 'abc')])
+    assert [(tag, value, tuple(code.value if code else None for code in codes)) for tag, value, codes in decoded] == \
+        [(54, '1', ('1',)), (18, '2 1 9', ('2', '1', None)), (11, 'abc', ())]
+    assert orchestration.value_index() is index
+
+
+def test_generate_module(orchestration_file, tmp_path, monkeypatch):
+    orchestration = Orchestration(orchestration_file)
+    codegen.write_module(orchestration, str(tmp_path / 'fix44_dict.py'))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    import fix44_dict
+    assert fix44_dict.version == 'FIX.4.4'
+    assert fix44_dict.Tag.Side == 54 and fix44_dict.MsgType.NewOrderSingle == 'D'
+    assert fix44_dict.fields[453] == ('NoPartyIDs', 'NumInGroup')
+    assert fix44_dict.values[54] == { '1' : 'Buy', '2' : 'Sell' }
+    assert fix44_dict.multiple_value_fields == frozenset([18])
+    assert fix44_dict.layouts['D'][3] == (453, None, 1, ('2012',), False)
+    assert fix44_dict.required['D'] == orchestration.layout_index()['D'].required
+
+
+def test_database(orchestration_file, tmp_path, capsys):
+    orchestration = Orchestration(orchestration_file)
+    filename = database.export(orchestration, str(tmp_path / 'orchestration.db'))
+    db = database.Database(filename)
+    assert db.version == 'FIX.4.4'
+    assert db.fields_by_name['SIDE'].id == 54 and 55 not in db.fields_by_tag
+    assert [code.name for code in db.field_values(db.fields_by_tag[54])] == ['Buy', 'Sell']
+    assert model_state(db.groups['2012']) == model_state(orchestration.groups['2012'])
+    assert len(db.messages_by_msg_type) == 2
+    for query in (dump_field, dump_message):
+        argument = '54' if query is dump_field else 'newordersingle'
+        query(orchestration, argument)
+        expected = capsys.readouterr().out
+        query(db, argument)
+        assert capsys.readouterr().out == expected
+    db.close()
+
+
+# The output of Orchestration.write_xml() is identical to ET.dump(indent(orchestration.to_xml())).
+def indent(elem, level=0):
+    i = "\n" + level*"  "
+    j = "\n" + (level-1)*"  "
+    if len(elem):
+        if not elem.text or not elem.text.strip():
+            elem.text = i + "  "
+        if not elem.tail or not elem.tail.strip():
+            elem.tail = i
+        for subelem in elem:
+            indent(subelem, level+1)
+        if not elem.tail or not elem.tail.strip():
+            elem.tail = j
+    else:
+        if level and (not elem.tail or not elem.tail.strip()):
+            elem.tail = j
+    return elem
+
+
+def test_write_xml(orchestration_file, capsys):
+    orchestration = Orchestration(orchestration_file)
+    orchestration.components['1025'].references = []
+    print('<?xml version="1.0" encoding="UTF-8"?>')
+    ET.dump(indent(orchestration.to_xml()))
+    expected = capsys.readouterr().out
+    output = io.StringIO()
+    orchestration.write_xml(output)
+    date = re.compile('<dc:date>.*</dc:date>')
+    assert date.sub('', output.getvalue()) == date.sub('', expected)
+    assert 'Identifies the party &amp; its role' in expected
+
+
+def test_diff(orchestration_file, tmp_path, monkeypatch):
+    newer = ORCHESTRATION.replace('<fixr:fieldRef id="11" presence="required" added="FIX.2.7"/>', '<fixr:fieldRef id="11" added="FIX.2.7"/>')
+    newer = newer.replace('<fixr:fieldRef id="54" presence="required" added="FIX.2.7"/>\n                <fixr:fieldRef id="18" added="FIX.2.7"/>',
+        '<fixr:fieldRef id="18" added="FIX.2.7"/>\n                <fixr:fieldRef id="54" presence="required" added="FIX.2.7"/>')
+    newer = newer.replace('name="ClOrdID"', 'name="ClientOrderID"')
+    newer = re.sub('<fixr:message name="Heartbeat".*?</fixr:message>', '', newer, flags=re.DOTALL)
+    path = tmp_path / 'newer.xml'
+    path.write_text(newer)
+    old = Orchestration(orchestration_file)
+    new = Orchestration(str(path))
+    assert diff.diff(old, old) == []
+    changes = diff.diff(old, new)
+    assert [str(change) for change in changes] == ['field 11 (ClientOrderID) changed', 'message 1 (Heartbeat) removed', 'message 14 (NewOrderSingle) changed']
+    assert changes[0].details == ["name 'ClOrdID' -> 'ClientOrderID'"]
+    assert changes[2].details == ["reference field 18 moved from position 5 to 4", "reference field 11 presence 'required' -> None"]
+    assert [str(change) for change in diff.diff(new, old)][-1] == 'message 1 (Heartbeat) added'
+    # Only the entities whose fingerprints differ, here field 11 and what uses it, are compared.
+    compared = []
+    signature = diff.signature
+    monkeypatch.setattr(diff, 'signature', lambda kind, entity: compared.append((kind, entity.id)) or signature(kind, entity))
+    assert diff.diff(old, Orchestration(orchestration_file)) == [] and compared == []
+    diff.diff(old, new)
+    assert sorted(set(compared)) == [('field', 11), ('message', '14')]
+
+
+@pytest.mark.parametrize('loader', ['tree', 'streaming', 'lazy', 'expat'])
+def test_fingerprint(orchestration_file, tmp_path, loader):
+    old = Orchestration(orchestration_file)
+    same = Orchestration(orchestration_file, loader)
+    assert same.orchestration_fingerprint() == old.orchestration_fingerprint()
+    path = tmp_path / 'newer.xml'
+    path.write_text(ORCHESTRATION.replace('<fixr:code name="Sell" id="54002" value="2"', '<fixr:code name="Sell" id="54002" value="5"'))
+    new = Orchestration(str(path), loader)
+    changed = [(kind, id) for kind, attribute in Orchestration.fingerprint_indexes.items() for id in getattr(old, attribute)
+        if old.entity_fingerprint(kind, id) != new.entity_fingerprint(kind, id)]
+    assert changed == [('codeSet', 'SideCodeSet'), ('field', 54), ('message', '14')]
+    assert new.fingerprint(new.messages_by_msg_type['0']) == old.fingerprint(old.messages_by_msg_type['0'])
+    assert new.orchestration_fingerprint() != old.orchestration_fingerprint()
+    new.components['1025'].references = []
+    new.invalidate_caches()
+    assert new.fingerprint(new.messages_by_msg_type['0']) != old.fingerprint(old.messages_by_msg_type['0'])
+
+
+def test_generate_module_unchanged(orchestration_file, tmp_path):
+    filename = str(tmp_path / 'fix44_dict.py')
+    orchestration = Orchestration(orchestration_file)
+    codegen.write_module(orchestration, filename)
+    assert codegen.generated_fingerprint(filename) == orchestration.orchestration_fingerprint()
+    modified = os.stat(filename).st_mtime_ns
+    codegen.write_module(Orchestration(orchestration_file, 'expat'), filename)
+    assert os.stat(filename).st_mtime_ns == modified
+
+
+def test_where_used(orchestration_file, tmp_path, capsys):
+    orchestration = Orchestration(orchestration_file)
+    usages = orchestration.where_used('field', 448)
+    assert [(usage.kind, usage.user.name, usage.depth, usage.path) for usage in usages] == \
+        [('group', 'PartyIDGrp', 0, ()), ('component', 'Parties', 1, ('2012',)), ('message', 'NewOrderSingle', 1, ('1012', '2012'))]
+    message = orchestration.messages_by_msg_type['D']
+    assert [field.depth for field in orchestration.message_fields(message) if field.field.id == 448] == [usages[-1].depth]
+    assert [usage.user.name for usage in orchestration.where_used('component', '1024')] == ['Heartbeat', 'NewOrderSingle']
+    assert orchestration.where_used('field', 55) == ()
+    dump_where_used(orchestration, 'PartyID')
+    expected = capsys.readouterr().out
+    assert expected.splitlines()[-2] == '    message NewOrderSingle (MsgType = D, Presence = None, Depth = 1, Via = Parties > PartyIDGrp)'
+    db = database.Database(database.export(orchestration, str(tmp_path / 'orchestration.db')))
+    dump_where_used(db, '448')
+    assert capsys.readouterr().out == expected
+    db.close()
+
+
+def test_search(orchestration_file, tmp_path, monkeypatch):
+    cache_directory = str(tmp_path / 'cache')
+    orchestration = Orchestration(orchestration_file)
+    index = orchestration.search_index(cache_directory)
+    assert orchestration.search_index() is index
+    assert [str(document) for score, document in index.search('party id', 2)] == ['field 448 PartyID', 'group 2012 PartyIDGrp']
+    assert str(index.search('partyidgrp')[0][1]) == 'group 2012 PartyIDGrp'
+    assert [str(document) for score, document in index.search('sells')] == ['code 54=2 Sell']
+    assert str(index.search('side of the order')[0][1]) == 'field 54 Side'
+    assert index.search('nothing') == []
+    def fail(documents):
+        raise AssertionError('cached index was not used')
+    monkeypatch.setattr(search.Index, '__init__', fail)
+    cached = Orchestration(orchestration_file).search_index(cache_directory)
+    assert [(score, str(document)) for score, document in cached.search('party id')] == [(score, str(document)) for score, document in index.search('party id')]
+
+
+def test_server(orchestration_file):
+    orchestration = Orchestration(orchestration_file)
+    queries = server.Queries({ 'fix44' : orchestration })
+    assert queries.query('/') == ('orchestrations', 200, [{ 'name' : 'fix44', 'version' : 'FIX.4.4', 'fingerprint' : orchestration.orchestration_fingerprint() }])
+    query, status, value = queries.query('/fix44/field/side')
+    assert (query, status, value['id'], [code['name'] for code in value['values']]) == ('field', 200, 54, ['Buy', 'Sell'])
+    assert queries.query('/fix44/values/18')[2]['multiple']
+    assert queries.query('/fix44/layout/NewOrderSingle')[2]['required'] == sorted(orchestration.layout_index()['D'].required)
+    assert [reference['name'] for reference in queries.query('/fix44/message/D')[2]['references']][:2] == ['StandardHeader', 'ClOrdID']
+    assert [usage['id'] for usage in queries.query('/fix44/where-used/448')[2]['used_by']] == ['2012', '1012', 'D']
+    assert queries.query('/fix44/search?terms=party+id&limit=1')[2][0]['name'] == 'PartyID'
+    assert queries.query('/fix44/field/999')[1:] == (404, { 'error' : "Could not find a field with Tag or Name = '999'" })
+    assert queries.query('/fix42/field/54')[1] == 404 and queries.query('/fix44/nothing/54')[1] == 404
+    instance = server.create_server('localhost:0', queries)
+    thread = threading.Thread(target=instance.serve_forever)
+    thread.start()
+    try:
+        connection = http.client.HTTPConnection('localhost', instance.server_address[1])
+        for path in ('/fix44/field/54', '/fix44/field/11'):
+            connection.request('GET', path)
+            response = connection.getresponse()
+            assert response.status == 200 and response.getheader('Content-Type') == 'application/json'
+            assert json.loads(response.read())['name'] in ('Side', 'ClOrdID')
+        connection.request('GET', '/stats')
+        assert json.loads(connection.getresponse().read())['field']['count'] == 2
+        connection.close()
+    finally:
+        instance.shutdown()
+        instance.server_close()
+        thread.join()
+
+
+def test_server_errors(orchestration_file):
+    orchestration = Orchestration(orchestration_file)
+    queries = server.Queries({ 'fix44' : orchestration })
+    assert orchestration.text_index is not None
+    assert queries.query('/fix42/anything/54')[:2] == ('unknown', 404)
+    assert queries.query('/fix44/anything/54')[:2] == ('unknown', 404)
+    del orchestration.fields_by_tag[11]
+    query, status, value = queries.query('/fix44/message/D')
+    assert (query, status, value) == ('message', 500, { 'error' : 'KeyError: 11' })
+
+
+def test_server_only_replaces_sockets(orchestration_file, tmp_path):
+    queries = server.Queries({ 'fix44' : Orchestration(orchestration_file) })
+    with pytest.raises(Exception):
+        server.create_server(orchestration_file, queries)
+    assert Orchestration(orchestration_file).version == 'FIX.4.4'
+    address = str(tmp_path / 'fix44.sock')
+    for attempt in range(2):
+        instance = server.create_server(address, queries)
+        instance.server_close()
+        assert server.is_socket(address)
+
+
+def test_query_commands(orchestration_file, capsys):
+    orchestration = Orchestration(orchestration_file)
+    commands = query_commands(orchestration)
+    dump_field(orchestration, '54')
+    dump_message(orchestration, 'D')
+    expected = capsys.readouterr().out
+    assert shell.run_batch(commands, io.StringIO('field 54\n\n# a comment\n  message D\nfield\tnothing\nfield nothing\n')) == 1
+    captured = capsys.readouterr()
+    assert captured.out == expected + "Could not find a field with Tag or Name = 'nothing'\n"
+    assert "Unknown command 'field\tnothing'" in captured.err
+    output = io.StringIO()
+    prompt = shell.Shell(commands, '> ', stdin=io.StringIO('field side\nhelp\nquit\nfield 11\n'), stdout=output)
+    prompt.cmdloop()
+    assert capsys.readouterr().out.startswith('Side {')
+    assert 'where-used' in output.getvalue()
+    assert prompt.completenames('LIST-m') == ['list-messages']
+    assert prompt.completedefault('no', 'where-used no', 11, 13) == ['NoPartyIDs']
+    assert prompt.completedefault('party', 'field party', 6, 11) == ['PartyID']
+    assert prompt.completedefault('', 'search ', 7, 7) == []
+
+
+def test_profile(orchestration_file, tmp_path):
+    profile = profiling.Profile()
+    with profile.phase('load'):
+        orchestration = Orchestration(orchestration_file, cache_directory=str(tmp_path), profile=profile)
+    assert [(phase.name, phase.depth) for phase in profile.phases] == [('load', 0), ('load_snapshot', 1), ('parse', 1)] + \
+        [(name, 1) for name in Orchestration.load_phases] + [('save_snapshot', 1)]
+    assert all(phase.seconds >= 0 and phase.allocated is not None for phase in profile.phases)
+    output = io.StringIO()
+    profile.report(profiling.orchestration_objects(orchestration), output)
+    assert profile.objects['fields'][0] == len(orchestration.fields_by_tag)
+    assert profile.objects['codes'][0] == sum(len(code_set.codes) for code_set in orchestration.code_sets.values())
+    assert all(size > 0 for count, size in profile.objects.values() if count > 0)
+    assert output.getvalue().startswith('Phase') and 'load_code_sets' in output.getvalue()
+    assert json.loads(json.dumps(profile.to_json()))['objects']['messages']['count'] == len(orchestration.messages_by_msg_type)
+    profile = profiling.Profile(trace_memory=False)
+    Orchestration(orchestration_file, cache_directory=str(tmp_path), profile=profile)
+    assert [phase.name for phase in profile.phases] == ['load_snapshot']
+    assert profile.phases[0].allocated is None
+    lazy = Orchestration(orchestration_file, 'lazy', profile=profile)
+    assert profiling.orchestration_objects(lazy)['fields'] == []
+    lazy.fields_by_tag
+    assert profile.phases[-1].name == 'load_sections fields'
+    with profiling.phase(None, 'nothing'):
+        pass
@@ -4,9 +4,33 @@ import argparse
 import xml.etree.ElementTree as ET
 import os
 import sys
+import concurrent.futures
+sys.path.append("..")
+from fixorchestra import snapshot
+from fixorchestra import search
+from fixorchestra import shell
+from fixorchestra import profiling
+
+# The data types whose values are a space separated list of enum values.
+multiple_value_types = frozenset(['MultipleCharValue', 'MultipleStringValue', 'MultipleValueString'])
 
 
 class Pedigree:
+    # Most pedigrees are identical, e.g. added=FIX.4.4 with nothing else set, so loaders
+    # share instances through intern() and they must be treated as immutable.
+    __slots__ = ('added', 'addedEP', 'updated', 'updatedEP', 'deprecated', 'deprecatedEP')
+
+    instances = {}
+
+    @classmethod
+    def intern(cls, added, addedEP, updated, updatedEP, deprecated, deprecatedEP):
+        key = (added, addedEP, updated, updatedEP, deprecated, deprecatedEP)
+        try:
+            return cls.instances[key]
+        except KeyError:
+            pedigree = cls(*key)
+            cls.instances[key] = pedigree
+            return pedigree
 
     def __init__(self, added, addedEP, updated, updatedEP, deprecated, deprecatedEP):
         self.added = added
@@ -42,9 +66,15 @@ class Pedigree:
             buffer += 'deprecatedEP=' + self.deprecatedEP
         return '(' + buffer + ')'
 
+    def __reduce__(self):
+        # Unpickled pedigrees, e.g. from a snapshot, go through the same cache.
+        return (Pedigree.intern, (self.added, self.addedEP, self.updated, self.updatedEP, self.deprecated, self.deprecatedEP))
+
 
 class DataType:
 
+    __slots__ = ('name', 'base_type', 'description', 'synopsis', 'pedigree')
+
     def __init__(self, name, base_type, description, pedigree):
         self.name = name
         self.base_type = base_type
@@ -56,6 +86,8 @@ class Enum:
     # This class needs to be kept in sync with orchestra.Code because fixaudit.py stores 
     # instances of these classes in Sets. Specifically both implementations have to be hashable 
     # and they have to be hashing the same thing.
+    __slots__ = ('id', 'value', 'symbolic_name', 'description', 'pedigree')
+
     def __init__(self, id, value, symbolic_name, description, pedigree):
         self.id = id
         self.value = value
@@ -74,6 +106,8 @@ class Field:
     # This class needs to be kept in sync with orchestra.Field because fixaudit.py stores 
     # nstances of these classes in Sets. Specifically both implementations have to be hashable 
     # and they have to be hashing the same thing.
+    __slots__ = ('id', 'name', 'type', 'description', 'pedigree')
+
     def __init__(self, id, name, type, description, pedigree):
         self.id = id
         self.name = name
@@ -89,6 +123,8 @@ class Field:
 
 class Component:
 
+    __slots__ = ('componentID', 'componentType', 'categoryID', 'name', 'description', 'pedigree')
+
     def __init__(self, componentID, componentType, categoryID, name, description, pedigree):
         self.componentID = componentID
         self.componentType = componentType
@@ -100,6 +136,8 @@ class Component:
 
 class MsgContent:
 
+    __slots__ = ('componentID', 'tagText', 'indent', 'position', 'reqd', 'description', 'pedigree')
+
     def __init__(self, componentID, tagText, indent, position, reqd, description, pedigree):
         self.componentID = componentID
         self.tagText = tagText
@@ -112,6 +150,8 @@ class MsgContent:
 
 class Message:
 
+    __slots__ = ('componentID', 'msgType', 'name', 'categoryID', 'sectionID', 'description', 'pedigree')
+
     def __init__(self, componentID, msgType, name, categoryID, sectionID, description, pedigree):
         self.componentID = componentID
         self.msgType = msgType
@@ -124,43 +164,200 @@ class Message:
 
 class MessageField:
 
+    __slots__ = ('field', 'required', 'depth')
+
     def __init__(self, field, required, depth):
         self.field = field
         self.required = required
         self.depth = depth
 
 
+class LayoutEntry:
+    # Where a field appears in a message. group_path is the ids of the enclosing repeating
+    # components from the outermost in and position is the index of the field in 
+    # message_fields. required is True if this field and every component enclosing it within
+    # its group, or within the message if it is not in a group, are required.
+    __slots__ = ('field', 'reqd', 'depth', 'group_path', 'position', 'required')
+
+    def __init__(self, field, reqd, depth, group_path, position, required):
+        self.field = field
+        self.reqd = reqd
+        self.depth = depth
+        self.group_path = group_path
+        self.position = position
+        self.required = required
+
+
+class MessageLayout:
+    # The flattened structure of a message indexed for constant time lookup. entries maps a
+    # tag to its first occurrence. required holds the tags that must be present in every
+    # message and required_by_group the tags that must be present in every instance of
+    # each group.
+    __slots__ = ('message', 'fields', 'entries', 'required', 'required_by_group')
+
+    def __init__(self, message, fields):
+        self.message = message
+        self.fields = fields
+        self.entries = {}
+        required_by_group = {}
+        for entry in fields:
+            self.entries.setdefault(entry.field.id, entry)
+            if entry.required:
+                required_by_group.setdefault(entry.group_path[-1] if entry.group_path else None, set()).add(entry.field.id)
+        self.required = frozenset(required_by_group.pop(None, ()))
+        self.required_by_group = { group_id : frozenset(tags) for group_id, tags in required_by_group.items() }
+
+    def __contains__(self, tag):
+        return tag in self.entries
+
+    def get(self, tag):
+        return self.entries.get(tag)
+
+
+class FieldValues:
+    # Constant time lookups between the values of an enumerated field and their Enums.
+    # Multiple value fields hold a space separated list of values which decode() splits.
+    __slots__ = ('field', 'multiple', 'by_value', 'by_name')
+
+    def __init__(self, field, codes, multiple):
+        self.field = field
+        self.multiple = multiple
+        self.by_value = { code.value : code for code in codes }
+        self.by_name = { code.symbolic_name : code for code in codes }
+
+    def code(self, value):
+        return self.by_value.get(value)
+
+    def value(self, name):
+        code = self.by_name.get(name)
+        return None if code is None else code.value
+
+    def decode(self, value):
+        # A tuple with the Enum, or None, for each value in the field.
+        if self.multiple:
+            return tuple(self.by_value.get(token) for token in value.split(' '))
+        return (self.by_value.get(value),)
+
+
+class Usage:
+    # A use of a field or component by a message or component. The use is direct if path is
+    # empty, otherwise it is through the components whose componentIDs are in path from the
+    # outermost in. reqd is that of the MsgContent for the thing used and depth is where it
+    # appears in user as in message_fields.
+    __slots__ = ('kind', 'user', 'reqd', 'depth', 'path')
+
+    def __init__(self, kind, user, reqd, depth, path):
+        self.kind = kind
+        self.user = user
+        self.reqd = reqd
+        self.depth = depth
+        self.path = path
+
+
 class Repository:
 
-    enums = {}                  # Enum.id -> [Enum]
-    fields_by_tag = {}          # Field.id -> Field
-    fields_by_name = {}         # Field.name.lower() -> Field
-    data_types = {}             # DataType.name -> DataType
-    components = {}             # Component.Name -> Component
-    components_by_id = {}       # Component.componentID -> Component
-    groups_by_name = {}         # Component.componentID -> Component (this is a subset of components/components_by_id)
-    groups_by_id = {}           # Component.componentID -> Component (this is a subset of components/components_by_id)   
-    msg_contents = {}           # MsgContent.componentID -> [MsgContent]
-    messages = []               # [Message]
-    messages_by_msg_type = {}   # Message.msg_type -> Message
-    messages_by_name = {}       # Message.name.lower() -> Message
-    version = ''
-
-    def __init__(self, directory):
+    # The files a repository is built from and the attributes that make up a loaded model, 
+    # these are what a snapshot is keyed on and what it stores.
+    snapshot_sources = ['Components.xml', 'Datatypes.xml', 'Enums.xml', 'Fields.xml', 'Messages.xml', 'MsgContents.xml']
+    snapshot_attributes = [
+        'version',
+        'enums',
+        'fields_by_tag',
+        'fields_by_name',
+        'data_types',
+        'components',
+        'components_by_id',
+        'groups_by_name',
+        'groups_by_id',
+        'msg_contents',
+        'messages',
+        'messages_by_msg_type',
+        'messages_by_name'
+    ]
+
+    # Each file is parsed by one load method that only populates these attributes so the 
+    # files can be parsed independently and the results combined afterwards.
+    file_loaders = [
+        ('load_components', ['components', 'components_by_id', 'groups_by_name', 'groups_by_id']),
+        ('load_data_types', ['data_types', 'version']),
+        ('load_enums', ['enums']),
+        ('load_fields', ['fields_by_tag', 'fields_by_name']),
+        ('load_messages', ['messages', 'messages_by_msg_type', 'messages_by_name']),
+        ('load_msg_contents', ['msg_contents'])
+    ]
+
+    def __init__(self, directory, cache_directory = None, jobs = 1, profile = None):
         if not os.path.exists(directory):
             raise Exception("directory '{}' does not exist".format(directory))
-        self.load_abbreviations(directory)
-        self.load_categories(directory)
-        self.load_components(directory)
-        self.load_data_types(directory)
-        self.load_enums(directory)
-        self.load_fields(directory)
-        self.load_messages(directory)
-        self.load_msg_contents(directory)
-        self.load_sections(directory)
+        # If profile is a profiling.Profile each phase of loading is recorded in it.
+        self.profile = profile
+        self.clear()
+        self.directory = directory
+        if cache_directory:
+            with profiling.phase(self.profile, 'load_snapshot'):
+                loaded = self.load_snapshot(cache_directory)
+            if loaded:
+                return
+        self.load(directory, jobs)
+        if cache_directory:
+            with profiling.phase(self.profile, 'save_snapshot'):
+                self.save_snapshot(cache_directory)
+
+    def clear(self):
+        self.enums = {}                  # Enum.id -> [Enum]
+        self.fields_by_tag = {}          # Field.id -> Field
+        self.fields_by_name = {}         # Field.name.lower() -> Field
+        self.data_types = {}             # DataType.name -> DataType
+        self.components = {}             # Component.Name -> Component
+        self.components_by_id = {}       # Component.componentID -> Component
+        self.groups_by_name = {}         # Component.componentID -> Component (this is a subset of components/components_by_id)
+        self.groups_by_id = {}           # Component.componentID -> Component (this is a subset of components/components_by_id)   
+        self.msg_contents = {}           # MsgContent.componentID -> [MsgContent]
+        self.messages = []               # [Message]
+        self.messages_by_msg_type = {}   # Message.msg_type -> Message
+        self.messages_by_name = {}       # Message.name.lower() -> Message
+        self.version = ''
+        self.invalidate_caches()
+
+    def load(self, directory, jobs = 1):
+        # The files parsed in worker processes are one phase as they are parsed concurrently.
+        for method in ('load_abbreviations', 'load_categories'):
+            with profiling.phase(self.profile, method):
+                getattr(self, method)(directory)
+        if jobs > 1:
+            with profiling.phase(self.profile, 'load_parallel'):
+                self.load_parallel(directory, jobs)
+        else:
+            for method, _ in self.file_loaders:
+                with profiling.phase(self.profile, method):
+                    getattr(self, method)(directory)
+        with profiling.phase(self.profile, 'load_sections'):
+            self.load_sections(directory)
+
+    def load_parallel(self, directory, jobs):
+        arguments = [(directory, method, attributes) for method, attributes in self.file_loaders]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(jobs, len(arguments))) as executor:
+            for result in executor.map(load_repository_file, arguments):
+                for name, value in result.items():
+                    setattr(self, name, value)
+
+    def snapshot_paths(self):
+        return [os.path.join(self.directory, filename) for filename in self.snapshot_sources]
+
+    def load_snapshot(self, cache_directory):
+        state = snapshot.load(cache_directory, 'repository', self.directory, self.snapshot_paths())
+        if state is None:
+            return False
+        for name in self.snapshot_attributes:
+            setattr(self, name, state[name])
+        return True
+
+    def save_snapshot(self, cache_directory):
+        state = { name : getattr(self, name) for name in self.snapshot_attributes }
+        return snapshot.save(cache_directory, 'repository', self.directory, self.snapshot_paths(), state)
 
     def extract_pedigree(self, element):
-        return Pedigree(
+        return Pedigree.intern(
             element.get('added'),
             element.get('addedEP'),
             element.get('updated'),
@@ -189,7 +386,7 @@ class Repository:
                 componentElement.find('ComponentType').text,
                 componentElement.find('CategoryID').text,
                 componentElement.find('Name').text,
-                description.text if description else '',
+                description.text if description is not None else '',
                 self.extract_pedigree(componentElement)
             )
             self.components[component.name] = component
@@ -340,7 +537,25 @@ class Repository:
     def load_categories(self, directory):
         pass
 
-    def extract_fields(self, componentID, depth):
+    def invalidate_caches(self):
+        # Derived data such as flattened layouts is computed on demand and kept, anything that
+        # modifies the model after it has been loaded must call this.
+        self.flattened = {}
+        self.layouts = {}
+        self.value_tables = None
+        self.referenced_by = None
+        self.usages = {}
+        self.text_index = None
+
+
+    def flatten(self, componentID, depth):
+        # The fields of a component as they appear at a given depth, shared by every message
+        # that references it e.g. StandardHeader and StandardTrailer.
+        key = (componentID, depth)
+        try:
+            return self.flattened[key]
+        except KeyError:
+            pass
         fields = []
         try:
             contents = self.msg_contents[componentID]
@@ -351,16 +566,87 @@ class Repository:
                     fields.append(MessageField(field, content.reqd, depth)) 
                 except ValueError:
                     component = self.components[content.tagText]
-                    fields += self.extract_fields(component.componentID, depth + 1)
+                    fields.extend(self.flatten(component.componentID, depth + 1))
         except KeyError:
-            print("Can't find MsgContent with ComponentID = {}".format(componentID))
+            sys.stderr.writelines("Can't find MsgContent with ComponentID = {}\n".format(componentID))
+        fields = tuple(fields)
+        self.flattened[key] = fields
         return fields
+
+
+    def extract_fields(self, componentID, depth):
+        return list(self.flatten(componentID, depth))
+
+
+    def iter_fields(self, componentID, depth):
+        # A generator equivalent of flatten() that reports, and stops at, the same errors.
+        try:
+            yield from self.flattened[(componentID, depth)]
+            return
+        except KeyError:
+            pass
+        try:
+            contents = self.msg_contents[componentID]
+            for content in contents:
+                try:
+                    id = int(content.tagText)
+                    field = self.fields_by_tag[id]
+                    yield MessageField(field, content.reqd, depth)
+                except ValueError:
+                    component = self.components[content.tagText]
+                    yield from self.iter_fields(component.componentID, depth + 1)
+        except KeyError:
+            sys.stderr.writelines("Can't find MsgContent with ComponentID = {}\n".format(componentID))
     
     
     def message_fields(self, message):
         return self.extract_fields(message.componentID, 0)
 
 
+    def iter_message_fields(self, message):
+        # A lazy equivalent of message_fields for callers that may stop early, it uses but
+        # does not populate the flattened layout cache.
+        return self.iter_fields(message.componentID, 0)
+
+
+    def build_layout(self, componentID, depth, group_path, required, fields):
+        try:
+            contents = self.msg_contents[componentID]
+        except KeyError:
+            sys.stderr.writelines("Can't find MsgContent with ComponentID = {}\n".format(componentID))
+            return
+        for content in contents:
+            content_required = required and content.reqd == '1'
+            if content.tagText.isnumeric():
+                field = self.fields_by_tag[int(content.tagText)]
+                fields.append(LayoutEntry(field, content.reqd, depth, group_path, len(fields), content_required))
+            else:
+                component = self.components[content.tagText]
+                if component.componentID in self.groups_by_id:
+                    # Requiredness within a group is relative to an instance of that group.
+                    self.build_layout(component.componentID, depth + 1, group_path + (component.componentID,), True, fields)
+                else:
+                    self.build_layout(component.componentID, depth + 1, group_path, content_required, fields)
+
+
+    def message_layout(self, message):
+        try:
+            return self.layouts[message.componentID]
+        except KeyError:
+            pass
+        fields = []
+        self.build_layout(message.componentID, 0, (), True, fields)
+        layout = MessageLayout(message, tuple(fields))
+        self.layouts[message.componentID] = layout
+        return layout
+
+
+    def layout_index(self):
+        # MsgType -> MessageLayout for every message, built once and kept until the caches
+        # are invalidated.
+        return { msg_type : self.message_layout(message) for msg_type, message in self.messages_by_msg_type.items() }
+
+
     def field_values(self, field):
         try:
             return self.enums[field.id]
@@ -368,6 +654,99 @@ class Repository:
             return []   
 
 
+    def value_index(self):
+        # Field.id -> FieldValues for every field with enums, built once and kept until the
+        # caches are invalidated.
+        if self.value_tables is None:
+            tables = {}
+            for field in self.fields_by_tag.values():
+                try:
+                    enums = self.enums[field.id]
+                except KeyError:
+                    continue
+                tables[field.id] = FieldValues(field, enums, field.type in multiple_value_types)
+            self.value_tables = tables
+        return self.value_tables
+
+
+    def field_value_table(self, field):
+        # The FieldValues for a field or None if it is not enumerated.
+        return self.value_index().get(field.id)
+
+
+    def decode_values(self, fields):
+        # Returns [(tag, value, enums)] for [(tag, value)] where enums is the result of
+        # FieldValues.decode() or an empty tuple if the field is not enumerated.
+        tables = self.value_index()
+        decoded = []
+        for tag, value in fields:
+            table = tables.get(tag)
+            decoded.append((tag, value, () if table is None else table.decode(value)))
+        return decoded
+
+
+    def component_kind(self, componentID):
+        return 'group' if componentID in self.groups_by_id else 'component'
+
+
+    def reference_index(self):
+        # (kind, id) -> [(user kind, user, MsgContent)] for every MsgContent, built once and
+        # kept until the caches are invalidated. Fields are keyed by tag and components and
+        # groups by componentID.
+        if self.referenced_by is None:
+            messages = { message.componentID : message for message in self.messages }
+            index = {}
+            for componentID, contents in self.msg_contents.items():
+                try:
+                    user_kind, user = ('message', messages[componentID])
+                except KeyError:
+                    try:
+                        user = self.components_by_id[componentID]
+                    except KeyError:
+                        continue
+                    user_kind = self.component_kind(componentID)
+                for content in contents:
+                    if content.tagText.isnumeric():
+                        key = ('field', int(content.tagText))
+                    else:
+                        try:
+                            used = self.components[content.tagText].componentID
+                        except KeyError:
+                            continue
+                        key = (self.component_kind(used), used)
+                    index.setdefault(key, []).append((user_kind, user, content))
+            self.referenced_by = index
+        return self.referenced_by
+
+
+    def where_used(self, kind, id):
+        # A Usage for every message and component that uses a field, group, or component
+        # either directly or through other components. The usages of each component are
+        # kept so those shared by many things are only expanded once.
+        key = (kind, id)
+        try:
+            return self.usages[key]
+        except KeyError:
+            pass
+        usages = []
+        for user_kind, user, content in self.reference_index().get(key, ()):
+            usages.append(Usage(user_kind, user, content.reqd, 0, ()))
+            if user_kind != 'message':
+                for usage in self.where_used(user_kind, user.componentID):
+                    usages.append(Usage(usage.kind, usage.user, content.reqd, usage.depth + 1, usage.path + (user.componentID,)))
+        usages = tuple(usages)
+        self.usages[key] = usages
+        return usages
+
+
+    def search_index(self, cache_directory = None):
+        # The full text search index, kept until the caches are invalidated. Given a cache
+        # directory it is also kept on disk and only rebuilt when the repository changes.
+        if self.text_index is None:
+            self.text_index = search.cached_index(cache_directory, 'repository', self.directory, self.snapshot_paths(), lambda: search.repository_documents(self))
+        return self.text_index
+
+
     def fix_known_errors(self):
         #
         # This method will attempt to fix errors known to exist in the repositories published by fixprotocol.org. 
@@ -402,6 +781,16 @@ class Repository:
 
 
 
+def load_repository_file(arguments):
+    # Runs in a worker process, parse one file into an otherwise empty repository and 
+    # return just the attributes it populated.
+    directory, method, attributes = arguments
+    repository = Repository.__new__(Repository)
+    repository.clear()
+    getattr(repository, method)(directory)
+    return { name : getattr(repository, name) for name in attributes }
+
+
 def dump_field(repository, tag_or_name):
     try:
         field = repository.fields_by_tag[int(tag_or_name)]
@@ -468,6 +857,36 @@ def dump_message(repository, msg_type_or_name):
     print("}")
 
 
+def dump_where_used(repository, tag_or_name):
+    try:
+        field = repository.fields_by_tag[int(tag_or_name)]
+    except (KeyError, ValueError):
+        field = repository.fields_by_name.get(tag_or_name.lower())
+    if field is not None:
+        kind, name, id = 'field', field.name, field.id
+    else:
+        component = None
+        for candidate in repository.components.values():
+            if candidate.name.lower() == tag_or_name.lower():
+                component = candidate
+                break
+        if component is None:
+            print("Could not find a field with Tag or Name, or a component with Name = '{}'".format(tag_or_name))
+            return
+        kind, name, id = repository.component_kind(component.componentID), component.name, component.componentID
+    print("{} (Kind = {}, Id = {}) {{".format(name, kind, id))
+    for usage in repository.where_used(kind, id):
+        if usage.kind == 'message':
+            identity = 'MsgType = ' + usage.user.msgType
+        else:
+            identity = 'ComponentId = ' + usage.user.componentID
+        line = "    {} {} ({}, Required = {}, Depth = {}".format(usage.kind, usage.user.name, identity, usage.reqd, usage.depth)
+        if usage.path:
+            line += ", Via = " + " > ".join(repository.components_by_id[componentID].name for componentID in usage.path)
+        print(line + ")")
+    print("}")
+
+
 def list_messages(repository):
     for message in repository.messages_by_msg_type.values():
         print('{}\t{}'.format(message.msgType, message.name))
@@ -490,20 +909,62 @@ def list_components(repository):
     for component in repository.components.values():
         print(component.name)
 
+def query_commands(repository, cache_directory = None, search_limit = 20):
+    # The queries answered by --batch and --shell, see fixorchestra/shell.py.
+    fields = lambda: [field.name for field in repository.fields_by_tag.values()]
+    messages = lambda: [message.name for message in repository.messages_by_msg_type.values()]
+    return {
+        'field' : shell.Command(lambda argument: dump_field(repository, argument), 'Display the definition of a field by tag or name', fields),
+        'message' : shell.Command(lambda argument: dump_message(repository, argument), 'Display the definition of a message by MsgType or name', messages),
+        'where-used' : shell.Command(lambda argument: dump_where_used(repository, argument), 'Display everything that uses a field by tag or name, or a component by name', lambda: fields() + list(repository.components)),
+        'search' : shell.Command(lambda argument: search.dump_search(repository.search_index(cache_directory), argument, search_limit), 'Display the best matches for some terms'),
+        'list-messages' : shell.Command(lambda argument: list_messages(repository), 'List all the messages'),
+        'list-fields' : shell.Command(lambda argument: list_fields(repository), 'List all the fields'),
+        'list-enumerated-fields' : shell.Command(lambda argument: list_enumerated_fields(repository), 'List all fields with an enumerated value'),
+        'list-components' : shell.Command(lambda argument: list_components(repository), 'List all the components'),
+    }
+
+
 def main():
 
     parser = argparse.ArgumentParser()
     parser.add_argument('--repository', required=True, metavar='directory', help='A directory containing a repository to load e.g. fix_repository_2010_edition_20200402/FIX.4.4/Base')
     parser.add_argument('--dump-field', required=False, metavar='(tag|name)', type=str, help='Display the definition of a field (name is not case sensitive)')
     parser.add_argument('--dump-message', required=False, metavar='(msgtype|name)', help='Display the definition of a message (name is not case sensitive')
+    parser.add_argument('--search', required=False, metavar='terms', help='Display the fields, enums, components, and messages whose names or descriptions best match the terms')
+    parser.add_argument('--search-limit', default=20, type=int, metavar='N', help='The number of --search results to display (default 20)')
+    parser.add_argument('--where-used', required=False, metavar='(tag|name)', help='Display every message and component that uses a field, or a component by name, directly or through other components')
+    parser.add_argument('--batch', required=False, metavar='file', help='Answer the queries in a file, - for stdin, one per line e.g. field 54 or message NewOrderSingle')
+    parser.add_argument('--shell', default=False, action='store_true', help='Answer queries typed into an interactive shell with tab completion')
     parser.add_argument('--list-messages', default=False, action='store_true', help='List all the messages in this repository')
     parser.add_argument('--list-fields', default=False, action='store_true', help='List all the fields in this repository')
     parser.add_argument('--list-enumerated-fields', default=False, action='store_true', help='List all fields with an enumerated value')
     parser.add_argument('--list-components', default=False, action='store_true', help='List all components in this repository')
+    parser.add_argument('--cache-directory', default=snapshot.default_cache_directory(), metavar='directory', help='Where snapshots of loaded repositories are kept (default $FIXORCHESTRA_CACHE or ~/.cache/fixorchestra)')
+    parser.add_argument('--no-cache', default=False, action='store_true', help='Always parse the XML and do not read or write a snapshot')
+    parser.add_argument('--compile', default=False, action='store_true', help='Parse the repository, write its snapshot to the cache, and exit')
+    parser.add_argument('--jobs', default=1, type=int, metavar='N', help='Parse the repository files in N worker processes')
+    parser.add_argument('--profile', default=False, action='store_true', help='Display the time and memory taken by each phase of the load, and the number and size of the objects loaded, on stderr (use --no-cache to profile parsing the XML, tracing memory makes the load 2-3x slower)')
+    parser.add_argument('--export-database', required=False, metavar='file', help='Write the repository to a SQLite database, in the orchestration schema, and exit')
 
     args = parser.parse_args()
 
-    repository = Repository(args.repository)
+    if args.compile:
+        repository = Repository(args.repository, jobs=args.jobs)
+        print(repository.save_snapshot(args.cache_directory))
+        return
+
+    profile = profiling.Profile() if args.profile else None
+    with profiling.phase(profile, 'load'):
+        repository = Repository(args.repository, None if args.no_cache else args.cache_directory, args.jobs, profile)
+    if profile:
+        profile.report(profiling.repository_objects(repository))
+
+    if args.export_database:
+        # Imported here, as in orchestration.py, so loading a repository doesn't import sqlite.
+        from fixorchestra import database
+        print(database.export_repository(repository, args.export_database))
+        return
 
     if args.dump_field:
         dump_field(repository, args.dump_field)
@@ -511,6 +972,12 @@ def main():
     if args.dump_message:
         dump_message(repository, args.dump_message)
 
+    if args.where_used:
+        dump_where_used(repository, args.where_used)
+
+    if args.search:
+        search.dump_search(repository.search_index(None if args.no_cache else args.cache_directory), args.search, args.search_limit)
+
     if args.list_messages:
         list_messages(repository)
 
@@ -523,5 +990,20 @@ def main():
     if args.list_components:
         list_components(repository)
 
+    cache_directory = None if args.no_cache else args.cache_directory
+
+    if args.batch:
+        commands = query_commands(repository, cache_directory, args.search_limit)
+        if args.batch == '-':
+            failures = shell.run_batch(commands, sys.stdin)
+        else:
+            with open(args.batch) as file:
+                failures = shell.run_batch(commands, file)
+        if failures:
+            sys.exit(1)
+
+    if args.shell:
+        shell.Shell(query_commands(repository, cache_directory, args.search_limit), 'fixrepository> ').cmdloop()
+
 if __name__ == '__main__':
     main()
@@ -1,4 +1,306 @@
+import io
 import pytest
+from fixrepository.repository import MsgContent, Repository, dump_where_used, query_commands
+from fixorchestra import database
+from fixorchestra import profiling
+from fixorchestra import shell
+
+REPOSITORY = {
+    'Components.xml' : '''<?xml version="1.0" encoding="UTF-8"?>
+<Components version="FIX.4.4">
+    <Component added="FIX.4.0">
+        <ComponentID>1001</ComponentID>
+        <ComponentType>Block</ComponentType>
+        <CategoryID>Session</CategoryID>
+        <Name>StandardHeader</Name>
+        <Description>The standard FIX message header</Description>
+    </Component>
+    <Component added="FIX.4.0">
+        <ComponentID>1002</ComponentID>
+        <ComponentType>Block</ComponentType>
+        <CategoryID>Session</CategoryID>
+        <Name>StandardTrailer</Name>
+        <Description>The standard FIX message trailer</Description>
+    </Component>
+    <Component added="FIX.4.3">
+        <ComponentID>1012</ComponentID>
+        <ComponentType>BlockRepeating</ComponentType>
+        <CategoryID>Common</CategoryID>
+        <Name>Parties</Name>
+        <Description>The Parties component block</Description>
+    </Component>
+</Components>
+''',
+    'Datatypes.xml' : '''<?xml version="1.0" encoding="UTF-8"?>
+<Datatypes version="FIX.4.4">
+    <Datatype added="FIX.2.7">
+        <Name>int</Name>
+        <Description>Sequence of digits</Description>
+    </Datatype>
+    <Datatype added="FIX.4.3">
+        <Name>NumInGroup</Name>
+        <BaseType>int</BaseType>
+        <Description>Number of entries in a repeating group</Description>
+    </Datatype>
+    <Datatype added="FIX.4.2">
+        <Name>String</Name>
+        <Description>Alpha-numeric free format strings</Description>
+    </Datatype>
+    <Datatype added="FIX.2.7">
+        <Name>char</Name>
+        <Description>Single character value</Description>
+    </Datatype>
+</Datatypes>
+''',
+    'Enums.xml' : '''<?xml version="1.0" encoding="UTF-8"?>
+<Enums version="FIX.4.4">
+    <Enum added="FIX.2.7">
+        <Tag>54</Tag>
+        <Value>1</Value>
+        <SymbolicName>Buy</SymbolicName>
+        <Description>Buy</Description>
+    </Enum>
+    <Enum added="FIX.2.7">
+        <Tag>54</Tag>
+        <Value>2</Value>
+        <SymbolicName>Sell</SymbolicName>
+        <Description>Sell</Description>
+    </Enum>
+    <Enum added="FIX.2.7">
+        <Tag>35</Tag>
+        <Value>0</Value>
+        <SymbolicName>Heartbeat</SymbolicName>
+        <Description>Heartbeat</Description>
+    </Enum>
+    <Enum added="FIX.2.7">
+        <Tag>35</Tag>
+        <Value>D</Value>
+        <SymbolicName>NewOrderSingle</SymbolicName>
+        <Description>NewOrderSingle</Description>
+    </Enum>
+</Enums>
+''',
+    'Fields.xml' : '''<?xml version="1.0" encoding="UTF-8"?>
+<Fields version="FIX.4.4">
+    <Field added="FIX.2.7">
+        <Tag>8</Tag>
+        <Name>BeginString</Name>
+        <Type>String</Type>
+        <Description>Identifies beginning of new message</Description>
+    </Field>
+    <Field added="FIX.2.7">
+        <Tag>10</Tag>
+        <Name>CheckSum</Name>
+        <Type>String</Type>
+        <Description>Three byte, simple checksum</Description>
+    </Field>
+    <Field added="FIX.2.7">
+        <Tag>11</Tag>
+        <Name>ClOrdID</Name>
+        <Type>String</Type>
+        <Description>Unique identifier for Order</Description>
+    </Field>
+    <Field added="FIX.2.7">
+        <Tag>35</Tag>
+        <Name>MsgType</Name>
+        <Type>String</Type>
+        <Description>Defines message type</Description>
+    </Field>
+    <Field added="FIX.2.7">
+        <Tag>54</Tag>
+        <Name>Side</Name>
+        <Type>char</Type>
+        <Description>Side of order</Description>
+    </Field>
+    <Field added="FIX.4.3">
+        <Tag>448</Tag>
+        <Name>PartyID</Name>
+        <Type>String</Type>
+        <Description>Party identifier/code</Description>
+    </Field>
+    <Field added="FIX.4.3">
+        <Tag>453</Tag>
+        <Name>NoPartyIDs</Name>
+        <Type>NumInGroup</Type>
+        <Description>Number of PartyID entries</Description>
+    </Field>
+</Fields>
+''',
+    'Messages.xml' : '''<?xml version="1.0" encoding="UTF-8"?>
+<Messages version="FIX.4.4">
+    <Message added="FIX.2.7">
+        <ComponentID>1</ComponentID>
+        <MsgType>0</MsgType>
+        <Name>Heartbeat</Name>
+        <CategoryID>Session</CategoryID>
+        <SectionID>Session</SectionID>
+        <Description>The Heartbeat monitors the status of the communication link.</Description>
+    </Message>
+    <Message added="FIX.2.7">
+        <ComponentID>14</ComponentID>
+        <MsgType>D</MsgType>
+        <Name>NewOrderSingle</Name>
+        <CategoryID>SingleGeneralOrderHandling</CategoryID>
+        <SectionID>Trade</SectionID>
+        <Description>The new order message type is used by institutions wishing to electronically submit orders.</Description>
+    </Message>
+</Messages>
+''',
+    'MsgContents.xml' : '''<?xml version="1.0" encoding="UTF-8"?>
+<MsgContents version="FIX.4.4">
+    <MsgContent added="FIX.4.0"><ComponentID>1001</ComponentID><TagText>8</TagText><Indent>0</Indent><Position>1</Position><Reqd>1</Reqd></MsgContent>
+    <MsgContent added="FIX.4.0"><ComponentID>1001</ComponentID><TagText>35</TagText><Indent>0</Indent><Position>2</Position><Reqd>1</Reqd></MsgContent>
+    <MsgContent added="FIX.4.0"><ComponentID>1002</ComponentID><TagText>10</TagText><Indent>0</Indent><Position>1</Position><Reqd>1</Reqd></MsgContent>
+    <MsgContent added="FIX.4.3"><ComponentID>1012</ComponentID><TagText>453</TagText><Indent>0</Indent><Position>1</Position><Reqd>0</Reqd></MsgContent>
+    <MsgContent added="FIX.4.3"><ComponentID>1012</ComponentID><TagText>448</TagText><Indent>1</Indent><Position>2</Position><Reqd>0</Reqd></MsgContent>
+    <MsgContent added="FIX.2.7"><ComponentID>1</ComponentID><TagText>StandardHeader</TagText><Indent>0</Indent><Position>1</Position><Reqd>1</Reqd><Description>MsgType = 0</Description></MsgContent>
+    <MsgContent added="FIX.2.7"><ComponentID>1</ComponentID><TagText>StandardTrailer</TagText><Indent>0</Indent><Position>2</Position><Reqd>1</Reqd></MsgContent>
+    <MsgContent added="FIX.2.7"><ComponentID>14</ComponentID><TagText>StandardHeader</TagText><Indent>0</Indent><Position>1</Position><Reqd>1</Reqd><Description>MsgType = D</Description></MsgContent>
+    <MsgContent added="FIX.2.7"><ComponentID>14</ComponentID><TagText>11</TagText><Indent>0</Indent><Position>2</Position><Reqd>1</Reqd></MsgContent>
+    <MsgContent added="FIX.4.3"><ComponentID>14</ComponentID><TagText>Parties</TagText><Indent>0</Indent><Position>3</Position><Reqd>0</Reqd></MsgContent>
+    <MsgContent added="FIX.2.7"><ComponentID>14</ComponentID><TagText>54</TagText><Indent>0</Indent><Position>4</Position><Reqd>1</Reqd></MsgContent>
+    <MsgContent added="FIX.2.7"><ComponentID>14</ComponentID><TagText>StandardTrailer</TagText><Indent>0</Indent><Position>5</Position><Reqd>1</Reqd></MsgContent>
+</MsgContents>
+'''
+}
+
+
+@pytest.fixture
+def repository_directory(tmp_path):
+    for filename, content in REPOSITORY.items():
+        (tmp_path / filename).write_text(content)
+    return str(tmp_path)
+
 
 def test_repository():
     pass
+
+
+def test_snapshot(repository_directory, tmp_path, monkeypatch):
+    cache_directory = str(tmp_path / 'cache')
+    Repository(repository_directory, cache_directory)
+    def fail(self, directory, jobs):
+        raise AssertionError('snapshot was not used')
+    monkeypatch.setattr(Repository, 'load', fail)
+    repository = Repository(repository_directory, cache_directory)
+    assert repository.version == 'FIX.4.4'
+    assert repository.fields_by_tag[54].name == 'Side'
+    assert [enum.value for enum in repository.enums[54]] == ['1', '2']
+    assert [field.field.id for field in repository.message_fields(repository.messages_by_msg_type['D'])] == [8, 35, 11, 453, 448, 54, 10]
+
+
+def test_instances_are_independent(repository_directory, tmp_path):
+    other_directory = tmp_path / 'other'
+    other_directory.mkdir()
+    for filename, content in REPOSITORY.items():
+        (other_directory / filename).write_text(content.replace('<Name>Side</Name>', '<Name>OrderSide</Name>'))
+    repository = Repository(repository_directory)
+    other = Repository(str(other_directory))
+    assert repository.fields_by_tag[54].name == 'Side'
+    assert other.fields_by_tag[54].name == 'OrderSide'
+    assert len(repository.messages) == 2
+
+
+def test_parallel_load(repository_directory):
+    serial = Repository(repository_directory)
+    parallel = Repository(repository_directory, jobs=3)
+    assert parallel.version == serial.version
+    for name in Repository.snapshot_attributes:
+        assert len(getattr(parallel, name)) == len(getattr(serial, name)), name
+    assert list(parallel.fields_by_tag) == list(serial.fields_by_tag)
+    assert parallel.groups_by_name['Parties'].componentID == '1012'
+    assert [field.field.id for field in parallel.message_fields(parallel.messages_by_msg_type['D'])] == [8, 35, 11, 453, 448, 54, 10]
+
+
+def test_message_fields_cached(repository_directory, capsys):
+    repository = Repository(repository_directory)
+    new_order = repository.messages_by_msg_type['D']
+    fields = repository.message_fields(new_order)
+    assert repository.message_fields(repository.messages_by_msg_type['0'])[0] is fields[0]
+    assert [(field.field.id, field.depth) for field in repository.iter_message_fields(new_order)] == [(field.field.id, field.depth) for field in fields]
+    del repository.msg_contents['1002']
+    repository.invalidate_caches()
+    assert [field.field.id for field in repository.message_fields(new_order)] == [8, 35, 11, 453, 448, 54]
+    captured = capsys.readouterr()
+    assert captured.out == ''
+    assert "Can't find MsgContent with ComponentID = 1002" in captured.err
+    # A malformed repository is reported, not raised, by both message_fields and iter_message_fields.
+    for tag_text in ('9999', 'NoSuchComponent'):
+        contents = repository.msg_contents['14']
+        contents.insert(2, MsgContent('14', tag_text, '0', '3', '0', None, None))
+        repository.invalidate_caches()
+        fields = [(field.field.id, field.depth) for field in repository.iter_message_fields(new_order)]
+        assert capsys.readouterr().err == "Can't find MsgContent with ComponentID = 14\n"
+        assert fields == [(field.field.id, field.depth) for field in repository.message_fields(new_order)]
+        assert capsys.readouterr().err == "Can't find MsgContent with ComponentID = 14\n"
+        del contents[2]
+
+
+def test_layout_index(repository_directory):
+    repository = Repository(repository_directory)
+    layout = repository.layout_index()['D']
+    assert 448 in layout and 55 not in layout
+    assert layout.get(448).group_path == ('1012',)
+    assert layout.required == frozenset([8, 35, 11, 54, 10])
+    assert [entry.field.id for entry in layout.fields] == [field.field.id for field in repository.message_fields(layout.message)]
+
+
+def test_value_index(repository_directory):
+    repository = Repository(repository_directory)
+    side = repository.field_value_table(repository.fields_by_tag[54])
+    assert side.code('1').symbolic_name == 'Buy'
+    assert side.value('Sell') == '2' and side.value('Cross') is None
+    assert not side.multiple
+    decoded = repository.decode_values([(35, 'D'), (54, '3'), (11, 'abc')])
+    assert [(tag, tuple(enum.symbolic_name if enum else None for enum in enums)) for tag, value, enums in decoded] == \
+        [(35, ('NewOrderSingle',)), (54, (None,)), (11, ())]
+
+
+def test_export_database(repository_directory, tmp_path):
+    repository = Repository(repository_directory)
+    db = database.Database(database.export_repository(repository, str(tmp_path / 'repository.db')))
+    assert db.version == 'FIX.4.4'
+    assert db.fields_by_tag[54].type == 'SideCodeSet'
+    assert [code.value for code in db.code_sets['SideCodeSet'].codes] == ['1', '2']
+    message = db.messages_by_name['newordersingle']
+    assert message.msg_type == 'D'
+    assert [(reference.kind, reference.id) for reference in message.references] == [('component', '1001'), ('field', 11), ('group', '1012'), ('field', 54), ('component', '1002')]
+    db.close()
+
+
+def test_where_used(repository_directory, capsys):
+    repository = Repository(repository_directory)
+    assert [(usage.kind, usage.user.name, usage.reqd, usage.depth, usage.path) for usage in repository.where_used('field', 448)] == \
+        [('group', 'Parties', '0', 0, ()), ('message', 'NewOrderSingle', '0', 1, ('1012',))]
+    assert [usage.user.name for usage in repository.where_used('field', 8)] == ['StandardHeader', 'Heartbeat', 'NewOrderSingle']
+    assert repository.where_used('field', 55) == ()
+    dump_where_used(repository, 'parties')
+    assert capsys.readouterr().out == 'Parties (Kind = group, Id = 1012) {\n    message NewOrderSingle (MsgType = D, Required = 0, Depth = 0)\n}\n'
+
+
+def test_search(repository_directory):
+    repository = Repository(repository_directory)
+    results = repository.search_index().search('buy')
+    assert [str(document) for score, document in results] == ['code 54=1 Buy']
+    assert str(repository.search_index().search('party')[0][1]) == 'group 1012 Parties'
+
+
+def test_query_commands(repository_directory, capsys):
+    repository = Repository(repository_directory)
+    assert shell.run_batch(query_commands(repository), io.StringIO('field 54\nwhere-used parties\nlist-components\n')) == 0
+    output = capsys.readouterr().out
+    assert output.startswith('Side {') and output.endswith('StandardHeader\nStandardTrailer\nParties\n')
+    assert 'message NewOrderSingle (MsgType = D, Required = 0, Depth = 0)' in output
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_profile(repository_directory, jobs):
+    profile = profiling.Profile()
+    repository = Repository(repository_directory, jobs=jobs, profile=profile)
+    loaders = [method for method, _ in Repository.file_loaders] if jobs == 1 else ['load_parallel']
+    assert [phase.name for phase in profile.phases] == ['load_abbreviations', 'load_categories'] + loaders + ['load_sections']
+    profile.count(profiling.repository_objects(repository))
+    profile.close()
+    assert profile.objects['enums'][0] == sum(len(enums) for enums in repository.enums.values())
+    assert profile.objects['messages'][0] == len(repository.messages)
+    assert profile.peak > 0
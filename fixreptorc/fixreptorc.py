@@ -1,29 +1,15 @@
 #!/usr/bin/env python3
 
 import argparse
+import concurrent.futures
+import glob
 import os
 import sys
+import time
 sys.path.append("..")
-import xml.etree.ElementTree as ET
 import fixorchestra.orchestration as orc
 import fixrepository.repository as rep
-
-def indent(elem, level=0):
-    i = "\n" + level*"  "
-    j = "\n" + (level-1)*"  "
-    if len(elem):
-        if not elem.text or not elem.text.strip():
-            elem.text = i + "  "
-        if not elem.tail or not elem.tail.strip():
-            elem.tail = i
-        for subelem in elem:
-            indent(subelem, level+1)
-        if not elem.tail or not elem.tail.strip():
-            elem.tail = j
-    else:
-        if level and (not elem.tail or not elem.tail.strip()):
-            elem.tail = j
-    return elem
+from fixorchestra import profiling
 
 def build_references(repository, componentID):
     references = []
@@ -34,7 +20,7 @@ def build_references(repository, componentID):
             presence = 'optional'
         try:
             field = repository.fields_by_tag[int(content.tagText)]
-            references.append(orc.Reference(field.id, None, content.componentID, presence, content.description, content.pedigree))
+            references.append(orc.Reference(field.id, None, None, presence, content.description, content.pedigree))
         except ValueError:
             try:
                 group = repository.groups_by_name[content.tagText]
@@ -50,78 +36,162 @@ def build_references(repository, componentID):
     return references
 
 
-def main():
-    
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--repository', required=True, metavar='directory', help='A directory containing a repository to load e.g. fix_repository_2010_edition_20200402/FIX.4.4/Base')
-
-    args = parser.parse_args()
-
-    repository = rep.Repository(args.repository)
-    repository.fix_known_errors()
-
+def convert(repository, profile = None):
+    # Returns an Orchestration with the same content as a Repository. If profile is a
+    # profiling.Profile each section of the conversion is recorded in it.
     orchestration = orc.Orchestration()
 
     # version
     orchestration.version = repository.version
 
-    # data types
-    for source in repository.data_types.values():
-        target = orc.DataType(source.name, source.base_type, source.description, source.pedigree)
-        orchestration.data_types[target.name] = target
+    with profiling.phase(profile, 'convert_data_types'):
+        for source in repository.data_types.values():
+            target = orc.DataType(source.name, source.base_type, source.description, source.pedigree)
+            orchestration.data_types[target.name] = target
     
-    # code sets
-    for source in repository.fields_by_tag.values():
-        try:
-            enum = repository.enums[source.id]
-            codes = [orc.Code(value.id * 1000 + index, value.symbolic_name, value.value, value.description, value.pedigree) for index, value in enumerate(enum, start=1)]
-            target = orc.CodeSet(source.id, source.name + 'CodeSet', source.type, source.description, source.pedigree, codes)
-            orchestration.code_sets[target.name] = target
-        except KeyError:
-            pass
-
-    # fields
-    for source in repository.fields_by_tag.values():
-        type = source.type
-        discriminator_id = None
-        if source.id in repository.enums:
-            type = source.name + 'CodeSet'
-        discriminator_field_name = source.name + 'Source'
-        try:
-            discriminator_field = repository.fields_by_name[discriminator_field_name.lower()]
-            discriminator_id = discriminator_field.id
-        except KeyError:
-            pass    
-        target = orc.Field(source.id, source.name, type, source.description, source.pedigree, discriminator_id)
-        orchestration.fields_by_tag[target.id] = target
-        orchestration.fields_by_name[target.name] = target
-
-    # groups
+    with profiling.phase(profile, 'convert_code_sets'):
+        for source in repository.fields_by_tag.values():
+            try:
+                enum = repository.enums[source.id]
+                codes = [orc.Code(value.id * 1000 + index, value.symbolic_name, value.value, value.description, value.pedigree) for index, value in enumerate(enum, start=1)]
+                target = orc.CodeSet(source.id, source.name + 'CodeSet', source.type, source.description, source.pedigree, codes)
+                orchestration.code_sets[target.name] = target
+            except KeyError:
+                pass
+
+    with profiling.phase(profile, 'convert_fields'):
+        for source in repository.fields_by_tag.values():
+            type = source.type
+            discriminator_id = None
+            if source.id in repository.enums:
+                type = source.name + 'CodeSet'
+            discriminator_field_name = source.name + 'Source'
+            try:
+                discriminator_field = repository.fields_by_name[discriminator_field_name.lower()]
+                discriminator_id = discriminator_field.id
+            except KeyError:
+                pass    
+            target = orc.Field(source.id, source.name, type, source.description, source.pedigree, discriminator_id)
+            orchestration.fields_by_tag[target.id] = target
+            orchestration.fields_by_name[target.name] = target
+
     # TODO - This does not work for FIX.4.2 - later versions only
     # TODO - FIX.4.4 contains MsgTypeGrp which isn't defined
     # TODO - FIX.4.4 contains Hop which has type ImplicitBlock
-    for source in repository.groups_by_id.values():
-        references = build_references(repository, source.componentID)
-        target = orc.Group(source.componentID, source.name, source.categoryID, source.description, source.pedigree, references)
-        orchestration.groups[target.id] = target
-
-    # components
-    for source in repository.components.values():
-        references = build_references(repository, source.componentID)
-        target = orc.Component(source.componentID, source.name, source.categoryID, source.description, source.pedigree, references)
-        orchestration.components[target.id] = target
-
-    # messages
-    for source in repository.messages_by_msg_type.values():
-        references = build_references(repository, source.componentID)
-        target = orc.Message(source.componentID, source.name, source.msgType, source.categoryID, source.description, source.pedigree, references)
-        orchestration.messages_by_msg_type[target.msg_type] = target
-        orchestration.messages_by_name[target.name] = target
-   
-    xml = orchestration.to_xml()
-
-    print('<?xml version="1.0" encoding="UTF-8"?>')
-    ET.dump(indent(xml))
+    with profiling.phase(profile, 'convert_groups'):
+        for source in repository.groups_by_id.values():
+            references = build_references(repository, source.componentID)
+            target = orc.Group(source.componentID, source.name, source.categoryID, source.description, source.pedigree, references)
+            orchestration.groups[target.id] = target
+
+    with profiling.phase(profile, 'convert_components'):
+        for source in repository.components.values():
+            references = build_references(repository, source.componentID)
+            target = orc.Component(source.componentID, source.name, source.categoryID, source.description, source.pedigree, references)
+            orchestration.components[target.id] = target
+
+    with profiling.phase(profile, 'convert_messages'):
+        for source in repository.messages_by_msg_type.values():
+            references = build_references(repository, source.componentID)
+            target = orc.Message(source.componentID, source.name, source.msgType, source.categoryID, source.description, source.pedigree, references)
+            orchestration.messages[target.id] = target
+            orchestration.messages_by_msg_type[target.msg_type] = target
+            orchestration.messages_by_name[target.name] = target
+
+    return orchestration
+
+
+def find_versions(edition):
+    # The Base directory of every version in an edition e.g. fix_repository_2010_edition_20200402/FIX.4.4/Base
+    return sorted(directory for directory in glob.glob(os.path.join(edition, '*', 'Base')) if os.path.isdir(directory))
+
+
+def convert_version(arguments):
+    # Convert one repository directory to <version directory name>.xml in the output directory.
+    # Runs in a worker process so it returns what happened rather than printing it.
+    directory, output_directory = arguments
+    name = os.path.basename(os.path.dirname(os.path.abspath(directory)))
+    filename = os.path.join(output_directory, name + '.xml')
+    start = time.perf_counter()
+    repository = rep.Repository(directory)
+    repository.fix_known_errors()
+    loaded = time.perf_counter()
+    orchestration = convert(repository)
+    converted = time.perf_counter()
+    with open(filename, 'w') as file:
+        orchestration.write_xml(file)
+    written = time.perf_counter()
+    return name, filename, (loaded - start, converted - loaded, written - converted, written - start)
+
+
+def convert_edition(edition, output_directory, jobs):
+    # Yields (directory, result, error) for each version as it completes.
+    tasks = [(directory, output_directory) for directory in find_versions(edition)]
+    if not tasks:
+        raise Exception("no FIX.x.y/Base directories found in '{}'".format(edition))
+    os.makedirs(output_directory, exist_ok=True)
+    if jobs > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = { executor.submit(convert_version, task) : task[0] for task in tasks }
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as ex:
+                    yield futures[future], None, ex
+    else:
+        for task in tasks:
+            try:
+                yield task[0], convert_version(task), None
+            except Exception as ex:
+                yield task[0], None, ex
+
+
+def main():
+    
+    parser = argparse.ArgumentParser()
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--repository', metavar='directory', help='A directory containing a repository to load e.g. fix_repository_2010_edition_20200402/FIX.4.4/Base')
+    source.add_argument('--edition', metavar='directory', help='Convert every FIX.x.y/Base directory in a repository edition e.g. fix_repository_2010_edition_20200402')
+    parser.add_argument('--output-directory', default='.', metavar='directory', help='Where --edition writes an orchestration for each version e.g. FIX.4.4.xml')
+    parser.add_argument('--jobs', default=1, type=int, metavar='N', help='Parse the repository files, or with --edition convert the versions, in N worker processes')
+    parser.add_argument('--profile', default=False, action='store_true', help='Display the time and memory taken by each phase of loading, converting, and writing, and the number and size of the objects in the repository and orchestration, on stderr (tracing memory makes everything 2-3x slower)')
+
+    args = parser.parse_args()
+
+    if args.edition:
+        if args.profile:
+            parser.error('--profile is not supported with --edition, it already displays the load, convert, and write time of each version')
+        start = time.perf_counter()
+        failed = 0
+        for directory, result, error in convert_edition(args.edition, args.output_directory, args.jobs):
+            if error is not None:
+                failed += 1
+                sys.stderr.writelines('{} failed: {}\n'.format(directory, error))
+                continue
+            name, filename, (load, conversion, write, total) = result
+            print('{} -> {} load = {:.3f}s convert = {:.3f}s write = {:.3f}s total = {:.3f}s'.format(name, filename, load, conversion, write, total), flush=True)
+        print('Elapsed = {:.3f}s'.format(time.perf_counter() - start))
+        if failed > 0:
+            sys.exit(1)
+        return
+
+    profile = profiling.Profile() if args.profile else None
+
+    with profiling.phase(profile, 'load'):
+        repository = rep.Repository(args.repository, jobs=args.jobs, profile=profile)
+    with profiling.phase(profile, 'fix_known_errors'):
+        repository.fix_known_errors()
+
+    with profiling.phase(profile, 'convert'):
+        orchestration = convert(repository, profile)
+
+    with profiling.phase(profile, 'write_xml'):
+        orchestration.write_xml(sys.stdout)
+
+    if profile:
+        objects = { 'repository ' + kind : values for kind, values in profiling.repository_objects(repository).items() }
+        objects.update(('orchestration ' + kind, values) for kind, values in profiling.orchestration_objects(orchestration).items())
+        profile.report(objects)
 
 if __name__ == '__main__':
     main()
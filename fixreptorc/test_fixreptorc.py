@@ -0,0 +1,78 @@
+import io
+import pytest
+from fixorchestra.orchestration import Orchestration
+from fixrepository.test_repository import REPOSITORY
+from fixreptorc.fixreptorc import *
+from fixorchestra import codegen
+from fixorchestra import diff
+from fixorchestra import profiling
+import fixrepository.repository as rep
+
+
+@pytest.fixture
+def edition(tmp_path):
+    for version in ['FIX.4.2', 'FIX.4.4']:
+        directory = tmp_path / 'edition' / version / 'Base'
+        directory.mkdir(parents=True)
+        for filename, content in REPOSITORY.items():
+            (directory / filename).write_text(content.replace('version="FIX.4.4"', 'version="{}"'.format(version)))
+    (tmp_path / 'edition' / 'Schema').mkdir()
+    return str(tmp_path / 'edition')
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_convert_edition(edition, tmp_path, jobs):
+    output_directory = str(tmp_path / 'output')
+    results = list(convert_edition(edition, output_directory, jobs))
+    assert [error for directory, result, error in results] == [None, None]
+    assert sorted(result[0] for directory, result, error in results) == ['FIX.4.2', 'FIX.4.4']
+    orchestration = Orchestration(os.path.join(output_directory, 'FIX.4.2.xml'))
+    assert orchestration.version == 'FIX.4.2'
+    assert orchestration.messages_by_msg_type['D'].name == 'NewOrderSingle'
+
+
+def test_convert_edition_without_versions(tmp_path):
+    with pytest.raises(Exception):
+        list(convert_edition(str(tmp_path), str(tmp_path / 'output'), 1))
+
+
+def test_convert_profile(edition):
+    profile = profiling.Profile(trace_memory=False)
+    repository = rep.Repository(find_versions(edition)[1])
+    orchestration = convert(repository, profile)
+    assert [phase.name for phase in profile.phases] == ['convert_data_types', 'convert_code_sets', 'convert_fields', 'convert_groups', 'convert_components', 'convert_messages']
+    assert orchestration.messages_by_msg_type['D'].name == 'NewOrderSingle'
+
+
+def test_generate_module_from_converted_repository(edition, tmp_path, monkeypatch):
+    orchestration = convert(rep.Repository(find_versions(edition)[1]))
+    codegen.write_module(orchestration, str(tmp_path / 'converted_dict.py'))
+    assert codegen.generate(orchestration).startswith('# Generated from FIX.4.4 by fixorchestra')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    import converted_dict
+    assert converted_dict.Tag.Side == 54 and converted_dict.MsgType.NewOrderSingle == 'D'
+
+
+def test_diff_converted_repositories(edition, tmp_path):
+    directory = tmp_path / 'newer'
+    directory.mkdir()
+    for filename, content in REPOSITORY.items():
+        if filename == 'Messages.xml':
+            content = content.replace('<Description>The Heartbeat monitors', '<Description>The Heartbeat checks')
+        (directory / filename).write_text(content)
+    old = convert(rep.Repository(find_versions(edition)[1]))
+    new = convert(rep.Repository(str(directory)))
+    assert sorted(old.messages) == ['1', '14']
+    assert diff.diff(old, old) == []
+    assert [str(change) for change in diff.diff(old, new)] == ['message 1 (Heartbeat) changed']
+
+
+def test_convert_component_descriptions(edition):
+    repository = rep.Repository(find_versions(edition)[1])
+    assert repository.components['Parties'].description == 'The Parties component block'
+    orchestration = convert(repository)
+    assert orchestration.groups['1012'].synopsis == 'The Parties component block'
+    output = io.StringIO()
+    orchestration.write_xml(output)
+    for description in ('The standard FIX message header', 'The Parties component block'):
+        assert '<fixr:documentation purpose="SYNOPSIS">{}</fixr:documentation>'.format(description) in output.getvalue()
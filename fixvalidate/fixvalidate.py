@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+import argparse
+import concurrent.futures
+import os
+import sys
+sys.path.append("..")
+from fixorchestra.orchestration import *
+from fixorchestra import snapshot
+from fixorchestra import tagvalue
+
+UNKNOWN_TAG = 'unknown tag'
+TAG_NOT_IN_MESSAGE = 'tag not in message'
+MISSING_REQUIRED = 'missing required field'
+INVALID_VALUE = 'invalid value'
+UNKNOWN_MSG_TYPE = 'unknown MsgType'
+MISSING_MSG_TYPE = 'missing MsgType'
+MALFORMED_FIELD = 'malformed field'
+
+
+class Validator:
+    # Checks raw tag=value messages against an orchestration. Everything that can be is
+    # precomputed so each field costs a handful of dictionary lookups. Fields within repeating
+    # groups are checked for membership and values but group instances are not reconstructed
+    # so fields only required within a group are not reported as missing.
+
+    def __init__(self, orchestration):
+        self.orchestration = orchestration
+        self.layouts = orchestration.layout_index()
+        self.fields_by_tag = orchestration.fields_by_tag
+        self.values = {}                # Field.id -> { valid value : Code }
+        self.multiple_values = set()    # Field.id where the value is a space separated list
+        for id, table in orchestration.value_index().items():
+            self.values[id] = table.by_value
+            if table.multiple:
+                self.multiple_values.add(id)
+
+
+    def validate(self, fields):
+        # Returns (msg_type, [(error, tag, detail)])
+        errors = []
+        msg_type = None
+        for tag, value in fields:
+            if tag == 35:
+                msg_type = value
+                break
+        if msg_type is None:
+            errors.append((MISSING_MSG_TYPE, 35, None))
+            layout = None
+        else:
+            layout = self.layouts.get(msg_type)
+            if layout is None:
+                errors.append((UNKNOWN_MSG_TYPE, 35, msg_type))
+        present = set()
+        for tag, value in fields:
+            if tag is None:
+                errors.append((MALFORMED_FIELD, None, value))
+                continue
+            present.add(tag)
+            if tag not in self.fields_by_tag:
+                errors.append((UNKNOWN_TAG, tag, value))
+                continue
+            if layout is not None and tag not in layout.entries:
+                errors.append((TAG_NOT_IN_MESSAGE, tag, value))
+            valid_values = self.values.get(tag)
+            if valid_values is not None:
+                if tag in self.multiple_values:
+                    invalid = [token for token in value.split(' ') if token not in valid_values]
+                    if invalid:
+                        errors.append((INVALID_VALUE, tag, ' '.join(invalid)))
+                elif value not in valid_values:
+                    errors.append((INVALID_VALUE, tag, value))
+        if layout is not None:
+            for tag in sorted(layout.required - present):
+                errors.append((MISSING_REQUIRED, tag, None))
+        return msg_type, errors
+
+
+def format_error(orchestration, error):
+    kind, tag, detail = error
+    if tag is None:
+        return '{} {}'.format(kind, detail)
+    try:
+        name = orchestration.fields_by_tag[tag].name
+        described = '{} ({})'.format(tag, name)
+    except KeyError:
+        described = str(tag)
+    if detail is None:
+        return '{} {}'.format(kind, described)
+    return '{} {} = {}'.format(kind, described, detail)
+
+
+# The validator used by worker processes, set by initialise_worker.
+worker_validator = None
+
+
+def initialise_worker(orchestration_filename, loader, cache_directory):
+    global worker_validator
+    worker_validator = Validator(Orchestration(orchestration_filename, loader, cache_directory))
+
+
+def validate_range(arguments):
+    # Validate the messages beginning within [start, end) of a log. Returns the number of
+    # messages, error counts by kind, and (offset, msg_type, errors) for each invalid message.
+    filename, start, end, separator, collect = arguments
+    buffer = tagvalue.map_file(filename)
+    messages = 0
+    counts = {}
+    invalid = []
+    for offset, message in tagvalue.iter_messages(buffer, separator, start, end):
+        messages += 1
+        msg_type, errors = worker_validator.validate(tagvalue.parse_fields(message, separator))
+        if errors:
+            for error in errors:
+                counts[error[0]] = counts.get(error[0], 0) + 1
+            if collect:
+                invalid.append((offset, msg_type, errors))
+            else:
+                invalid.append((offset, msg_type, None))
+    return messages, counts, invalid
+
+
+def validate_logs(orchestration, filenames, separator = tagvalue.SOH, jobs = 1, loader = 'tree', cache_directory = None, collect = True):
+    # Yields (filename, messages, counts, invalid) for each range of each log in order. Worker
+    # processes load their own copy of the orchestration, ideally from a snapshot.
+    global worker_validator
+    tasks = []
+    for filename in filenames:
+        size = os.path.getsize(filename)
+        for start, end in tagvalue.split_ranges(size, jobs * 4 if jobs > 1 else 1):
+            tasks.append((filename, start, end, separator, collect))
+    if jobs > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=initialise_worker, initargs=(orchestration.filename, loader, cache_directory)) as executor:
+            for task, result in zip(tasks, executor.map(validate_range, tasks)):
+                yield (task[0],) + result
+    else:
+        worker_validator = Validator(orchestration)
+        for task in tasks:
+            yield (task[0],) + validate_range(task)
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orchestration', required=True, metavar='file', help='The orchestration to validate messages against')
+    parser.add_argument('--separator', default='\x01', metavar='char', help='The field separator, defaults to SOH, | is common in logs')
+    parser.add_argument('--jobs', default=1, type=int, metavar='N', help='Validate in N worker processes')
+    parser.add_argument('--summary-only', default=False, action='store_true', help='Only display the summary counts and not the errors for each message')
+    parser.add_argument('--loader', default='expat', choices=Orchestration.loaders, help='The XML loading strategy for the orchestration')
+    parser.add_argument('--cache-directory', default=snapshot.default_cache_directory(), metavar='directory', help='Where snapshots of loaded orchestrations are kept (default $FIXORCHESTRA_CACHE or ~/.cache/fixorchestra)')
+    parser.add_argument('--no-cache', default=False, action='store_true', help='Always parse the XML and do not read or write a snapshot')
+    parser.add_argument('logs', nargs='+', metavar='log', help='Files containing raw tag=value FIX messages')
+
+    args = parser.parse_args()
+
+    cache_directory = None if args.no_cache else args.cache_directory
+    separator = args.separator.encode('latin-1')
+
+    # Load once in this process first so a cold cache is filled before the workers start.
+    orchestration = Orchestration(args.orchestration, args.loader, cache_directory)
+
+    messages = 0
+    invalid_messages = 0
+    counts = {}
+    for filename, range_messages, range_counts, invalid in validate_logs(orchestration, args.logs, separator, args.jobs, args.loader, cache_directory, not args.summary_only):
+        messages += range_messages
+        invalid_messages += len(invalid)
+        for kind, count in range_counts.items():
+            counts[kind] = counts.get(kind, 0) + count
+        if args.summary_only:
+            continue
+        for offset, msg_type, errors in invalid:
+            for error in errors:
+                print('{}:{} MsgType={} {}'.format(filename, offset, msg_type, format_error(orchestration, error)))
+
+    print('Messages = {} Valid = {} Invalid = {}'.format(messages, messages - invalid_messages, invalid_messages))
+    for kind, count in sorted(counts.items()):
+        print('{} = {}'.format(kind, count))
+
+    if invalid_messages > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import pytest
+from fixorchestra.orchestration import Orchestration
+from fixorchestra.test_orchestration import ORCHESTRATION
+from fixorchestra import tagvalue
+from fixvalidate.fixvalidate import *
+
+LOG = b'''2024-01-01 12:00:00 8=FIX.4.4|35=D|11=abc|54=1|18=1 2|453=1|448=X|10=123|
+2024-01-01 12:00:01 8=FIX.4.4|35=D|11=abc|54=7|18=1 3|999=1|58=8=FIX|10=123|
+2024-01-01 12:00:02 8=FIX.4.4|35=0|11=x|10=000|
+8=FIX.4.4|35=Z|10=000|8=FIX.4.4|35=0|
+'''
+
+
+@pytest.fixture
+def orchestration_file(tmp_path):
+    path = tmp_path / 'orchestration.xml'
+    path.write_text(ORCHESTRATION)
+    return str(path)
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / 'messages.log'
+    path.write_bytes(LOG)
+    return str(path)
+
+
+def test_iter_messages():
+    messages = list(tagvalue.iter_messages(LOG, b'|'))
+    assert len(messages) == 5
+    offset, message = messages[1]
+    assert LOG[offset:].startswith(message)
+    assert message.endswith(b'10=123|')
+    assert tagvalue.parse_fields(message, b'|')[-2] == (58, '8=FIX')
+    assert messages[4][1] == b'8=FIX.4.4|35=0|\n'
+    ranges = tagvalue.split_ranges(len(LOG), 7)
+    assert [message for start, end in ranges for message in tagvalue.iter_messages(LOG, b'|', start, end)] == messages
+
+
+def test_validator(orchestration_file):
+    validator = Validator(Orchestration(orchestration_file))
+    messages = [tagvalue.parse_fields(message, b'|') for offset, message in tagvalue.iter_messages(LOG, b'|')]
+    assert validator.validate(messages[0]) == ('D', [])
+    assert validator.validate(messages[1]) == ('D', [(INVALID_VALUE, 54, '7'), (INVALID_VALUE, 18, '3'), (UNKNOWN_TAG, 999, '1'), (UNKNOWN_TAG, 58, '8=FIX')])
+    assert validator.validate(messages[2]) == ('0', [(TAG_NOT_IN_MESSAGE, 11, 'x')])
+    assert (UNKNOWN_MSG_TYPE, 35, 'Z') in validator.validate(messages[3])[1]
+    assert validator.validate(messages[4]) == ('0', [(MISSING_REQUIRED, 10, None)])
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_validate_logs(orchestration_file, log_file, jobs):
+    orchestration = Orchestration(orchestration_file)
+    results = list(validate_logs(orchestration, [log_file], b'|', jobs))
+    assert sum(result[1] for result in results) == 5
+    assert [invalid[0] for result in results for invalid in result[3]] == [offset for offset, message in tagvalue.iter_messages(LOG, b'|')][1:]